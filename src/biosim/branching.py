@@ -0,0 +1,157 @@
+"""
+Branching simulations from a shared state
+
+Many experiments share a long burn-in and only differ afterwards. With
+:meth:`biosim.simulation.BioSim.branch` the burn-in is simulated once,
+then one process per branch is forked from it. The forked processes
+share the island copy-on-write, so starting a branch costs neither a
+new burn-in nor a copy of the animals. Each branch is reseeded, can be
+changed by a user function, for example new parameters or added
+animals, and continues on its own. The yearly herbivore and carnivore
+counts of all branches are written into one shared NumPy array.
+
+Where processes cannot be forked, the branches are run one after the
+other on deep copies of the simulation instead.
+
+Example
+--------
+::
+
+    sim = BioSim(geogr, ini_herbs, seed=1, vis_years=0)
+    sim.simulate(100)
+
+    def add_carnivores(branch, index):
+        branch.add_population(ini_carns)
+        branch.set_animal_parameters('Carnivore', {'F': 10 + 10 * index})
+
+    counts = sim.branch(4, years=200, modify=add_carnivores)   # shape (4, 200, 2)
+
+"""
+
+from biosim.ensemble import _simulate_counts
+from biosim import checkpoint
+
+from multiprocessing import connection, shared_memory, resource_tracker
+import multiprocessing as mp
+import numpy as np
+import copy
+import os
+
+# The simulation branches are forked from, inherited by the forked processes
+_parent = {}
+
+
+def _run_branch(shm_name, shape, index, seed, modify):
+    """
+    Continues the inherited simulation as one branch in a forked process
+
+    :param shm_name: name of the shared memory block receiving the counts
+    :param shape: shape of the result array
+    :param index: number of the branch
+    :param seed: seed of the branch
+    :param modify: function called as modify(sim, index) before continuing, or None
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        counts = np.ndarray(shape, dtype=np.int64, buffer=shm.buf)
+        _continue(_parent['sim'], index, seed, modify, counts[index])
+    finally:
+        shm.close()
+
+
+def _continue(sim, index, seed, modify, out):
+    """
+    Reseeds and modifies a simulation, then simulates it and stores the counts
+
+    :param sim: BioSim instance the branch may change
+    :param index: number of the branch
+    :param seed: seed of the branch
+    :param modify: function called as modify(sim, index) before continuing, or None
+    :param out: array of shape (years, 2) receiving the counts
+    """
+    sim._engine.reseed(seed)
+    if modify is not None:
+        modify(sim, index)
+    _simulate_counts(sim._engine, out.shape[0], out)
+
+
+def can_fork():
+    """
+    True if branches can be forked from the running process
+    """
+    return 'fork' in mp.get_all_start_methods()
+
+
+def branch(sim, n, years, seeds=None, modify=None, workers=None):
+    """
+    Continues a simulation as several independent branches
+
+    :param sim: BioSim instance holding the shared state, it is not changed
+    :param n: number of branches
+    :param years: number of years to simulate in each branch
+    :param seeds: one seed per branch, defaults to 0, 1, ..., n - 1
+    :param modify: function called as modify(branch, index) on each branch before it
+                   continues, where branch is the BioSim of the branch
+    :param workers: number of branches running at the same time, defaults to the number of CPUs
+    :return: array of shape (n, years, 2) with herbivore and carnivore counts per year
+    """
+    seeds = list(range(n)) if seeds is None else list(seeds)
+    if len(seeds) != n:
+        raise ValueError(f'Expected {n} seeds, got {len(seeds)}')
+    shape = (n, years, 2)
+
+    if not can_fork():
+        return _branch_sequential(sim, seeds, modify, shape)
+
+    workers = workers or os.cpu_count() or 1
+    context = mp.get_context('fork')
+    size = max(1, int(np.prod(shape)) * np.dtype(np.int64).itemsize)
+    # Forked processes must share the parent's tracker, otherwise they unlink the results at exit
+    resource_tracker.ensure_running()
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    _parent['sim'] = sim
+    running = {}
+    try:
+        # Keep workers branches in flight, starting the next one whenever one exits
+        started = 0
+        while started < n or running:
+            while started < n and len(running) < workers:
+                process = context.Process(target=_run_branch,
+                                          args=(shm.name, shape, started, seeds[started], modify))
+                process.start()
+                running[process.sentinel] = (started, process)
+                started += 1
+            for sentinel in connection.wait(list(running)):
+                index, process = running.pop(sentinel)
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f'Branch {index} failed, exit code {process.exitcode}')
+        counts = np.ndarray(shape, dtype=np.int64, buffer=shm.buf).copy()
+    finally:
+        for _, process in running.values():
+            process.terminate()
+            process.join()
+        _parent.clear()
+        shm.close()
+        shm.unlink()
+    return counts
+
+
+def _branch_sequential(sim, seeds, modify, shape):
+    """
+    Runs the branches one after the other on copies of the simulation
+
+    Parameters and random state changed by a branch are restored afterwards,
+    as they would be in a forked process.
+    """
+    counts = np.zeros(shape, dtype=np.int64)
+    params = checkpoint.get_parameters()
+    rng_state = sim._engine.get_rng_state()
+    try:
+        for index, seed in enumerate(seeds):
+            _continue(copy.deepcopy(sim), index, seed, modify, counts[index])
+            checkpoint.set_parameters(params)
+    finally:
+        checkpoint.set_parameters(params)
+        sim._engine.set_rng_state(rng_state)
+    return counts
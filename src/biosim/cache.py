@@ -0,0 +1,132 @@
+"""
+Result cache for biosim
+
+Simulations are deterministic given their starting state, so a run that
+was done before does not have to be done again. :class:`ResultCache`
+stores results in a directory under a key computed from everything the
+result depends on: the island state the run starts from (or the map and
+initial population), the state of the random number generator or the
+seed, all parameters, the number of years, the engine and the package
+version. Any change in one of them gives a new key.
+
+The cache has a size limit. When it is exceeded, the entries used least
+recently are removed.
+
+A cache is used by :class:`biosim.simulation.BioSim` (argument
+``cache``) when visualization is off, and by
+:class:`biosim.ensemble.Ensemble` for each seed.
+
+Example
+--------
+::
+
+    cache = ResultCache('results/cache', max_bytes=2**30)
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0, log_file='counts.csv', cache=cache)
+    sim.simulate(300)    # simulated once, later runs restore the result and write the log
+
+"""
+
+from biosim import checkpoint
+import biosim
+
+import numpy as np
+import hashlib
+import json
+import os
+
+_SUFFIX = '.npz'
+
+
+class ResultCache:
+    """
+    Directory of results stored under a hash of their inputs
+    """
+    def __init__(self, path, max_bytes=2**30):
+        """
+        Opens a cache directory, creating it if needed
+
+        :param path: directory of the cache
+        :param max_bytes: largest total size of the cached files
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(columns=None, **inputs):
+        """
+        Returns the key of a result
+
+        :param columns: dictionary of NumPy arrays the result depends on, e.g. the starting state
+        :param inputs: further inputs that can be stored as JSON, e.g. parameters and seed
+        :return: hexadecimal string
+        """
+        digest = hashlib.sha256()
+        inputs = dict(inputs, biosim_version=biosim.__version__)
+        digest.update(json.dumps(inputs, sort_keys=True).encode())
+        for name in sorted(columns or {}):
+            array = np.ascontiguousarray(columns[name])
+            digest.update(f'{name}:{array.dtype.str}:{array.shape}'.encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + _SUFFIX)
+
+    def get(self, key):
+        """
+        Returns a cached result, or None if there is none
+
+        :param key: key returned by :meth:`key`
+        :return: dictionary of arrays and description, as stored by :meth:`put`
+        """
+        name = self._file(key)
+        try:
+            result = checkpoint.read(name)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The modification time marks when an entry was last used
+        os.utime(name)
+        return result
+
+    def put(self, key, columns, meta=None):
+        """
+        Stores a result, then removes the least recently used entries if the cache is too large
+
+        :param key: key returned by :meth:`key`
+        :param columns: dictionary of NumPy arrays
+        :param meta: dictionary that can be stored as JSON
+        """
+        checkpoint.write(self._file(key), columns, meta or {})
+        self._evict(keep=self._file(key))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(_SUFFIX):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(self.path, name)))
+        return sorted(entries)
+
+    def size(self):
+        """
+        Total size of the cached files in bytes
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name != keep:
+                os.remove(name)
+                total -= size
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        for _, _, name in self._entries():
+            os.remove(name)
@@ -0,0 +1,89 @@
+"""
+Checkpoint files for biosim
+
+A checkpoint holds everything needed to continue a simulation exactly
+where it stopped: the animals of each species as binary NumPy columns,
+the fodder of each cell, the year, the state of the random number
+generator, all animal and landscape parameters and the settings BioSim
+was created with. The columns and a JSON description are stored
+together in one ``.npz`` file, see :func:`write`.
+
+Checkpoints are normally written and read through
+:meth:`biosim.simulation.BioSim.save_checkpoint` and
+:meth:`biosim.simulation.BioSim.load_checkpoint`.
+"""
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.landscapes import Lowland, Highland, Dessert, Water
+
+import numpy as np
+import json
+import os
+
+FORMAT_VERSION = 1
+
+PARAM_CLASSES = {'Herbivore': Herbivore, 'Carnivore': Carnivore,
+                 'L': Lowland, 'H': Highland, 'D': Dessert, 'W': Water}
+
+
+def get_parameters():
+    """
+    Returns a copy of the parameters of all animal and landscape classes
+    """
+    return {name: dict(cls.params) for name, cls in PARAM_CLASSES.items()}
+
+
+def set_parameters(params):
+    """
+    Replaces the parameters of all animal and landscape classes
+
+    :param params: dictionary as returned by :func:`get_parameters`
+    """
+    for name, values in params.items():
+        PARAM_CLASSES[name].params.update(values)
+
+
+def population_to_json(population):
+    """
+    Returns a population list with locations as lists, so it can be stored as JSON
+    """
+    return [{'loc': list(d['loc']), 'pop': d['pop']} for d in population]
+
+
+def population_from_json(population):
+    """
+    Returns a population list read from JSON with locations as tuples again
+    """
+    return [{'loc': tuple(d['loc']), 'pop': d['pop']} for d in population]
+
+
+def write(path, columns, meta):
+    """
+    Writes columns and a description to a checkpoint file
+
+    The file is first written next to path and then moved in place,
+    so an interrupted write never leaves a broken checkpoint.
+
+    :param path: name of the checkpoint file
+    :param columns: dictionary of NumPy arrays
+    :param meta: dictionary that can be stored as JSON
+    """
+    meta = dict(meta, format_version=FORMAT_VERSION)
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, meta=np.array(json.dumps(meta)), **columns)
+    os.replace(path + '.tmp', path)
+
+
+def read(path):
+    """
+    Reads a checkpoint file
+
+    :param path: name of the checkpoint file
+    :return: dictionary of columns and the description
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        columns = {key: data[key] for key in data.files if key != 'meta'}
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f'{path} is not a biosim checkpoint of version {FORMAT_VERSION}')
+    return columns, meta
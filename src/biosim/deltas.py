@@ -0,0 +1,320 @@
+"""
+Delta checkpoint streams for biosim
+
+Keeping the full island state of every year of a long run is expensive,
+but from one year to the next most of it hardly changes. A delta stream
+stores a full base record every ``base_every`` years and in between only
+what changed since the previous year:
+
+* the number of animals of each species in each cell, as the difference
+  to the previous counts
+* the ages and weights, cell by cell. Where a cell holds as many animals
+  of a species as the year before, the block is stored as the difference
+  to the previous block (ages) or as the XOR of the bit patterns
+  (weights), which is mostly zeros and compresses well. Other cells are
+  stored as they are.
+* the fodder, as the XOR of the bit patterns
+
+Each record is one file in the stream directory, compressed with
+:mod:`zlib` or :mod:`lzma`. :class:`DeltaReader` rebuilds any year by
+replaying the deltas from the nearest base before it.
+
+Before storing, the bytes of every array are grouped by significance,
+so the high bytes that neighbouring values share compress well.
+
+In the stored state the animals of each species are sorted by cell, and
+within each cell by age and weight. The rebuilt state holds the same
+animals as the engine did, so it can be analysed or loaded into an
+engine with ``import_columns``, but the order within a cell is not the
+engine's, so a run continued from it does not repeat the original
+draw for draw. Use :mod:`biosim.checkpoint` for that.
+
+Example
+--------
+::
+
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0)
+    sim.record_history('results/history', base_every=100)
+    sim.simulate(1000)
+
+    history = DeltaReader('results/history')
+    columns = history.read(537)
+    weights = columns['Herbivore_weight']
+
+"""
+
+import numpy as np
+import json
+import zlib
+import lzma
+import io
+import os
+
+FORMAT_VERSION = 1
+SPECIES = ('Herbivore', 'Carnivore')
+_MANIFEST = 'stream.json'
+_COMPRESSORS = {'zlib': (zlib.compress, zlib.decompress),
+                'lzma': (lzma.compress, lzma.decompress)}
+
+
+def _sorted_columns(columns, num_cells):
+    """
+    Returns the columns with each species sorted by cell, age and weight, and the per-cell counts
+
+    :param columns: dictionary as returned by Engine.export_columns
+    :param num_cells: number of cells of the island
+    """
+    state = {'fodder': np.asarray(columns['fodder'], dtype=np.float64)}
+    for species in SPECIES:
+        cell = np.asarray(columns[species + '_cell'], dtype=np.int64)
+        age = np.asarray(columns[species + '_age'], dtype=np.int64)
+        weight = np.asarray(columns[species + '_weight'], dtype=np.float64)
+        order = np.lexsort((weight, age, cell))
+        state[species + '_cell'] = cell[order]
+        state[species + '_age'] = age[order]
+        state[species + '_weight'] = weight[order]
+        state[species + '_counts'] = np.bincount(cell, minlength=num_cells)
+    return state
+
+
+def _unchanged_blocks(counts, previous_counts):
+    """
+    Positions of the animals in cells whose count did not change, now and the year before
+
+    :param counts: animals per cell this year
+    :param previous_counts: animals per cell the year before
+    :return: index arrays into this year's and the previous year's columns
+    """
+    same = np.flatnonzero((counts == previous_counts) & (counts > 0))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[same]
+    previous_starts = np.concatenate(([0], np.cumsum(previous_counts)[:-1]))[same]
+    lengths = counts[same]
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + within, np.repeat(previous_starts, lengths) + within
+
+
+def _shuffle(array):
+    """
+    Groups the bytes of a 1D array by significance, so equal high bytes compress well
+
+    :return: uint8 array of shape (itemsize, length)
+    """
+    return np.ascontiguousarray(array.view(np.uint8).reshape(-1, array.itemsize).T)
+
+
+def _unshuffle(planes, dtype):
+    """
+    Reverses _shuffle
+
+    :param planes: uint8 array returned by _shuffle
+    :param dtype: dtype of the original array
+    """
+    return np.ascontiguousarray(planes.T).view(dtype).ravel()
+
+
+def _float_bits(array):
+    return array.view(np.uint64)
+
+
+def encode_delta(state, previous):
+    """
+    Returns the arrays stored for one year given the year before
+
+    :param state: sorted columns and counts of this year, see _sorted_columns
+    :param previous: the same for the previous stored year
+    """
+    delta = {'fodder': _float_bits(state['fodder']) ^ _float_bits(previous['fodder'])}
+    for species in SPECIES:
+        counts = state[species + '_counts']
+        now, before = _unchanged_blocks(counts, previous[species + '_counts'])
+        delta[species + '_counts'] = counts - previous[species + '_counts']
+
+        age = state[species + '_age'].copy()
+        age[now] -= previous[species + '_age'][before]
+        delta[species + '_age'] = age
+
+        weight = _float_bits(state[species + '_weight']).copy()
+        weight[now] ^= _float_bits(previous[species + '_weight'])[before]
+        delta[species + '_weight'] = weight
+    return delta
+
+
+def decode_delta(delta, previous):
+    """
+    Rebuilds the state of one year from its delta and the year before
+
+    :param delta: arrays returned by encode_delta
+    :param previous: sorted columns and counts of the previous stored year
+    """
+    state = {'fodder': (delta['fodder'] ^ _float_bits(previous['fodder'])).view(np.float64)}
+    for species in SPECIES:
+        counts = previous[species + '_counts'] + delta[species + '_counts']
+        now, before = _unchanged_blocks(counts, previous[species + '_counts'])
+        state[species + '_counts'] = counts
+        state[species + '_cell'] = np.repeat(np.arange(len(counts)), counts)
+
+        age = delta[species + '_age'].copy()
+        age[now] += previous[species + '_age'][before]
+        state[species + '_age'] = age
+
+        weight = delta[species + '_weight'].copy()
+        weight[now] ^= _float_bits(previous[species + '_weight'])[before]
+        state[species + '_weight'] = weight.view(np.float64)
+    return state
+
+
+def _columns(state):
+    """
+    Returns the columns of a state in the form Engine.import_columns takes
+    """
+    return {key: value for key, value in state.items() if not key.endswith('_counts')}
+
+
+class DeltaWriter:
+    """
+    Appends the island state of each year to a delta stream
+    """
+    def __init__(self, path, island_map, base_every=50, compression='zlib'):
+        """
+        Opens a stream directory, creating it if needed
+
+        A writer always starts with a base record, so a stream can be
+        continued by a new writer after the previous one is gone.
+
+        :param path: directory of the stream
+        :param island_map: the island map as a multiline string
+        :param base_every: number of records from one base record to the next
+        :param compression: 'zlib' or 'lzma'
+        """
+        if compression not in _COMPRESSORS:
+            raise ValueError(f'Unknown compression {compression}, '
+                             f'choose one of {list(_COMPRESSORS)}')
+        if base_every < 1:
+            raise ValueError('base_every must be at least 1')
+        self.path = path
+        self.base_every = base_every
+        self.compression = compression
+        self._compress = _COMPRESSORS[compression][0]
+        lines = island_map.splitlines()
+        self._num_cells = len(lines) * len(lines[0])
+        self._previous = None
+        self._previous_year = None
+        self._since_base = 0
+
+        os.makedirs(path, exist_ok=True)
+        manifest = os.path.join(path, _MANIFEST)
+        meta = {'format_version': FORMAT_VERSION, 'island_map': island_map,
+                'compression': compression}
+        if os.path.exists(manifest):
+            with open(manifest) as file:
+                stored = json.load(file)
+            if stored != meta:
+                raise ValueError(f'{path} holds a stream of another island or format')
+        else:
+            with open(manifest, 'w') as file:
+                json.dump(meta, file)
+
+    def write(self, year, columns):
+        """
+        Stores the state of one year
+
+        :param year: the year, larger than the year written before
+        :param columns: dictionary as returned by Engine.export_columns
+        """
+        if self._previous_year is not None and year <= self._previous_year:
+            raise ValueError(f'Year {year} is not after {self._previous_year}')
+        state = _sorted_columns(columns, self._num_cells)
+        if self._previous is None or self._since_base >= self.base_every:
+            kind, arrays = 'base', {key: value for key, value in state.items()
+                                    if not key.endswith('_cell')}
+            self._since_base = 0
+        else:
+            kind, arrays = 'delta', encode_delta(state, self._previous)
+
+        meta = {'previous_year': self._previous_year,
+                'dtypes': {key: value.dtype.str for key, value in arrays.items()}}
+        buffer = io.BytesIO()
+        np.savez(buffer, meta=np.array(json.dumps(meta)),
+                 **{key: _shuffle(value) for key, value in arrays.items()})
+        name = os.path.join(self.path, f'{year:06d}.{kind}')
+        with open(name + '.tmp', 'wb') as file:
+            file.write(self._compress(buffer.getvalue()))
+        os.replace(name + '.tmp', name)
+
+        self._previous = state
+        self._previous_year = year
+        self._since_base += 1
+
+
+class DeltaReader:
+    """
+    Rebuilds the island state of any stored year of a delta stream
+
+    self.island_map: the island map as a multiline string
+
+    self.years: all stored years, in order
+
+    self.base_years: the years stored as full base records
+    """
+    def __init__(self, path):
+        """
+        Opens a stream directory written by DeltaWriter
+
+        :param path: directory of the stream
+        """
+        self.path = path
+        with open(os.path.join(path, _MANIFEST)) as file:
+            meta = json.load(file)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a biosim delta stream of version {FORMAT_VERSION}')
+        self.island_map = meta['island_map']
+        self._decompress = _COMPRESSORS[meta['compression']][1]
+        lines = self.island_map.splitlines()
+        self._num_cells = len(lines) * len(lines[0])
+
+        self._kind = {}
+        for name in os.listdir(path):
+            year, _, kind = name.partition('.')
+            if kind in ('base', 'delta'):
+                self._kind[int(year)] = kind
+        self.years = sorted(self._kind)
+        self.base_years = [year for year in self.years if self._kind[year] == 'base']
+        self._cache = None
+
+    def _load(self, year):
+        with open(os.path.join(self.path, f'{year:06d}.{self._kind[year]}'), 'rb') as file:
+            data = self._decompress(file.read())
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            return meta['previous_year'], {key: _unshuffle(arrays[key], dtype)
+                                           for key, dtype in meta['dtypes'].items()}
+
+    def read(self, year):
+        """
+        Rebuilds the state of one year
+
+        Reading the years in order only applies one delta per year.
+
+        :param year: a stored year
+        :return: dictionary of columns in the form Engine.import_columns takes,
+                 each species sorted by cell
+        """
+        if year not in self._kind:
+            raise KeyError(f'Year {year} is not in the stream')
+        base = max(y for y in self.base_years if y <= year)
+        if self._cache is not None and base <= self._cache[0] <= year:
+            start, state = self._cache
+        else:
+            start, state = base, self._load(base)[1]
+            for species in SPECIES:
+                counts = state[species + '_counts']
+                state[species + '_cell'] = np.repeat(np.arange(len(counts)), counts)
+
+        for following in self.years[self.years.index(start) + 1:self.years.index(year) + 1]:
+            previous_year, delta = self._load(following)
+            if previous_year != start:
+                raise ValueError(f'Delta of year {following} does not follow year {start}')
+            state = decode_delta(delta, state)
+            start = following
+        self._cache = (year, state)
+        return _columns(state)
@@ -0,0 +1,152 @@
+"""
+Density recorder for biosim
+
+Records the number of animals of each species in each cell, and if
+asked for also the mean weight per cell and species and the fodder of
+each cell, every ``stride`` years. The grids are collected into arrays
+of shape ``(years, rows, columns, species)`` and written in compressed
+chunks of ``chunk_years`` records, so long runs can be recorded without
+keeping all grids in memory and without visualization.
+
+Example
+--------
+::
+
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0)
+    sim.record_density('results/density', stride=5, weight=True, fodder=True)
+    sim.simulate(500)
+
+    data = read_density('results/density')
+    data['years']                    # (100,)
+    data['density'][..., 0]          # herbivores, (100, rows, columns)
+    data['weight'][..., 1]           # mean carnivore weight, NaN in empty cells
+
+"""
+
+import numpy as np
+import json
+import os
+
+SPECIES = ('Herbivore', 'Carnivore')
+_META = 'density.json'
+
+
+def density_grids(engine):
+    """
+    Per-cell counts and mean weights of each species and the fodder of each cell
+
+    :param engine: engine holding the island, see :mod:`biosim.engines`
+    :return: counts (rows, columns, species), mean weights (rows, columns, species)
+             with NaN where there are no animals, fodder (rows, columns)
+    """
+    columns = engine.export_columns()
+    lines = engine.string_map.splitlines()
+    shape = (len(lines), len(lines[0]))
+    num_cells = shape[0] * shape[1]
+    counts = np.empty((num_cells, len(SPECIES)), dtype=np.int64)
+    weights = np.empty((num_cells, len(SPECIES)))
+    for index, species in enumerate(SPECIES):
+        cell = columns[species + '_cell']
+        counts[:, index] = np.bincount(cell, minlength=num_cells)
+        total = np.bincount(cell, weights=columns[species + '_weight'], minlength=num_cells)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights[:, index] = total / counts[:, index]
+    fodder = np.asarray(columns['fodder'], dtype=np.float64)
+    return (counts.reshape(shape + (len(SPECIES),)), weights.reshape(shape + (len(SPECIES),)),
+            fodder.reshape(shape))
+
+
+class DensityRecorder:
+    """
+    Writes per-cell density grids every stride years to compressed chunks
+    """
+    def __init__(self, path, island_map, stride=1, weight=False, fodder=False, chunk_years=32):
+        """
+        Creates the recording directory
+
+        :param path: directory the chunks are written to, replaced if it holds a recording
+        :param island_map: the island map as a multiline string
+        :param stride: number of years between recorded grids
+        :param weight: if True, also record the mean weight per cell and species
+        :param fodder: if True, also record the fodder of each cell
+        :param chunk_years: number of recorded years per chunk file
+        """
+        if stride < 1:
+            raise ValueError('stride must be at least 1')
+        self.path = path
+        self.stride = stride
+        self.weight = weight
+        self.fodder = fodder
+        self.chunk_years = chunk_years
+        self._records = {name: [] for name in self._names()}
+        self._chunk = 0
+
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('chunk_') and name.endswith('.npz'):
+                os.remove(os.path.join(path, name))
+        with open(os.path.join(path, _META), 'w') as file:
+            json.dump({'island_map': island_map, 'stride': stride, 'species': list(SPECIES),
+                       'weight': weight, 'fodder': fodder}, file)
+
+    def _names(self):
+        return ['years', 'density'] + ['weight'] * self.weight + ['fodder'] * self.fodder
+
+    def record(self, year, engine):
+        """
+        Records the grids of a year if it falls on the stride
+
+        :param year: the year
+        :param engine: engine holding the island, see :mod:`biosim.engines`
+        """
+        if year % self.stride != 0:
+            return
+        counts, weights, fodder = density_grids(engine)
+        grids = {'years': year, 'density': counts, 'weight': weights, 'fodder': fodder}
+        for name, records in self._records.items():
+            records.append(grids[name])
+        if len(self._records['years']) >= self.chunk_years:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the grids recorded since the last chunk as a new chunk
+        """
+        if not self._records['years']:
+            return
+        name = os.path.join(self.path, f'chunk_{self._chunk:05d}.npz')
+        with open(name + '.tmp', 'wb') as file:
+            np.savez_compressed(file, **{key: np.array(values)
+                                         for key, values in self._records.items()})
+        os.replace(name + '.tmp', name)
+        self._chunk += 1
+        self._records = {name: [] for name in self._names()}
+
+
+def read_density(path):
+    """
+    Reads all chunks of a density recording
+
+    :param path: directory written by DensityRecorder
+    :return: dictionary with 'years' and 'density', and 'weight' and 'fodder'
+             if they were recorded, each concatenated over all chunks, with no
+             years if no chunk was written
+    """
+    with open(os.path.join(path, _META)) as file:
+        meta = json.load(file)
+    lines = meta['island_map'].splitlines()
+    cells = (len(lines), len(lines[0]))
+    grids = cells + (len(meta['species']),)
+    data = {'years': [np.empty(0, dtype=np.int64)],
+            'density': [np.empty((0,) + grids, dtype=np.int64)]}
+    if meta.get('weight'):
+        data['weight'] = [np.empty((0,) + grids)]
+    if meta.get('fodder'):
+        data['fodder'] = [np.empty((0,) + cells)]
+    chunks = sorted(name for name in os.listdir(path)
+                    if name.startswith('chunk_') and name.endswith('.npz'))
+    for name in chunks:
+        with np.load(os.path.join(path, name)) as chunk:
+            for key in chunk.files:
+                data.setdefault(key, []).append(chunk[key])
+    return {key: np.concatenate(values) for key, values in data.items()}
@@ -0,0 +1,94 @@
+"""
+Per-year state digests for biosim
+
+A digest is a short hash of the island state that does not depend on the
+order animals are stored in: the animals of each species are sorted by
+cell, age and weight before hashing, and weights and fodder are rounded
+to a fixed number of decimals first, so rounding noise from doing the
+same arithmetic in another order does not change it.
+
+Recording a digest every year gives a series that identifies a run.
+Two runs, for example before and after an optimization or with two
+engines, are then compared year by year with :func:`first_divergence`
+instead of diffing whole logs, and the first year they differ is found
+at once.
+
+Example
+--------
+::
+
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0, log_file='run.csv', digests=True)
+    sim.simulate(100)     # digests also written to run_digest.csv
+
+    year = first_divergence(read_digests('run_digest.csv'),
+                            read_digests('other_digest.csv'))
+
+"""
+
+import numpy as np
+import hashlib
+import os
+
+SPECIES = ('Herbivore', 'Carnivore')
+
+
+def state_digest(columns, decimals=6):
+    """
+    Returns an order-independent hash of an island state
+
+    :param columns: dictionary as returned by Engine.export_columns
+    :param decimals: number of decimals weights and fodder are rounded to
+    :return: hexadecimal string
+    """
+    scale = 10.0 ** decimals
+    digest = hashlib.blake2b(digest_size=16)
+    fodder = np.round(np.asarray(columns['fodder'], dtype=np.float64) * scale).astype(np.int64)
+    digest.update(fodder.tobytes())
+    for species in SPECIES:
+        cell = np.asarray(columns[species + '_cell'], dtype=np.int64)
+        age = np.asarray(columns[species + '_age'], dtype=np.int64)
+        weight = np.round(np.asarray(columns[species + '_weight'], dtype=np.float64) * scale)
+        weight = weight.astype(np.int64)
+        order = np.lexsort((weight, age, cell))
+        digest.update(species.encode())
+        digest.update(np.bincount(cell, minlength=len(fodder)).tobytes())
+        digest.update(age[order].tobytes())
+        digest.update(weight[order].tobytes())
+    return digest.hexdigest()
+
+
+def digest_file_name(log_file):
+    """
+    Name of the digest file written next to a log file, e.g. run.csv -> run_digest.csv
+    """
+    base, extension = os.path.splitext(log_file)
+    return f'{base}_digest{extension or ".csv"}'
+
+
+def read_digests(path):
+    """
+    Reads a digest file written by BioSim
+
+    :param path: name of the digest file
+    :return: list of digests, one per year in the order of the file
+    """
+    with open(path) as file:
+        lines = file.read().splitlines()[1:]
+    return [line.split(',')[1] for line in lines if line]
+
+
+def first_divergence(digests, other):
+    """
+    Returns the position of the first year two digest series differ
+
+    :param digests: list of digests of one run
+    :param other: list of digests of another run
+    :return: index of the first differing year, the length of the shorter
+             series if one is a prefix of the other, or None if they are equal
+    """
+    for index, (first, second) in enumerate(zip(digests, other)):
+        if first != second:
+            return index
+    if len(digests) != len(other):
+        return min(len(digests), len(other))
+    return None
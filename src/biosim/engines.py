@@ -0,0 +1,581 @@
+"""
+Simulation engines for biosim
+
+An engine holds the island and its animals and knows how to advance them
+one year. :class:`biosim.simulation.BioSim` only talks to the engine
+through the interface defined by :class:`Engine`, so the way the animals
+are stored can be chosen per workload without changing driver scripts::
+
+    sim = BioSim(geogr, ini_pop, seed=1, engine='array')
+
+Engines shipped with the package
+
+* ``'reference'``: one object per animal, :class:`biosim.island_map.Map`
+* ``'array'``: NumPy columns, :class:`biosim.vectorized.ArrayIsland`
+* ``'jit'``: NumPy columns with Numba-compiled kernels, falls back to
+  ``'array'`` when Numba is not installed
+
+New engines subclass :class:`Engine` and are made available with
+:func:`register_engine`.
+"""
+
+from biosim.island_map import Map
+from biosim.vectorized import ArrayIsland, _fitness
+from biosim.animals import Herbivore, Carnivore
+from biosim.digest import state_digest
+from biosim.summaries import histograms, summarize
+
+import numpy as np
+import random as rd
+
+_engines = {}
+
+
+def _read_only(array):
+    """
+    Returns a view of an array that cannot be written through
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def register_engine(name, engine_class):
+    """
+    Makes an engine available under a name
+
+    :param name: name used for the engine argument of BioSim
+    :param engine_class: subclass of :class:`Engine`
+    """
+    _engines[name] = engine_class
+
+
+def engine_names():
+    """
+    Names of all registered engines
+    """
+    return list(_engines)
+
+
+def create_engine(name, island_map, seed=None):
+    """
+    Creates an engine by name
+
+    :param name: name the engine is registered under
+    :param island_map: a multiline string representing the map
+    :param seed: integer used as random number seed
+    """
+    if name not in _engines:
+        raise ValueError(f'Unknown engine {name}, choose one of {engine_names()}')
+    return _engines[name](island_map, seed)
+
+
+class Engine:
+    """
+    Interface all engines implement
+
+    self.string_map: the island map as a multiline string
+
+    self.record_events: if True, update_one_year counts births, deaths, kills and
+    migrants per species in self.events
+    """
+    record_events = False
+
+    def __init__(self, island_map, seed=None):
+        """
+        Stores the map, subclasses create the island from it
+
+        :param island_map: a multiline string representing the map
+        :param seed: integer used as random number seed
+        """
+        self.string_map = island_map
+        self.events = None
+
+    def reseed(self, seed):
+        """
+        Restarts the random number stream of the engine
+
+        :param seed: integer used as random number seed
+        """
+        raise NotImplementedError
+
+    def get_rng_state(self):
+        """
+        Returns the state of the random number stream, made of lists, numbers and dicts
+        """
+        raise NotImplementedError
+
+    def set_rng_state(self, state):
+        """
+        Restores a state returned by get_rng_state
+
+        :param state: the state to restore
+        """
+        raise NotImplementedError
+
+    def feeding(self):
+        raise NotImplementedError
+
+    def procreation(self):
+        raise NotImplementedError
+
+    def migration(self):
+        raise NotImplementedError
+
+    def aging(self):
+        raise NotImplementedError
+
+    def weight_loss(self):
+        raise NotImplementedError
+
+    def death(self):
+        raise NotImplementedError
+
+    def update_one_year(self):
+        """
+        Runs all phases of one year in order
+        """
+        if self.record_events:
+            self._update_recording_events()
+            return
+        self.feeding()
+        self.procreation()
+        self.migration()
+        self.aging()
+        self.weight_loss()
+        self.death()
+
+    def _update_recording_events(self):
+        """
+        Runs all phases of one year and counts what happened from the numbers between phases
+
+        Herbivores disappear during feeding only when they are killed, animals
+        are only born during procreation and only die of natural causes in death.
+        """
+        start = self.num_animals_per_species()
+        self.feeding()
+        fed = self.num_animals_per_species()
+        self.procreation()
+        born = self.num_animals_per_species()
+        self.migration()
+        migrants = self.migrants()
+        self.aging()
+        self.weight_loss()
+        self.death()
+        end = self.num_animals_per_species()
+        self.events = {species: {'births': born[species] - fed[species],
+                                 'deaths': born[species] - end[species],
+                                 'kills': start[species] - fed[species],
+                                 'migrants': migrants[species]}
+                       for species in start}
+
+    def migrants(self):
+        """
+        Number of animals per species that moved in the last migration, as dictionary
+        """
+        raise NotImplementedError
+
+    def add_population(self, population):
+        """
+        Adds population to the island
+
+        :param population: list of dictionaries containing location and list of animals
+        """
+        raise NotImplementedError
+
+    def export_population(self):
+        """
+        Returns the animals on the island in the same format add_population takes
+        """
+        raise NotImplementedError
+
+    def export_columns(self):
+        """
+        Returns the full island state as NumPy columns
+
+        For each species there are the arrays '<species>_cell', '<species>_age'
+        and '<species>_weight', where cell is the row-major index of the cell
+        counted from 0. The animals of a cell are in the order the engine
+        keeps them. 'fodder' holds the fodder of each cell.
+        """
+        raise NotImplementedError
+
+    def import_columns(self, columns):
+        """
+        Replaces the island state with columns returned by export_columns
+
+        :param columns: dictionary of arrays
+        """
+        raise NotImplementedError
+
+    def state_digest(self, decimals=6):
+        """
+        Hash of the island state that does not depend on the order animals are stored in
+
+        :param decimals: number of decimals weights and fodder are rounded to
+        :return: hexadecimal string, see :func:`biosim.digest.state_digest`
+        """
+        return state_digest(self.export_columns(), decimals)
+
+    def num_animals_per_species(self):
+        """
+        Number of animals per species, as dictionary
+        """
+        raise NotImplementedError
+
+    def cell_counts(self, species):
+        """
+        Number of animals of one species in each cell
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :return: dictionary with location as key and count as value
+        """
+        raise NotImplementedError
+
+    def count_grid(self, species):
+        """
+        Number of animals of one species in each cell, as an array shaped like the map
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :return: integer array (rows, columns), row 0 is the first line of the map
+        """
+        raise NotImplementedError
+
+    def age_weight_fitness(self):
+        """
+        Age, weight and fitness of all animals
+
+        :return: one dictionary for herbivores and one for carnivores, each
+                 with lists or arrays under 'age', 'weight' and 'fitness'
+        """
+        raise NotImplementedError
+
+    def population_columns(self, species):
+        """
+        All animals of one species as NumPy columns
+
+        Engines that store the animals in columns return read-only views of
+        them where possible, so the arrays must not be kept across years.
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :return: dictionary with arrays 'age', 'weight', 'fitness', 'row' and 'col',
+                 locations counted from 1 as in population lists
+        """
+        raise NotImplementedError
+
+    def summaries(self, hist_specs=None, region=None, relative_accuracy=0.01):
+        """
+        Histogram, moments and quantile sketch of age, weight and fitness of each species
+
+        Computed in one pass over the columns of each species, see :mod:`biosim.summaries`.
+
+        :param hist_specs: histogram specifications as taken by BioSim
+        :param region: iterable of locations counted from 1, only animals there are
+                       summarised, all animals if None
+        :param relative_accuracy: relative accuracy of the quantile sketches
+        :return: dictionary mapping species to a dictionary mapping attribute to Summary
+        """
+        return {species: summarize(columns, hist_specs, relative_accuracy, mask)
+                for species, columns, mask in self._region_columns(region)}
+
+    def histograms(self, hist_specs=None, region=None):
+        """
+        Histograms of age, weight and fitness of each species, as drawn by the visualization
+
+        Cheaper than :meth:`summaries` when only the bins are needed.
+
+        :param hist_specs: histogram specifications as taken by BioSim
+        :param region: iterable of locations counted from 1, only animals there are
+                       counted, all animals if None
+        :return: dictionary mapping species to a dictionary mapping attribute to Histogram
+        """
+        return {species: histograms(columns, hist_specs, mask)
+                for species, columns, mask in self._region_columns(region)}
+
+    def _region_columns(self, region):
+        """
+        Columns of each species with the mask of the animals in region, None for all
+        """
+        inside = None
+        if region is not None:
+            lines = self.string_map.splitlines()
+            inside = np.zeros((len(lines), len(lines[0])), dtype=bool)
+            for row, col in region:
+                inside[row - 1, col - 1] = True
+        for species in ('Herbivore', 'Carnivore'):
+            columns = self.population_columns(species)
+            mask = None if inside is None else inside[columns['row'] - 1, columns['col'] - 1]
+            yield species, columns, mask
+
+
+class ReferenceEngine(Engine):
+    """
+    Engine with one object per animal, using :class:`biosim.island_map.Map`
+
+    self.map: the Map object holding the island
+    """
+    def __init__(self, island_map, seed=None):
+        super().__init__(island_map, seed)
+        self.reseed(seed)
+        self.map = Map(island_map)
+        self.map.creating_map()
+        self._migrants = {'Herbivore': 0, 'Carnivore': 0}
+
+    def reseed(self, seed):
+        rd.seed(seed)
+
+    def get_rng_state(self):
+        version, internal_state, gauss_next = rd.getstate()
+        return [version, list(internal_state), gauss_next]
+
+    def set_rng_state(self, state):
+        version, internal_state, gauss_next = state
+        rd.setstate((version, tuple(internal_state), gauss_next))
+
+    def feeding(self):
+        self.map.island_feeding()
+
+    def procreation(self):
+        self.map.island_procreation()
+
+    def migration(self):
+        if not self.record_events:
+            self.map.island_migration()
+            return
+        before = self._animal_cells()
+        self.map.island_migration()
+        after = self._animal_cells()
+        self._migrants = {species: sum(1 for key, loc in after[species].items()
+                                       if before[species][key] != loc)
+                          for species in after}
+
+    def _animal_cells(self):
+        """
+        Location of every animal, by species and object id
+        """
+        cells = {'Herbivore': {}, 'Carnivore': {}}
+        for loc, cell in self.map.map_dict.items():
+            for animal in cell.population_herb:
+                cells['Herbivore'][id(animal)] = loc
+            for animal in cell.population_carn:
+                cells['Carnivore'][id(animal)] = loc
+        return cells
+
+    def migrants(self):
+        return self._migrants
+
+    def aging(self):
+        self.map.island_aging()
+
+    def weight_loss(self):
+        self.map.island_weight_loss()
+
+    def death(self):
+        self.map.island_death()
+
+    def add_population(self, population):
+        self.map.island_add_population(population)
+
+    def export_population(self):
+        population = []
+        for loc, cell in self.map.map_dict.items():
+            animals = ([{'species': 'Herbivore', 'age': a.age, 'weight': a.weight}
+                        for a in cell.population_herb] +
+                       [{'species': 'Carnivore', 'age': a.age, 'weight': a.weight}
+                        for a in cell.population_carn])
+            if animals:
+                population.append({'loc': loc, 'pop': animals})
+        return population
+
+    def export_columns(self):
+        columns = {}
+        cells = list(self.map.map_dict.values())
+        for species, attr in (('Herbivore', 'population_herb'), ('Carnivore', 'population_carn')):
+            animals = [(index, a) for index, cell in enumerate(cells) for a in getattr(cell, attr)]
+            columns[species + '_cell'] = np.array([index for index, _ in animals], dtype=np.int64)
+            columns[species + '_age'] = np.array([a.age for _, a in animals], dtype=np.int64)
+            columns[species + '_weight'] = np.array([a.weight for _, a in animals],
+                                                    dtype=np.float64)
+        columns['fodder'] = np.array([cell.fodder for cell in cells], dtype=np.float64)
+        return columns
+
+    def import_columns(self, columns):
+        cells = list(self.map.map_dict.values())
+        for cell, fodder in zip(cells, columns['fodder'].tolist()):
+            cell.fodder = fodder
+            cell.population_herb = []
+            cell.population_carn = []
+        for species, species_class in (('Herbivore', Herbivore), ('Carnivore', Carnivore)):
+            for index, age, weight in zip(columns[species + '_cell'].tolist(),
+                                          columns[species + '_age'].tolist(),
+                                          columns[species + '_weight'].tolist()):
+                animal = species_class(age, weight)
+                animal.calculate_fitness()
+                if species == 'Herbivore':
+                    cells[index].population_herb.append(animal)
+                else:
+                    cells[index].population_carn.append(animal)
+        for cell in cells:
+            cell.cell_sum_of_animals()
+
+    def num_animals_per_species(self):
+        self.map.island_total_herbivores_and_carnivores()
+        return {'Herbivore': self.map.island_total_herbivores,
+                'Carnivore': self.map.island_total_carnivores}
+
+    def cell_counts(self, species):
+        counts = {}
+        for loc, cell in self.map.map_dict.items():
+            if species == 'Herbivore':
+                counts[loc] = len(cell.population_herb)
+            else:
+                counts[loc] = len(cell.population_carn)
+        return counts
+
+    def count_grid(self, species):
+        # map_dict holds the cells in row-major order, see Map.creating_map
+        lines = self.string_map.splitlines()
+        attribute = 'population_herb' if species == 'Herbivore' else 'population_carn'
+        counts = np.fromiter((len(getattr(cell, attribute)) for cell in self.map.map_dict.values()),
+                             dtype=np.int64, count=len(self.map.map_dict))
+        return counts.reshape(len(lines), len(lines[0]))
+
+    def age_weight_fitness(self):
+        return tuple({key: columns[key] for key in ('age', 'weight', 'fitness')}
+                     for columns in (self.population_columns('Herbivore'),
+                                     self.population_columns('Carnivore')))
+
+    def population_columns(self, species):
+        attr = 'population_herb' if species == 'Herbivore' else 'population_carn'
+        locs = list(self.map.map_dict)
+        populations = [getattr(cell, attr) for cell in self.map.map_dict.values()]
+        animals = [animal for population in populations for animal in population]
+        lengths = [len(population) for population in populations]
+        num = len(animals)
+        age = np.fromiter((a.age for a in animals), np.int64, num)
+        weight = np.fromiter((a.weight for a in animals), np.float64, num)
+        # Animals keep the fitness last calculated, new ones have none yet
+        fitness = np.fromiter((a.fitness for a in animals), np.float64, num)
+        missing = np.isnan(fitness)
+        species_class = Herbivore if species == 'Herbivore' else Carnivore
+        fitness[missing] = _fitness(age[missing], weight[missing], species_class.params)
+        return {'age': age,
+                'weight': weight,
+                'fitness': fitness,
+                'row': np.repeat(np.array([loc[0] for loc in locs], dtype=np.int64), lengths),
+                'col': np.repeat(np.array([loc[1] for loc in locs], dtype=np.int64), lengths)}
+
+
+class ArrayEngine(Engine):
+    """
+    Engine storing the animals in NumPy columns, using :class:`biosim.vectorized.ArrayIsland`
+
+    self.island: the ArrayIsland object holding a single replicate
+    """
+    jit = False
+
+    def __init__(self, island_map, seed=None):
+        super().__init__(island_map, seed)
+        self.island = ArrayIsland(island_map, seeds=[seed], jit=self.jit)
+
+    def reseed(self, seed):
+        self.island.reseed(seeds=[seed])
+
+    def get_rng_state(self):
+        return self.island.get_rng_states()[0]
+
+    def set_rng_state(self, state):
+        self.island.set_rng_states([state])
+
+    def feeding(self):
+        self.island.feeding()
+
+    def procreation(self):
+        self.island.procreation()
+
+    def migration(self):
+        self.island.migration()
+
+    def migrants(self):
+        herb, carn = self.island.migrants[0]
+        return {'Herbivore': int(herb), 'Carnivore': int(carn)}
+
+    def aging(self):
+        self.island.aging()
+
+    def weight_loss(self):
+        self.island.weight_loss()
+
+    def death(self):
+        self.island.death()
+
+    def add_population(self, population):
+        self.island.add_population(population)
+
+    def _loc(self, cell):
+        row, col = divmod(int(cell), self.island.shape[1])
+        return row + 1, col + 1
+
+    def export_population(self):
+        population = {}
+        for species, pop in self.island.population.items():
+            for cell, age, weight in zip(pop['cell'], pop['age'], pop['weight']):
+                animal = {'species': species, 'age': int(age), 'weight': float(weight)}
+                population.setdefault(self._loc(cell), []).append(animal)
+        return [{'loc': loc, 'pop': animals} for loc, animals in population.items()]
+
+    def export_columns(self):
+        columns = {}
+        for species, pop in self.island.population.items():
+            for key in ('cell', 'age', 'weight'):
+                columns[f'{species}_{key}'] = pop[key].copy()
+        columns['fodder'] = self.island.fodder[0].copy()
+        return columns
+
+    def import_columns(self, columns):
+        for species, pop in self.island.population.items():
+            for key in ('cell', 'age', 'weight'):
+                pop[key] = np.asarray(columns[f'{species}_{key}'], dtype=pop[key].dtype)
+            pop['rep'] = np.zeros(len(pop['cell']), dtype=np.int64)
+        self.island.fodder[0] = columns['fodder']
+
+    def num_animals_per_species(self):
+        herb, carn = self.island.counts()[0]
+        return {'Herbivore': int(herb), 'Carnivore': int(carn)}
+
+    def cell_counts(self, species):
+        counts = self.island.cell_counts(species)[0].ravel()
+        return {self._loc(cell): int(count) for cell, count in enumerate(counts)}
+
+    def count_grid(self, species):
+        return self.island.cell_counts(species)[0]
+
+    def age_weight_fitness(self):
+        result = []
+        for species, species_class in (('Herbivore', Herbivore), ('Carnivore', Carnivore)):
+            pop = self.island.population[species]
+            result.append({'age': pop['age'], 'weight': pop['weight'],
+                           'fitness': _fitness(pop['age'], pop['weight'], species_class.params)})
+        return tuple(result)
+
+    def population_columns(self, species):
+        pop = self.island.population[species]
+        species_class = Herbivore if species == 'Herbivore' else Carnivore
+        row, col = np.divmod(pop['cell'], self.island.shape[1])
+        return {'age': _read_only(pop['age']),
+                'weight': _read_only(pop['weight']),
+                'fitness': _fitness(pop['age'], pop['weight'], species_class.params),
+                'row': row + 1,
+                'col': col + 1}
+
+
+class JitEngine(ArrayEngine):
+    """
+    Array engine running the phases through the Numba-compiled kernels in :mod:`biosim.kernels`
+    """
+    jit = True
+
+
+register_engine('reference', ReferenceEngine)
+register_engine('array', ArrayEngine)
+register_engine('jit', JitEngine)
@@ -0,0 +1,240 @@
+"""
+Ensemble runner for biosim
+
+Runs the same island and parameters under many seeds on a pool of
+worker processes. The island map is validated once and parsed once per
+worker, visualization is never set up, and the yearly herbivore and
+carnivore counts of every run are written straight into one shared
+NumPy array of shape ``(seeds, years, 2)``.
+
+Example
+--------
+::
+
+    from biosim import ensemble
+
+    counts = ensemble.run(geogr, ini_herbs, {'Herbivore': {'zeta': 3.2}},
+                          seeds=range(100), years=300, workers=4)
+    mean_herbivores = counts[:, :, 0].mean(axis=0)
+
+"""
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.landscapes import Lowland, Highland
+from biosim.engines import create_engine
+from biosim.cache import ResultCache
+from biosim import checkpoint
+
+from multiprocessing import shared_memory, resource_tracker
+import multiprocessing as mp
+import numpy as np
+import random as rd
+import textwrap3
+import pickle
+
+_ANIMAL_SPECIES = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+_LANDSCAPE_TYPES = {'L': Lowland, 'H': Highland}
+
+_worker = {}
+
+
+def _apply_parameters(params):
+    """
+    Sets animal and landscape parameters in the current process
+
+    :param params: dictionary mapping species names and landscape codes to parameter dicts,
+                   e.g. {'Herbivore': {'zeta': 3.2}, 'L': {'f_max': 700}}
+    """
+    if params is None:
+        return
+    for name, values in params.items():
+        if name in _ANIMAL_SPECIES:
+            _ANIMAL_SPECIES[name]().set_params(values)
+        elif name in _LANDSCAPE_TYPES:
+            _LANDSCAPE_TYPES[name]().cell_set_params(values)
+        else:
+            raise KeyError(f'cannot assign parameters to {name}')
+
+
+def _merged_parameters(params):
+    """
+    Returns all parameters a worker runs with, the current ones updated by params
+    """
+    merged = checkpoint.get_parameters()
+    for name, values in (params or {}).items():
+        merged[name].update(values)
+    return merged
+
+
+def _parse_map(island_map, engine='reference'):
+    """
+    Validates the island map and returns an empty engine pickled, ready to be copied for each run
+
+    :param island_map: multi-line string specifying island geography
+    :param engine: name of the engine simulating the island
+    """
+    # Creating an engine seeds it, which must not touch the random state of the caller
+    state = rd.getstate()
+    engine_bytes = pickle.dumps(create_engine(engine, textwrap3.dedent(island_map)))
+    rd.setstate(state)
+    return engine_bytes
+
+
+def _init_worker(engine_bytes, ini_pop, params):
+    """
+    Prepares a worker process, runs once per worker
+
+    :param engine_bytes: the pickled engine holding the parsed island map
+    :param ini_pop: list of dictionaries specifying initial population
+    :param params: parameters applied to the worker before any run
+    """
+    _apply_parameters(params)
+    _worker['engine'] = engine_bytes
+    _worker['ini_pop'] = ini_pop
+    _worker['shm'] = None
+
+
+def _result_array(shm_name, shape):
+    """
+    Returns the shared result array, attaching to the shared memory block if needed
+
+    :param shm_name: name of the shared memory block
+    :param shape: shape of the result array
+    """
+    shm = _worker['shm']
+    if shm is None or shm.name != shm_name:
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _worker['shm'] = shm
+    return np.ndarray(shape, dtype=np.int64, buffer=shm.buf)
+
+
+def _simulate_counts(engine, num_years, out):
+    """
+    Simulates the island and stores herbivore and carnivore counts for each year
+
+    :param engine: engine with population already added
+    :param num_years: number of years to simulate
+    :param out: array of shape (num_years, 2) receiving the counts
+    """
+    for year in range(num_years):
+        engine.update_one_year()
+        out[year] = list(engine.num_animals_per_species().values())
+
+
+def _run_replicate(task):
+    """
+    Runs one seed of the ensemble in a worker process
+
+    :param task: tuple of shared memory name, result shape, row index and seed
+    """
+    shm_name, shape, index, seed = task
+    counts = _result_array(shm_name, shape)
+    engine = pickle.loads(_worker['engine'])
+    engine.reseed(seed)
+    engine.add_population(_worker['ini_pop'])
+    _simulate_counts(engine, shape[1], counts[index])
+
+
+class Ensemble:
+    """
+    Warm pool of worker processes running one scenario under many seeds
+    """
+    def __init__(self, island_map, ini_pop, params=None, workers=None, engine='reference',
+                 cache=None):
+        """
+        Validates the map and starts the worker pool
+
+        :param island_map: multi-line string specifying island geography
+        :param ini_pop: list of dictionaries specifying initial population
+        :param params: dictionary mapping species names and landscape codes to parameter dicts
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param engine: name of the engine simulating the island, see :mod:`biosim.engines`
+        :param cache: ResultCache or path of a cache directory, seeds found there are
+                      not simulated again, see :mod:`biosim.cache`
+        """
+        engine_bytes = _parse_map(island_map, engine)
+        if isinstance(cache, str):
+            cache = ResultCache(cache)
+        self.cache = cache
+        self._scenario = {'island_map': textwrap3.dedent(island_map),
+                          'ini_pop': checkpoint.population_to_json(ini_pop),
+                          'params': _merged_parameters(params),
+                          'engine': engine}
+        # Workers must share the parent's tracker, otherwise they unlink the results at exit
+        resource_tracker.ensure_running()
+        self._pool = mp.Pool(workers, initializer=_init_worker,
+                             initargs=(engine_bytes, ini_pop, params))
+
+    def run(self, seeds, years):
+        """
+        Simulates the scenario once for each seed
+
+        :param seeds: iterable of integer seeds
+        :param years: number of years to simulate for each seed
+        :return: array of shape (seeds, years, 2) with herbivore and carnivore counts per year
+        """
+        if self._pool is None:
+            raise RuntimeError('Ensemble has been closed')
+        seeds = list(seeds)
+        shape = (len(seeds), years, 2)
+        keys = [None] * len(seeds)
+        cached = {}
+        if self.cache is not None:
+            keys = [self.cache.key(seed=seed, num_years=years, **self._scenario) for seed in seeds]
+            for index, key in enumerate(keys):
+                result = self.cache.get(key)
+                if result is not None:
+                    cached[index] = result[0]['counts']
+
+        size = max(1, int(np.prod(shape)) * np.dtype(np.int64).itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            tasks = [(shm.name, shape, index, seed) for index, seed in enumerate(seeds)
+                     if index not in cached]
+            self._pool.map(_run_replicate, tasks, chunksize=1)
+            counts = np.ndarray(shape, dtype=np.int64, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        for index, seed in enumerate(seeds):
+            if index in cached:
+                counts[index] = cached[index]
+            elif self.cache is not None:
+                self.cache.put(keys[index], {'counts': counts[index]})
+        return counts
+
+    def close(self):
+        """
+        Shuts down the worker pool
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run(island_map, ini_pop, params, seeds, years, workers=None, engine='reference', cache=None):
+    """
+    Simulates one scenario under many seeds on a process pool
+
+    :param island_map: multi-line string specifying island geography
+    :param ini_pop: list of dictionaries specifying initial population
+    :param params: dictionary mapping species names and landscape codes to parameter dicts
+    :param seeds: iterable of integer seeds
+    :param years: number of years to simulate for each seed
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param engine: name of the engine simulating the island, see :mod:`biosim.engines`
+    :param cache: ResultCache or path of a cache directory, see :mod:`biosim.cache`
+    :return: array of shape (seeds, years, 2) with herbivore and carnivore counts per year
+    """
+    with Ensemble(island_map, ini_pop, params, workers, engine, cache) as ensemble:
+        return ensemble.run(seeds, years)
@@ -0,0 +1,282 @@
+"""
+Recording of frame data and rendering of the frames afterwards
+
+Instead of drawing while it simulates, a simulation can record the
+frame data of every image year, see :func:`biosim.visualization.frame_data`:
+the count matrix of each species, the histogram bins of age, weight and
+fitness and the animal totals. The data is small and written in
+compressed chunks. :func:`render` draws the frames afterwards on a pool
+of processes, each with its own headless figure and its own run of
+consecutive frames, and writes numbered images or, with ``movie=True``,
+one MP4 segment per process that are joined at the end.
+
+The frames can be rendered any number of times with other colour limits,
+y limits or histogram bins without simulating again. New bins must be
+made of whole recorded bins, so record with fine bins to be free later.
+
+Example
+--------
+::
+
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=1, img_years=1,
+                 hist_specs={'weight': {'max': 80, 'delta': 1}})
+    sim.record_frames('results/frames')
+    sim.simulate(1000)
+
+    render('results/frames', 'results', 'sim', cmax={'Herbivore': 150, 'Carnivore': 40},
+           hist_specs={'weight': {'max': 80, 'delta': 4}}, workers=8, movie=True)
+
+"""
+
+from biosim.summaries import ATTRIBUTES, SPECIES, hist_edges
+from biosim.visualization import Visualization
+from biosim import visualization
+
+import multiprocessing as mp
+import numpy as np
+import subprocess
+import json
+import os
+
+_META = 'frames.json'
+
+
+class FrameRecorder:
+    """
+    Writes the frame data of image years to compressed chunks
+    """
+    def __init__(self, path, island_map, chunk_frames=64):
+        """
+        Creates the recording directory
+
+        :param path: directory the chunks are written to, replaced if it holds a recording
+        :param island_map: the island map as a multiline string
+        :param chunk_frames: number of frames per chunk file
+        """
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self._frames = []
+        self._chunk = 0
+        self._meta = {'island_map': island_map, 'species': list(SPECIES), 'final_year': None}
+
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith('chunk_') and name.endswith('.npz'):
+                os.remove(os.path.join(path, name))
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, _META), 'w') as file:
+            json.dump(self._meta, file)
+
+    def set_final_year(self, final_year):
+        """
+        Stores the final year of the simulation, where the x-axis of the population graph ends
+
+        :param final_year: the final year of the current simulate call
+        """
+        self._meta['final_year'] = final_year
+        self._write_meta()
+
+    def write(self, frame):
+        """
+        Adds the frame of one image year
+
+        :param frame: frame data, see :func:`biosim.visualization.frame_data`
+        """
+        self._frames.append(frame)
+        if len(self._frames) >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the frames added since the last chunk as a new chunk
+        """
+        if not self._frames:
+            return
+        arrays = {'years': np.array([frame['year'] for frame in self._frames]),
+                  'totals': np.array([total for frame in self._frames for total in frame['totals']],
+                                     dtype=np.int64).reshape(-1, 3),
+                  'totals_end': np.cumsum([len(frame['totals']) for frame in self._frames])}
+        for species in SPECIES:
+            arrays[f'{species}_counts'] = np.array([frame['counts'][species]
+                                                    for frame in self._frames])
+            for attribute in ATTRIBUTES:
+                histograms = [frame['histograms'][species][attribute] for frame in self._frames]
+                arrays[f'{species}_{attribute}'] = np.array([counts for counts, _ in histograms])
+                arrays[f'{species}_{attribute}_edges'] = histograms[0][1]
+        name = os.path.join(self.path, f'chunk_{self._chunk:05d}.npz')
+        with open(name + '.tmp', 'wb') as file:
+            np.savez_compressed(file, **arrays)
+        os.replace(name + '.tmp', name)
+        self._chunk += 1
+        self._frames = []
+
+
+def _read_meta(path):
+    with open(os.path.join(path, _META)) as file:
+        return json.load(file)
+
+
+def read_frames(path):
+    """
+    Reads all frames of a recording
+
+    :param path: directory written by FrameRecorder
+    :return: island map and list of frames, see :func:`biosim.visualization.frame_data`
+    """
+    meta = _read_meta(path)
+    chunks = sorted(name for name in os.listdir(path)
+                    if name.startswith('chunk_') and name.endswith('.npz'))
+    frames = []
+    for name in chunks:
+        with np.load(os.path.join(path, name)) as chunk:
+            data = {key: chunk[key] for key in chunk.files}
+        starts = np.concatenate(([0], data['totals_end'][:-1]))
+        for index, year in enumerate(data['years'].tolist()):
+            totals = data['totals'][starts[index]:data['totals_end'][index]]
+            histograms = {species: {attribute: (data[f'{species}_{attribute}'][index],
+                                                data[f'{species}_{attribute}_edges'])
+                                    for attribute in ATTRIBUTES}
+                          for species in SPECIES}
+            frames.append({'year': year,
+                           'counts': {species: data[f'{species}_counts'][index]
+                                      for species in SPECIES},
+                           'histograms': histograms,
+                           'totals': [tuple(total) for total in totals.tolist()]})
+    return meta['island_map'], frames
+
+
+def rebin(counts, edges, new_edges):
+    """
+    Histogram counts for coarser bins made of whole recorded bins
+
+    :param counts: recorded bin counts
+    :param edges: recorded bin edges
+    :param new_edges: new bin edges, each must be one of the recorded edges
+    :return: counts of the new bins
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    new_edges = np.asarray(new_edges, dtype=np.float64)
+    index = np.abs(edges[:, np.newaxis] - new_edges[np.newaxis, :]).argmin(axis=0)
+    if len(edges) == 0 or not np.allclose(edges[index], new_edges):
+        raise ValueError('New histogram bins must be made of whole recorded bins')
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    return cumulative[index[1:]] - cumulative[index[:-1]]
+
+
+def _rebin_frames(frames, hist_specs):
+    """
+    Returns the frames with histograms for other bins
+
+    Attributes without a specification keep their recorded bins.
+    """
+    rebinned = []
+    for frame in frames:
+        histograms = {}
+        for species in SPECIES:
+            histograms[species] = dict(frame['histograms'][species])
+            for attribute in ATTRIBUTES:
+                if attribute not in hist_specs:
+                    continue
+                counts, edges = frame['histograms'][species][attribute]
+                new_edges = hist_edges(hist_specs[attribute])
+                histograms[species][attribute] = (rebin(counts, edges, new_edges), new_edges)
+        rebinned.append(dict(frame, histograms=histograms))
+    return rebinned
+
+
+def _render_run(task):
+    """
+    Draws and saves a run of consecutive frames on a figure of its own
+
+    :param task: tuple of the frames, the number of the first image, image directory,
+                 image name, image format, movie, island map, final year, y_max and cmax
+    """
+    (frames, first_image, img_dir, img_base, img_fmt, movie,
+     island_map, final_year, y_max, cmax) = task
+    visual = Visualization(img_dir, img_base, img_fmt, headless=True, movie_stream=movie)
+    visual._img_ctr = first_image
+    visual.setup(island_map, final_year, y_max)
+    for frame in frames:
+        visual.update(frame, cmax, y_max)
+        visual.save_plots()
+    visual.finish_movie()
+
+
+def render(path, img_dir, img_base, img_fmt='png', cmax=None, hist_specs=None, y_max=None,
+           workers=None, movie=False):
+    """
+    Draws the recorded frames on a pool of processes
+
+    :param path: directory written by FrameRecorder
+    :param img_dir: directory for the images or the movie
+    :param img_base: start of the image names, or name of the movie
+    :param img_fmt: format of the images
+    :param cmax: dictionary with the colorbar maxes of the heat maps, defaults if None
+    :param hist_specs: histogram specifications, the recorded bins if None
+    :param y_max: y-axis limit of the population graph, automatic if None
+    :param workers: number of processes, defaults to the number of CPUs
+    :param movie: if True, write img_base.mp4 instead of images, joined from one
+                  segment per process
+    :return: number of frames drawn
+    """
+    island_map, frames = read_frames(path)
+    if not frames:
+        return 0
+    if hist_specs is not None:
+        frames = _rebin_frames(frames, hist_specs)
+    final_year = _read_meta(path).get('final_year')
+    if final_year is None:
+        final_year = max(year for frame in frames for year, _, _ in frame['totals'])
+
+    workers = min(workers or os.cpu_count(), len(frames))
+    tasks = []
+    totals = []
+    first_image = 0
+    for index, run in enumerate(np.array_split(np.arange(len(frames)), workers)):
+        run_frames = [frames[i] for i in run]
+        # The first frame of a run carries the totals of all years before it
+        run_frames[0] = dict(run_frames[0], totals=totals + run_frames[0]['totals'])
+        totals = totals + [total for i in run for total in frames[i]['totals']]
+        run_base = f'{img_base}_part{index:03d}' if movie else img_base
+        tasks.append((run_frames, 0 if movie else first_image, img_dir, run_base, img_fmt, movie,
+                      island_map, final_year, y_max, cmax))
+        first_image += len(run)
+
+    if workers == 1:
+        for task in tasks:
+            _render_run(task)
+    else:
+        with mp.Pool(workers) as pool:
+            pool.map(_render_run, tasks, chunksize=1)
+
+    if movie:
+        _join_segments(img_dir, img_base, len(tasks))
+    return len(frames)
+
+
+def _join_segments(img_dir, img_base, num_segments):
+    """
+    Joins the movie segments of the processes into one MP4 and removes them
+    """
+    base = os.path.join(img_dir, img_base)
+    segments = [f'{base}_part{index:03d}.mp4' for index in range(num_segments)]
+    listing = f'{base}_parts.txt'
+    with open(listing, 'w') as file:
+        file.writelines(f"file '{os.path.abspath(segment)}'\n" for segment in segments)
+    try:
+        subprocess.check_call([visualization._FFMPEG_BINARY,
+                               '-f', 'concat',
+                               '-safe', '0',
+                               '-i', listing,
+                               '-c', 'copy',
+                               '-y',
+                               f'{base}.mp4'])
+    except subprocess.CalledProcessError as err:
+        raise RuntimeError('ERROR: ffmpeg failed with: {}'.format(err))
+    finally:
+        os.remove(listing)
+    for segment in segments:
+        if os.path.exists(segment):
+            os.remove(segment)
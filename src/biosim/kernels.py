@@ -0,0 +1,192 @@
+"""
+Loop kernels for the array based island
+
+The functions in this module work on the NumPy columns of
+:class:`biosim.vectorized.ArrayIsland` one animal at a time, the same way
+the methods of :class:`biosim.landscapes.OneGrid` and
+:class:`biosim.animals.Animal` do. When Numba is installed they are
+compiled to machine code the first time they are called, which makes the
+branchy parts of the year, like carnivores hunting, run at near native
+speed.
+
+When Numba is not installed the kernels stay plain Python functions.
+:class:`biosim.vectorized.ArrayIsland` then uses its NumPy implementation
+of the phases instead, and only hunting runs through :func:`hunt`.
+
+.. note:: Numba is optional, install it with ``pip install numba``.
+
+"""
+
+import numpy as np
+import math as m
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+def jit(function):
+    """
+    Compiles a kernel with Numba when it is installed, returns it unchanged otherwise
+
+    :param function: the kernel to compile
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def fitness(age, weight, phi_age, a_half, phi_weight, w_half):
+    """
+    Fitness of one animal, see :meth:`biosim.animals.Animal.calculate_fitness`
+    """
+    if weight <= 0:
+        return 0.0
+    q_plus = 1 / (1 + m.exp(phi_age * (age - a_half)))
+    q_minus = 1 / (1 + m.exp(-phi_weight * (weight - w_half)))
+    return q_plus * q_minus
+
+
+@jit
+def feed_herbivores(order, groups, weight, fodder, appetite, beta):
+    """
+    Herbivores eat in the given order until the fodder of their cell is gone
+
+    :param order: animals sorted by cell and descending fitness
+    :param groups: cell index of each animal, indexing fodder
+    :param weight: weights, updated in place
+    :param fodder: fodder in each cell, updated in place
+    """
+    for i in order:
+        group = groups[i]
+        eaten = min(appetite, fodder[group])
+        if eaten > 0:
+            weight[i] += beta * eaten
+            fodder[group] -= eaten
+
+
+@jit
+def hunt_cells(herb_fitness, herb_weight, herb_start, herb_count,
+               carn_age, carn_weight, carn_start, carn_count, rand, rand_start, alive,
+               phi_age, a_half, phi_weight, w_half, beta, appetite, delta_phi_max):
+    """
+    Lets the carnivores of each cell hunt the herbivores of the same cell,
+    see :meth:`biosim.landscapes.OneGrid.cell_feeding_carnivore`
+
+    Herbivores must be sorted by descending fitness and carnivores shuffled
+    within each cell. Carnivore weights are updated in place, and killed
+    herbivores are marked False in alive.
+    """
+    for group in range(len(herb_start)):
+        num_herb = herb_count[group]
+        for k in range(carn_count[group]):
+            carn = carn_start[group] + k
+            carn_fitness = fitness(carn_age[carn], carn_weight[carn],
+                                   phi_age, a_half, phi_weight, w_half)
+            amount_eaten = 0.0
+            for j in range(num_herb):
+                herb = herb_start[group] + j
+                if not alive[herb]:
+                    continue
+                difference_fitness = carn_fitness - herb_fitness[herb]
+                if carn_fitness < herb_fitness[herb]:
+                    prob = 0.0
+                elif 0 < difference_fitness < delta_phi_max:
+                    prob = difference_fitness / delta_phi_max
+                else:
+                    prob = 1.0
+                if rand[rand_start[group] + k * num_herb + j] < prob:
+                    alive[herb] = False
+                    fodder = herb_weight[herb]
+                    if amount_eaten + fodder < appetite:
+                        carn_weight[carn] += beta * fodder
+                        amount_eaten += fodder
+                        carn_fitness = fitness(carn_age[carn], carn_weight[carn],
+                                               phi_age, a_half, phi_weight, w_half)
+                    else:
+                        carn_weight[carn] += beta * (appetite - amount_eaten)
+                        break
+
+
+@jit
+def birth_mask(groups, num_in_group, age, weight, w_child, rand, born,
+               phi_age, a_half, phi_weight, w_half, gamma, zeta, xi, w_birth, sigma_birth):
+    """
+    Decides which animals give birth, see :meth:`biosim.animals.Animal.birth`
+
+    As in :meth:`biosim.landscapes.OneGrid.cell_procreation` the number of animals
+    counts down through each cell. Parent weights are reduced in place.
+
+    :param num_in_group: number of animals in each cell, used up by the kernel
+    :param born: output, True for animals that give birth
+    """
+    zero_condition = zeta * (w_birth + sigma_birth)
+    for i in range(len(groups)):
+        n = num_in_group[groups[i]]
+        num_in_group[groups[i]] -= 1
+        lost_weight = w_child[i] * xi
+        born[i] = False
+        if weight[i] < lost_weight or w_child[i] <= 0 or weight[i] < zero_condition:
+            continue
+        phi = fitness(age[i], weight[i], phi_age, a_half, phi_weight, w_half)
+        if rand[i] < min(1.0, gamma * phi * (n - 1)):
+            born[i] = True
+            weight[i] -= lost_weight
+
+
+@jit
+def migrate(cell, age, weight, rand_move, rand_direction, neighbours, livable,
+            mu, phi_age, a_half, phi_weight, w_half):
+    """
+    Moves animals to a random neighbouring cell that is not water, updates cell in place,
+    see :meth:`biosim.animals.Animal.migrate`
+    """
+    for i in range(len(cell)):
+        phi = fitness(age[i], weight[i], phi_age, a_half, phi_weight, w_half)
+        if rand_move[i] < mu * phi:
+            target = neighbours[cell[i], min(int(rand_direction[i] * 4), 3)]
+            if livable[target]:
+                cell[i] = target
+
+
+@jit
+def survivors(age, weight, rand, alive, omega, phi_age, a_half, phi_weight, w_half):
+    """
+    Decides which animals survive the year, see :meth:`biosim.animals.Animal.death`
+
+    :param alive: output, False for animals that die
+    """
+    for i in range(len(age)):
+        phi = fitness(age[i], weight[i], phi_age, a_half, phi_weight, w_half)
+        alive[i] = not (weight[i] == 0 or rand[i] < omega * (1 - phi))
+
+
+def hunt(herb_fitness, herb_weight, herb_start, herb_count,
+         carn_age, carn_weight, carn_start, carn_count, rand, rand_start, params):
+    """
+    Runs :func:`hunt_cells`, on Python lists when the kernel is not compiled
+
+    :param params: parameter dict of the carnivores
+    :return: boolean array, False for herbivores that were killed
+    """
+    args = (float(params['phi_age']), float(params['a_half']),
+            float(params['phi_weight']), float(params['w_half']),
+            float(params['beta']), float(params['F']), float(params['DeltaPhiMax']))
+    if HAVE_NUMBA:
+        alive = np.ones(len(herb_fitness), dtype=np.bool_)
+        hunt_cells(herb_fitness, herb_weight, herb_start, herb_count,
+                   carn_age, carn_weight, carn_start, carn_count, rand, rand_start, alive, *args)
+        return alive
+
+    # Indexing lists is much faster than indexing arrays in plain Python
+    alive = [True] * len(herb_fitness)
+    new_weight = carn_weight.tolist()
+    hunt_cells(herb_fitness.tolist(), herb_weight.tolist(), herb_start.tolist(),
+               herb_count.tolist(), carn_age.tolist(), new_weight, carn_start.tolist(),
+               carn_count.tolist(), rand.tolist(), rand_start.tolist(), alive, *args)
+    carn_weight[:] = new_weight
+    return np.array(alive, dtype=np.bool_)
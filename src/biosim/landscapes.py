@@ -31,6 +31,8 @@ class OneGrid:
 
         self.population_carn: all carnivores in that cell
 
+        self._pending: animals added with cell_add_lazy_population that are not created yet
+
         self.population_sum_herb: number of herbivores in that cell
 
         self.population_sum_carn: number of carnivores in that cell
@@ -38,11 +40,61 @@ class OneGrid:
         self.fodder = 0
         self.cord = cord
         self.livable = True
+        self._pending = None
         self.population_herb = []
         self.population_carn = []
         self.population_sum_herb = None
         self.population_sum_carn = None
 
+    @property
+    def population_herb(self):
+        """
+        All herbivores in the cell, loads pending animals on first access
+        """
+        if self._pending is not None:
+            self._load_pending()
+        return self._population_herb
+
+    @population_herb.setter
+    def population_herb(self, population):
+        self._population_herb = population
+
+    @property
+    def population_carn(self):
+        """
+        All carnivores in the cell, loads pending animals on first access
+        """
+        if self._pending is not None:
+            self._load_pending()
+        return self._population_carn
+
+    @population_carn.setter
+    def population_carn(self, population):
+        self._population_carn = population
+
+    def cell_add_lazy_population(self, pending):
+        """
+        Registers animals that are only created when the cell population is first used
+
+        :param pending: object with a counts() method returning the number of
+                        herbivores and carnivores, and a load() method returning
+                        lists of herbivore and carnivore objects
+        """
+        if not self.livable:
+            raise TypeError('Cannot add animals to water cell')
+        if self._pending is not None:
+            self._load_pending()
+        self._pending = pending
+
+    def _load_pending(self):
+        """
+        Creates the pending animals and adds them to the cell
+        """
+        pending, self._pending = self._pending, None
+        herbs, carns = pending.load()
+        self._population_herb.extend(herbs)
+        self._population_carn.extend(carns)
+
     def cell_set_params(cls, params):
         """
         Takes an dictionary of parameters and replaces default param
@@ -73,8 +125,13 @@ class OneGrid:
         """
         Calculates the sum of herbivores and carnivores in the cell
         """
-        self.population_sum_herb = len(self.population_herb)
-        self.population_sum_carn = len(self.population_carn)
+        if self._pending is not None:
+            num_herb, num_carn = self._pending.counts()
+            self.population_sum_herb = len(self._population_herb) + num_herb
+            self.population_sum_carn = len(self._population_carn) + num_carn
+        else:
+            self.population_sum_herb = len(self.population_herb)
+            self.population_sum_carn = len(self.population_carn)
 
     def cell_calculate_fitness(self):
         """
@@ -0,0 +1,171 @@
+"""
+Buffered log writer for biosim
+
+:class:`LogWriter` keeps a log file open for as long as it is used and
+collects lines in memory. The lines are written to the file when the
+buffer holds ``flush_bytes`` or more, when ``flush_seconds`` have passed
+since the last write, when :meth:`LogWriter.flush` is called, and at
+the latest when the writer is closed, garbage collected or the program
+exits. This replaces opening and closing the file for every line, which
+on network file systems can take longer than simulating a year of a
+small island.
+
+With ``background=True`` the lines are handed to a thread that does the
+writing, so the simulation does not wait for the file system at all.
+
+:class:`biosim.simulation.BioSim` writes its log file through a
+LogWriter, flushes it at the end of every ``simulate()`` call and
+closes it in :meth:`biosim.simulation.BioSim.close`.
+"""
+
+import threading
+import weakref
+import queue
+import time
+
+_STOP = object()
+
+
+class _LogFile:
+    """
+    Open log file and the lines not yet written to it
+
+    Kept apart from :class:`LogWriter`, so the background thread and the
+    finalizer that closes the file do not keep the writer alive.
+    """
+    def __init__(self, path, append, flush_bytes, flush_seconds):
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        self.file = open(path, 'a' if append else 'w')
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, text):
+        """
+        Adds text to the buffer and writes it out if the policy says so
+        """
+        with self._lock:
+            self._buffer.append(text)
+            self._buffered += len(text)
+            due = (self._buffered >= self.flush_bytes or
+                   time.monotonic() - self._last_flush >= self.flush_seconds)
+        if due:
+            self.write_buffer()
+
+    def write_buffer(self):
+        with self._lock:
+            text = ''.join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            if text:
+                self.file.write(text)
+                self.file.flush()
+            self._last_flush = time.monotonic()
+
+
+def _drain(log_file, lines):
+    """
+    Writes lines handed over by LogWriter.write() until _STOP comes, runs in the background thread
+    """
+    while True:
+        item = lines.get()
+        try:
+            if item is _STOP:
+                return
+            if isinstance(item, threading.Event):
+                log_file.write_buffer()
+                item.set()
+            else:
+                log_file.add(item)
+        finally:
+            lines.task_done()
+
+
+def _close(log_file, lines, thread):
+    """
+    Writes all lines and closes the file, called by close(), when the writer is
+    garbage collected, or at exit
+    """
+    if thread is not None:
+        lines.put(_STOP)
+        thread.join()
+    log_file.write_buffer()
+    log_file.file.close()
+
+
+class LogWriter:
+    """
+    Line-oriented file writer with a size and time based flush policy
+    """
+    def __init__(self, path, header=None, append=False, flush_bytes=65536, flush_seconds=5.0,
+                 background=False):
+        """
+        Opens the log file
+
+        :param path: name of the file
+        :param header: first line of the file, without newline, written if the file is new or empty
+        :param append: if True, lines are added to an existing file, otherwise it is replaced
+        :param flush_bytes: number of buffered bytes that causes a write
+        :param flush_seconds: largest time in seconds lines stay in the buffer, checked
+                              when a line is added
+        :param background: if True, the file is written from a background thread
+        """
+        self.path = path
+        self._log_file = _LogFile(path, append, flush_bytes, flush_seconds)
+        if header is not None and self._log_file.file.tell() == 0:
+            self._log_file.add(header + '\n')
+
+        self._queue = None
+        self._thread = None
+        if background:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=_drain, args=(self._log_file, self._queue),
+                                            daemon=True)
+            self._thread.start()
+        self._finalizer = weakref.finalize(self, _close, self._log_file, self._queue, self._thread)
+
+    def __deepcopy__(self, memo):
+        # Copies of a simulation keep writing to the same open file
+        return self
+
+    def write(self, line):
+        """
+        Adds one line to the log
+
+        :param line: text of the line, without newline
+        """
+        if self.closed:
+            raise ValueError(f'{self.path} has been closed')
+        if self._queue is not None:
+            self._queue.put(line + '\n')
+        else:
+            self._log_file.add(line + '\n')
+
+    def flush(self):
+        """
+        Writes all lines added so far to the file
+        """
+        if self.closed:
+            return
+        if self._queue is not None:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+        else:
+            self._log_file.write_buffer()
+
+    def close(self):
+        """
+        Writes all lines and closes the file, called when the writer is garbage
+        collected or at exit if not called before
+        """
+        self._finalizer()
+
+    @property
+    def closed(self):
+        """
+        True once the file has been closed
+        """
+        return not self._finalizer.alive
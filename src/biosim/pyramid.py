@@ -0,0 +1,122 @@
+"""
+Multi-resolution count grids for large islands
+
+A :class:`CountPyramid` holds a grid of animal counts, see
+:meth:`biosim.engines.Engine.count_grid`, together with coarser levels
+in which each cell is the sum of a ``factor`` x ``factor`` block of the
+level below. The visualization uses it to draw heat maps of very large
+islands at the resolution the axes can show: the block means of the
+first level that fits the pixels, so drawing takes about the same time
+for any island size.
+
+The levels also answer regional queries. The number of animals in a
+rectangle is added up from the largest blocks that fit inside it, so a
+query costs about the perimeter of the rectangle, not its area.
+
+Example
+--------
+::
+
+    pyramid = CountPyramid(sim._engine.count_grid('Herbivore'))
+    pyramid.count((10, 10), (900, 1200))      # herbivores in rows 10-900, columns 10-1200
+    coarse = pyramid.means(pyramid.level_for(300, 400))
+
+"""
+
+import numpy as np
+
+
+class CountPyramid:
+    """
+    Count grid with block sums at successively coarser levels
+    """
+    def __init__(self, grid, factor=2):
+        """
+        Builds all levels, down to a single block
+
+        :param grid: array (rows, columns) of counts
+        :param factor: number of cells along each side of a block of the next level
+        """
+        if factor < 2:
+            raise ValueError('factor must be at least 2')
+        self.factor = factor
+        self.shape = np.shape(grid)
+        self.levels = [np.asarray(grid)]
+        while max(self.levels[-1].shape) > 1:
+            level = self.levels[-1]
+            rows, cols = -(-np.array(level.shape) // factor)
+            padded = np.zeros((rows * factor, cols * factor), dtype=level.dtype)
+            padded[:level.shape[0], :level.shape[1]] = level
+            self.levels.append(padded.reshape(rows, factor, cols, factor).sum(axis=(1, 3)))
+
+    def block_size(self, level):
+        """
+        Number of map cells along each side of a block of a level
+        """
+        return self.factor ** level
+
+    def level_for(self, height, width):
+        """
+        The finest level with at most height rows and width columns
+
+        :param height: number of rows that can be shown, e.g. pixels of the axes
+        :param width: number of columns that can be shown
+        """
+        for level, grid in enumerate(self.levels):
+            if grid.shape[0] <= height and grid.shape[1] <= width:
+                return level
+        return len(self.levels) - 1
+
+    def means(self, level):
+        """
+        Mean count per map cell in each block of a level
+
+        Blocks on the lower and right edges may cover fewer map cells, they
+        are divided by the cells they cover.
+
+        :param level: level number, 0 is the grid itself
+        """
+        grid = self.levels[level]
+        size = self.block_size(level)
+        rows = np.minimum(size, self.shape[0] - np.arange(grid.shape[0]) * size)
+        cols = np.minimum(size, self.shape[1] - np.arange(grid.shape[1]) * size)
+        return grid / np.outer(rows, cols)
+
+    def count(self, first, last):
+        """
+        Number of animals in a rectangle of cells
+
+        :param first: location (row, column) of the upper left cell, counted from 1
+        :param last: location (row, column) of the lower right cell, counted from 1
+        """
+        top, left = max(first[0] - 1, 0), max(first[1] - 1, 0)
+        bottom, right = min(last[0], self.shape[0]), min(last[1], self.shape[1])
+        return int(self._count(len(self.levels) - 1, top, bottom, left, right))
+
+    def _count(self, level, top, bottom, left, right):
+        """
+        Sum over map cells [top, bottom) x [left, right), using blocks of level and finer
+
+        :param level: coarsest level to use
+        """
+        if top >= bottom or left >= right:
+            return 0
+        size = self.block_size(level)
+        inner_top, inner_bottom = -(-top // size), bottom // size
+        inner_left, inner_right = -(-left // size), right // size
+        while level > 0 and (inner_top >= inner_bottom or inner_left >= inner_right):
+            level -= 1
+            size = self.block_size(level)
+            inner_top, inner_bottom = -(-top // size), bottom // size
+            inner_left, inner_right = -(-left // size), right // size
+        total = self.levels[level][inner_top:inner_bottom, inner_left:inner_right].sum()
+        if level == 0:
+            return total
+        # The strips around the whole blocks are added up from finer levels
+        row_0, row_1 = inner_top * size, inner_bottom * size
+        col_0, col_1 = inner_left * size, inner_right * size
+        return (total +
+                self._count(level - 1, top, row_0, left, right) +
+                self._count(level - 1, row_1, bottom, left, right) +
+                self._count(level - 1, row_0, row_1, left, col_0) +
+                self._count(level - 1, row_0, row_1, col_1, right))
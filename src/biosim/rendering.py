@@ -0,0 +1,204 @@
+"""
+Rendering of saved images in a separate process
+
+With images on, drawing and saving the figure takes far longer than
+simulating a year. An :class:`AsyncRenderer` moves this work to another
+process. For every image year the simulation only collects the frame
+data, see :func:`biosim.visualization.frame_data`, and puts it into a
+bounded queue. The rendering process draws and saves the images while
+the simulation continues. It draws headless, without pyplot, see
+:class:`biosim.visualization.Visualization`, so no window is shown.
+
+When the queue is full the back-pressure policy decides:
+
+* ``'block'``: the simulation waits until there is room, so every image is saved
+* ``'drop'``: the frame is skipped, so the simulation never waits. The last
+  frame of each ``simulate()`` call is always saved, and the population
+  graph still gets the totals of the skipped years. Saved images are
+  numbered without gaps.
+
+Example
+--------
+::
+
+    with BioSim(geogr, ini_pop, seed=1, img_dir='results', img_base='sim',
+                renderer='drop') as sim:    # the rendering process is stopped on leaving
+        sim.simulate(500)
+        sim.make_movie()
+
+"""
+
+from biosim import branching
+
+import multiprocessing as mp
+import weakref
+import queue
+
+POLICIES = ('block', 'drop')
+
+_WAIT_SECONDS = 0.1
+
+
+def _render_loop(frames, done, visual):
+    """
+    Draws and saves the frames handed over by the simulation, runs in the rendering process
+
+    :param frames: queue of messages, ('setup', island_map, final_year, y_max, cmax),
+                   ('frame', frame, image_number), ('sync',) or ('stop',)
+    :param done: event set after each 'sync' message
+    :param visual: Visualization with the image settings
+    """
+    visual.headless = True
+    y_max = cmax = None
+    while True:
+        message = frames.get()
+        if message[0] == 'stop':
+            visual.finish_movie()
+            return
+        if message[0] == 'setup':
+            island_map, final_year, y_max, cmax = message[1:]
+            visual.setup(island_map, final_year, y_max)
+        elif message[0] == 'frame':
+            frame, image_number = message[1:]
+            visual.update(frame, cmax, y_max)
+            visual._img_ctr = image_number
+            visual.save_plots()
+        elif message[0] == 'sync':
+            done.set()
+
+
+def _stop(process, frames):
+    """
+    Stops the rendering process, called by close(), when the renderer is garbage
+    collected, or at exit
+    """
+    while process.is_alive():
+        try:
+            frames.put(('stop',), timeout=_WAIT_SECONDS)
+            break
+        except queue.Full:
+            pass
+    process.join()
+
+
+class AsyncRenderer:
+    """
+    Renders and saves images in a separate process, fed through a bounded queue
+    """
+    def __init__(self, policy='block', max_frames=8):
+        """
+        :param policy: 'block' or 'drop', what to do with a frame when the queue is full
+        :param max_frames: number of frames the queue holds
+        """
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown rendering policy: {policy}')
+        self.policy = policy
+        self.max_frames = max_frames
+        self.img_ctr = 0
+        self.dropped = 0
+        self._pending = None
+        self._process = None
+        self._frames = None
+        self._done = None
+        self._finalizer = None
+
+    def __deepcopy__(self, memo):
+        # Copies of a simulation do not render, they share the process
+        return self
+
+    def setup(self, visual, island_map, final_year, y_max=None, cmax=None):
+        """
+        Starts the rendering process if needed and prepares the figure for the coming years
+
+        :param visual: Visualization with the image settings, copied to the rendering process
+        :param island_map: the island map as a multiline string
+        :param final_year: the final year of the simulation
+        :param y_max: y-axis limit of the population graph, automatic if None
+        :param cmax: dictionary with the colorbar maxes of the heat maps
+        """
+        if self._process is None:
+            context = mp.get_context('fork' if branching.can_fork() else 'spawn')
+            self._frames = context.Queue(self.max_frames)
+            self._done = context.Event()
+            self._process = context.Process(target=_render_loop,
+                                            args=(self._frames, self._done, visual),
+                                            daemon=True)
+            self._process.start()
+            self._finalizer = weakref.finalize(self, _stop, self._process, self._frames)
+        self.img_ctr = visual._img_ctr
+        self._put(('setup', island_map, final_year, y_max, cmax))
+
+    def submit(self, frame):
+        """
+        Hands the frame of an image year to the rendering process
+
+        :param frame: frame data, see :func:`biosim.visualization.frame_data`
+        """
+        if self.policy == 'block':
+            self._deliver(frame)
+            return
+        if self._pending is not None:
+            # Keep the totals of the skipped frame for the population graph
+            frame['totals'] = self._pending['totals'] + frame['totals']
+        try:
+            self._frames.put_nowait(('frame', frame, self.img_ctr))
+        except queue.Full:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = frame
+            return
+        self._delivered(frame)
+
+    def _deliver(self, frame):
+        self._put(('frame', frame, self.img_ctr))
+        self._delivered(frame)
+
+    def _delivered(self, frame):
+        if self._pending is not None and self._pending is not frame:
+            self.dropped += 1
+        self._pending = None
+        self.img_ctr += 1
+
+    def _put(self, message):
+        """
+        Puts a message into the queue, waiting for room as long as the rendering process runs
+        """
+        while True:
+            self._check_alive()
+            try:
+                self._frames.put(message, timeout=_WAIT_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def _check_alive(self):
+        if not self._process.is_alive():
+            raise RuntimeError(f'Rendering process exited with code {self._process.exitcode}')
+
+    def finish(self):
+        """
+        Delivers the last skipped frame and waits until all frames are saved
+        """
+        if self._process is None:
+            return
+        if self._pending is not None:
+            self._deliver(self._pending)
+        self._put(('sync',))
+        while not self._done.wait(_WAIT_SECONDS):
+            self._check_alive()
+        self._done.clear()
+
+    def close(self):
+        """
+        Saves the remaining frames, finishes a streamed movie and stops the rendering process
+        """
+        if self._process is None:
+            return
+        running = self._process.is_alive()
+        if running:
+            self.finish()
+        self._finalizer()
+        exitcode = self._process.exitcode
+        self._process = None
+        if running and exitcode != 0:
+            raise RuntimeError(f'Rendering process exited with code {exitcode}')
@@ -0,0 +1,111 @@
+"""
+Bounded population series for the population graph
+
+The population graph of a long run would need one point per year and
+species. :class:`PopulationSeries` keeps at most ``max_points`` buckets
+instead. Each bucket holds the smallest and largest count of each species
+in its years. When a year falls past the last bucket, neighbouring
+buckets are merged in pairs and each bucket covers twice as many years.
+Memory and the cost of drawing the graph stay the same for a run of a
+thousand years and a run of a million years. The graph still shows
+every peak and every dip, because each bucket is drawn from its minimum
+to its maximum.
+
+The largest count so far is kept as a running maximum for the y-axis
+limit, so it is never searched for.
+
+Example
+--------
+::
+
+    series = PopulationSeries(max_points=2048)
+    for year in range(10**6):
+        series.add(year, herbivores[year], carnivores[year])
+    years, counts = series.decimated()      # at most 2 * 2048 points per species
+    series.max
+
+"""
+
+import numpy as np
+
+SPECIES = ('Herbivore', 'Carnivore')
+
+
+class PopulationSeries:
+    """
+    Minimum and maximum counts per species in at most max_points buckets of years
+    """
+    def __init__(self, max_points=2048, start_year=0):
+        """
+        :param max_points: largest number of buckets kept
+        :param start_year: first year of the first bucket
+        """
+        if max_points < 2:
+            raise ValueError('max_points must be at least 2')
+        self.max_points = max_points
+        self.start_year = start_year
+        self.bucket_years = 1
+        self.max = 0
+        self._min = np.full((max_points, len(SPECIES)), np.nan)
+        self._max = np.full((max_points, len(SPECIES)), np.nan)
+        self._length = 0
+
+    def __len__(self):
+        """
+        Number of buckets in use
+        """
+        return self._length
+
+    def add(self, year, *counts):
+        """
+        Adds the counts of one year
+
+        :param year: the year, not before start_year
+        :param counts: number of herbivores and carnivores
+        """
+        bucket = (year - self.start_year) // self.bucket_years
+        if bucket < 0:
+            raise ValueError(f'Year {year} is before the start of the series')
+        while bucket >= self.max_points:
+            self._coarsen()
+            bucket = (year - self.start_year) // self.bucket_years
+        counts = np.asarray(counts, dtype=np.float64)
+        self._min[bucket] = np.fmin(self._min[bucket], counts)
+        self._max[bucket] = np.fmax(self._max[bucket], counts)
+        self._length = max(self._length, bucket + 1)
+        self.max = max(self.max, counts.max())
+
+    def _coarsen(self):
+        """
+        Merges the buckets in pairs, so each covers twice as many years
+        """
+        half = self.max_points // 2
+        pairs = slice(0, 2 * half)
+        for values, merge in ((self._min, np.fmin), (self._max, np.fmax)):
+            merged = merge(values[pairs][0::2], values[pairs][1::2])
+            if self.max_points % 2:
+                merged = np.vstack((merged, values[-1:]))
+            values[:] = np.nan
+            values[:len(merged)] = merged
+        self._length = -(-self._length // 2)
+        self.bucket_years *= 2
+
+    def decimated(self):
+        """
+        Points for drawing the series
+
+        With one year per bucket there is one point per year, otherwise two
+        per bucket, the minimum and the maximum, at the middle of the bucket.
+        Buckets without counts are left out.
+
+        :return: years (n,) and counts (n, 2) of herbivores and carnivores
+        """
+        filled = ~np.isnan(self._min[:self._length, 0])
+        starts = self.start_year + np.arange(self._length)[filled] * self.bucket_years
+        if self.bucket_years == 1:
+            return starts, self._min[:self._length][filled]
+        middles = starts + (self.bucket_years - 1) / 2
+        counts = np.empty((2 * len(middles), len(SPECIES)))
+        counts[0::2] = self._min[:self._length][filled]
+        counts[1::2] = self._max[:self._length][filled]
+        return np.repeat(middles, 2), counts
@@ -54,12 +54,23 @@ This code
 
 from biosim.animals import Herbivore, Carnivore
 from biosim.landscapes import Lowland, Highland
-from biosim.island_map import Map
+from biosim.engines import create_engine
 from biosim.visualization import Visualization
-
-import random as rd
+from biosim.rendering import AsyncRenderer
+from biosim.cache import ResultCache
+from biosim.logwriter import LogWriter
+from biosim import branching, checkpoint, deltas, density, digest, frames, snapshot, \
+    visualization, yearstats
+import biosim
+
+import numpy as np
 import textwrap3
 
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
 
 class BioSim:
     """
@@ -68,7 +79,8 @@ class BioSim:
     def __init__(self, island_map, ini_pop, seed,
                  vis_years=1, ymax_animals=None, cmax_animals=None, hist_specs=None,
                  img_dir=None, img_base=None, img_fmt='png', img_years=None,
-                 log_file=None):
+                 log_file=None, engine='reference', cache=None, digests=False,
+                 log_thread=False, renderer=None, headless=False, movie_stream=False, blit=False):
 
         """
         :param island_map: Multi-line string specifying island geography
@@ -82,7 +94,23 @@ class BioSim:
         :param img_base: String with beginning of file name for figures
         :param img_fmt: String with file type for figures, e.g. 'png'
         :param img_years: years between visualizations saved to files (default: vis_years)
-        :param log_file: If given, write animal counts to this file
+        :param log_file: If given, write animal counts to this file. The file is kept open and
+                         continued by later calls to simulate, see :mod:`biosim.logwriter`
+        :param engine: String, name of the engine simulating the island, see :mod:`biosim.engines`
+        :param cache: ResultCache or path of a cache directory, if given runs without
+                      visualization are looked up there first, see :mod:`biosim.cache`
+        :param digests: If True, record a hash of the island state every year in self.digests,
+                        also written next to the log file, see :mod:`biosim.digest`
+        :param log_thread: If True, the log file is written from a background thread
+        :param renderer: AsyncRenderer, or its back-pressure policy 'block' or 'drop', if given
+                         images are drawn and saved in a separate process and no window is
+                         shown, see :mod:`biosim.rendering`
+        :param headless: If True, images are drawn without pyplot and without showing a window,
+                         and only in img_years
+        :param movie_stream: If True, images are piped into ffmpeg instead of written to files,
+                             and make_movie only finishes the MP4
+        :param blit: If True, the live window is updated by blitting, only the parts that
+                     change are drawn each year
 
         If ymax_animals is None, the y-axis limit should be adjusted automatically.
         If cmax_animals is None, sensible, fixed default values should be used.
@@ -106,7 +134,6 @@ class BioSim:
         img_dir and img_base must either be both None or both strings.
 
         """
-        rd.seed(seed)
         self.island_map = textwrap3.dedent(island_map)
         self.ini_pop = ini_pop
         self.vis_years = vis_years
@@ -122,9 +149,28 @@ class BioSim:
         self._final_year = None
         self._animal_species = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
         self._landscape_types_changeable = {'L': Lowland, 'H': Highland}
-        self.map = Map(self.island_map)
-        self.map.creating_map()
-        self.visual = Visualization(self.img_dir, self.img_base, self.img_fmt)
+        self.engine_name = engine
+        self._engine = create_engine(engine, self.island_map, seed)
+        self.headless = headless
+        self.movie_stream = movie_stream
+        self.blit = blit
+        self.visual = Visualization(self.img_dir, self.img_base, self.img_fmt, headless,
+                                    movie_stream, blit)
+        self._totals = []
+        self._history = None
+        self._stats = None
+        self._density = None
+        self._frames = None
+        if isinstance(cache, str):
+            cache = ResultCache(cache)
+        self.cache = cache
+        self.digests = [] if digests else None
+        self.log_thread = log_thread
+        self._log = None
+        self._digest_log = None
+        if isinstance(renderer, str):
+            renderer = AsyncRenderer(renderer)
+        self.renderer = renderer
 
     def set_animal_parameters(self, species, params):
         """
@@ -168,21 +214,123 @@ class BioSim:
             if self.img_years % self.vis_years != 0:
                 raise ValueError('img_steps must be multiple of vis_steps')
         self._final_year = self._year + num_years
-        if self.vis_years != 0:
-            self.visual.setup(self.map, self._final_year, self.ymax_animals)
+        if self._frames is not None:
+            self._frames.set_final_year(self._final_year)
+        if self.vis_years != 0 and self._frames is None:
+            if self.renderer is not None:
+                self.renderer.setup(self.visual, self.island_map, self._final_year,
+                                    self.ymax_animals, self.cmax_animals)
+            else:
+                self.visual.setup(self.island_map, self._final_year, self.ymax_animals,
+                                  self.hist_specs)
+
+        cache_key = None
+        if self.cache is not None and self.vis_years == 0 and not self._recording():
+            cache_key = self._cache_key(num_years)
+            if self._restore_cached(cache_key):
+                self.flush_log()
+                return
+            counts = []
 
         while self._year < self._final_year:
-            self.map.island_update_one_year()
+            self._engine.update_one_year()
             if self.vis_years != 0:
                 if self._year % self.vis_years == 0:
-                    self.visual.update(self._year, self.map, self.cmax_animals, self.hist_specs)
-            if self.vis_years != 0:
-                if self._year % self.img_years == 0:
-                    self.visual.save_plots()
+                    self.update_visualization()
             if self.log_file is not None:
                 self.save_to_file()
+            if self.digests is not None:
+                self.digests.append(self._engine.state_digest())
+                if self.log_file is not None:
+                    self.save_digest(self.digests[-1])
+            if self._history is not None:
+                self._history.write(self._year, self._engine.export_columns())
+            if self._stats is not None:
+                self._stats.write(self._year, self._engine)
+            if self._density is not None:
+                self._density.record(self._year, self._engine)
+            if cache_key is not None:
+                counts.append(list(self.num_animals_per_species.values()))
+
+            self._year += 1
+
+        self.flush_log()
+        if self.renderer is not None and self.vis_years != 0:
+            self.renderer.finish()
+            self.visual._img_ctr = self.renderer.img_ctr
+        if cache_key is not None:
+            columns = self._engine.export_columns()
+            columns['counts'] = np.array(counts, dtype=np.int64).reshape(-1, 2)
+            meta = {'rng_state': self._engine.get_rng_state()}
+            if self.digests is not None:
+                meta['digests'] = self.digests[len(self.digests) - num_years:]
+            self.cache.put(cache_key, columns, meta)
+
+    def update_visualization(self):
+        """
+        Draws the current year, and saves it in image years
+
+        Without a window, see headless, renderer and record_frames, only image years are drawn,
+        the other years only add their totals to the population graph.
+        """
+        numbers = self.num_animals_per_species
+        self._totals.append((self._year, numbers['Herbivore'], numbers['Carnivore']))
+        save = self._year % self.img_years == 0
+        if not save and (self.headless or self.renderer is not None or self._frames is not None):
+            return
+        frame = visualization.frame_data(self._year, self._engine, self.hist_specs, self._totals)
+        self._totals = []
+        if self._frames is not None:
+            self._frames.write(frame)
+            return
+        if self.renderer is not None:
+            self.renderer.submit(frame)
+            return
+        self.visual.update(frame, self.cmax_animals, self.ymax_animals)
+        if save:
+            self.visual.save_plots()
+
+    def _recording(self):
+        """
+        True if anything but the log is recorded every year, so runs cannot be taken from the cache
+        """
+        return any(recorder is not None
+                   for recorder in (self._history, self._stats, self._density, self._frames))
+
+    def _cache_key(self, num_years):
+        """
+        Key of the run of num_years from the current state in the result cache
+        """
+        return self.cache.key(self._engine.export_columns(),
+                              engine=self.engine_name,
+                              rng_state=self._engine.get_rng_state(),
+                              params=checkpoint.get_parameters(),
+                              num_years=num_years)
 
+    def _restore_cached(self, key):
+        """
+        Sets the state at the end of a cached run and writes its log lines
+
+        :return: True if the run was in the cache
+        """
+        cached = self.cache.get(key)
+        if cached is None:
+            return False
+        columns, meta = cached
+        if self.digests is not None and 'digests' not in meta:
+            return False
+        counts = columns.pop('counts')
+        self._engine.import_columns(columns)
+        self._engine.set_rng_state(meta['rng_state'])
+        for index, (tot_herb, tot_carn) in enumerate(counts.tolist()):
+            if self.log_file is not None:
+                self.save_to_file((tot_herb, tot_carn))
+            if self.digests is not None:
+                self.digests.append(meta['digests'][index])
+                if self.log_file is not None:
+                    self.save_digest(self.digests[-1])
             self._year += 1
+        return True
 
     def add_population(self, population):
         """
@@ -190,7 +338,7 @@ class BioSim:
 
         :param population: List of dictionaries specifying population and location
         """
-        self.map.island_add_population(population)
+        self._engine.add_population(population)
 
     @property
     def year(self):
@@ -204,49 +352,245 @@ class BioSim:
         """
         Number of animals per species in island, as dictionary.
         """
-        self.map.island_total_sum_of_animals()
-        herb = self.map.island_total_herbivores
-        if herb is None:
-            herb = 0
+        return self._engine.num_animals_per_species()
+
+    def population_frame(self, species, as_arrays=False):
+        """
+        Age, weight, fitness and location of every animal of one species
 
-        carn = self.map.island_total_carnivores
-        if carn is None:
-            carn = 0
+        With the array engines age and weight are read-only views of the
+        engine's columns, not copies, so they must not be kept across years.
 
-        return {'Herbivore': herb, 'Carnivore': carn}
+        :param species: String, 'Herbivore' or 'Carnivore'
+        :param as_arrays: If True, return NumPy arrays even when pandas is installed
+        :return: pandas DataFrame with columns age, weight, fitness, row and col if
+                 pandas is installed, otherwise a dictionary of NumPy arrays
+        """
+        if species not in self._animal_species:
+            raise TypeError(f'{species} is not an animal species')
+        columns = self._engine.population_columns(species)
+        if pandas is None or as_arrays:
+            return columns
+        return pandas.DataFrame(columns, copy=False)
 
     @property
     def num_animals(self):
         """
         Total number of animals on island.
         """
-        pop = self.map.island_total_sum_of_animals()
-        if pop is None:
-            pop = 0
-
-        return pop
+        return sum(self.num_animals_per_species.values())
 
     def setup_logfile(self):
         """
-        Writes the first line to logfile
-        """
-        logfile = open(self.log_file, "w")
-        logfile.write("Year,Total_Herbivores,Total_Carnivores\n")
-        logfile.close()
+        Opens the log file and writes the first line, unless it is open already
 
-    def save_to_file(self):
+        A simulation that does not start at year 0, e.g. one loaded from a
+        checkpoint, continues an existing log file.
+        """
+        if self._log is None or self._log.path != self.log_file:
+            self.close_log()
+            self._log = LogWriter(self.log_file, "Year,Total_Herbivores,Total_Carnivores",
+                                  append=self._year > 0, background=self.log_thread)
+            if self.digests is not None:
+                self._digest_log = LogWriter(digest.digest_file_name(self.log_file), "Year,Digest",
+                                             append=self._year > 0, background=self.log_thread)
+
+    def save_to_file(self, counts=None):
         """
         Writes year, total herbivores and total carnivores to file
+
+        :param counts: herbivores and carnivores to write, defaults to the current numbers
+        """
+        if counts is None:
+            counts = self.num_animals_per_species.values()
+        tot_herb, tot_carn = counts
+        self._log.write(f"{self._year},{tot_herb},{tot_carn}")
+
+    def save_digest(self, state_digest):
+        """
+        Writes year and state digest to the digest file next to the log file
+        """
+        self._digest_log.write(f"{self._year},{state_digest}")
+
+    def flush_log(self):
+        """
+        Writes all buffered log lines and statistics records to file
+        """
+        for log in (self._log, self._digest_log, self._stats, self._density, self._frames):
+            if log is not None:
+                log.flush()
+
+    def close_log(self):
+        """
+        Writes all buffered log lines and closes the log files
+        """
+        for log in (self._log, self._digest_log):
+            if log is not None:
+                log.close()
+        self._log = None
+        self._digest_log = None
+
+    def close(self):
+        """
+        Writes all buffered records, closes the files the simulation keeps open
+        and stops the rendering process
+
+        The simulation can still be continued, the log file is opened again
+        and continued, and the rendering process started again, by the next
+        call to simulate.
+        """
+        self.flush_log()
+        self.close_log()
+        if self.renderer is not None:
+            self.renderer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _settings(self):
+        """
+        Returns the arguments BioSim was created with, apart from map, population and seed
+        """
+        return {'vis_years': self.vis_years, 'ymax_animals': self.ymax_animals,
+                'cmax_animals': self.cmax_animals, 'hist_specs': self.hist_specs,
+                'img_dir': self.img_dir, 'img_base': self.img_base, 'img_fmt': self.img_fmt,
+                'img_years': self.img_years, 'log_file': self.log_file,
+                'engine': self.engine_name, 'digests': self.digests is not None,
+                'log_thread': self.log_thread,
+                'renderer': None if self.renderer is None else self.renderer.policy,
+                'headless': self.headless, 'movie_stream': self.movie_stream, 'blit': self.blit}
+
+    def save_checkpoint(self, path):
+        """
+        Saves the full simulation state, so the run can be continued with load_checkpoint
+
+        :param path: name of the checkpoint file
+        """
+        meta = {'biosim_version': biosim.__version__,
+                'island_map': self.island_map,
+                'ini_pop': checkpoint.population_to_json(self.ini_pop),
+                'settings': self._settings(),
+                'year': self._year,
+                'img_ctr': self.visual._img_ctr,
+                'params': checkpoint.get_parameters(),
+                'rng_state': self._engine.get_rng_state(),
+                'digests': self.digests}
+        checkpoint.write(path, self._engine.export_columns(), meta)
+
+    @classmethod
+    def load_checkpoint(cls, path):
+        """
+        Creates a simulation from a checkpoint written by save_checkpoint
+
+        Animal and landscape parameters are set to the values stored in the
+        checkpoint, so the restored run continues exactly like the original.
+
+        :param path: name of the checkpoint file
+        :return: BioSim instance
+        """
+        columns, meta = checkpoint.read(path)
+        checkpoint.set_parameters(meta['params'])
+        sim = cls(meta['island_map'], checkpoint.population_from_json(meta['ini_pop']),
+                  seed=None, **meta['settings'])
+        sim._engine.import_columns(columns)
+        sim._engine.set_rng_state(meta['rng_state'])
+        sim._year = meta['year']
+        sim.visual._img_ctr = meta['img_ctr']
+        sim.digests = meta.get('digests')
+        return sim
+
+    def save_snapshot(self, path):
+        """
+        Writes the animals of the current year to a memory-mappable snapshot directory
+
+        :param path: directory to write, see :mod:`biosim.snapshot`
+        """
+        snapshot.write_snapshot(path, self._engine, self._year)
+
+    def branch(self, n, years, seeds=None, modify=None, workers=None):
+        """
+        Continues the simulation as several independent branches from the current state
+
+        Each branch runs in a process forked from this one, sharing the
+        animals copy-on-write. The simulation itself is not changed.
+
+        :param n: number of branches
+        :param years: number of years to simulate in each branch
+        :param seeds: one seed per branch, defaults to 0, 1, ..., n - 1
+        :param modify: function called as modify(branch, index) on the BioSim of each
+                       branch before it continues, e.g. to set parameters or add animals
+        :param workers: number of branches running at the same time, defaults to the number of CPUs
+        :return: array of shape (n, years, 2) with herbivore and carnivore counts per year
+        """
+        return branching.branch(self, n, years, seeds, modify, workers)
+
+    def record_history(self, path, base_every=50, compression='zlib'):
+        """
+        Stores the island state of every simulated year in a delta stream
+
+        :param path: directory of the stream, see :mod:`biosim.deltas`
+        :param base_every: number of years from one full base record to the next
+        :param compression: 'zlib' or 'lzma'
+        """
+        self._history = deltas.DeltaWriter(path, self.island_map, base_every, compression)
+
+    def record_statistics(self, path, chunk_years=64, append=False):
+        """
+        Writes births, deaths, kills, migrants and the distribution of age, weight
+        and fitness of each species for every simulated year to a .npy file
+
+        :param path: name of the file, see :mod:`biosim.yearstats`
+        :param chunk_years: number of years collected before they are written
+        :param append: if True, continue an existing file instead of replacing it
+        """
+        self._engine.record_events = True
+        self._stats = yearstats.StatsWriter(path, chunk_years, append)
+
+    def record_density(self, path, stride=1, weight=False, fodder=False, chunk_years=32):
+        """
+        Writes the number of animals of each species in each cell every stride years
+
+        :param path: directory of the recording, see :mod:`biosim.density`
+        :param stride: number of years between recorded grids
+        :param weight: if True, also record the mean weight per cell and species
+        :param fodder: if True, also record the fodder of each cell
+        :param chunk_years: number of recorded years per compressed chunk
+        """
+        self._density = density.DensityRecorder(path, self.island_map, stride, weight, fodder,
+                                                chunk_years)
+
+    def record_frames(self, path, chunk_frames=64):
+        """
+        Records the frame data of every image year instead of drawing it
+
+        The frames are drawn afterwards with :func:`biosim.frames.render`.
+
+        :param path: directory of the recording, see :mod:`biosim.frames`
+        :param chunk_frames: number of frames per compressed chunk
+        """
+        self._frames = frames.FrameRecorder(path, self.island_map, chunk_frames)
+
+    def add_snapshot(self, path):
+        """
+        Adds the animals of a snapshot to the island
+
+        The animals are read from the snapshot when they are first needed,
+        so large populations can be added without reading them up front.
+
+        :param path: snapshot directory written by save_snapshot
         """
-        logfile = open(self.log_file, "a")
-        tot_herb = self.map.island_total_herbivores
-        tot_carn = self.map.island_total_carnivores
-        logfile.write(f"{self._year},{tot_herb},{tot_carn}\n")
-        logfile.close()
+        snapshot.Snapshot(path).seed_engine(self._engine)
 
     def make_movie(self):
         """
         create MP4 movie from visualization images saved.
         The movie is stores in img_dir
         """
+        if self.renderer is not None and self.movie_stream:
+            # The movie is streamed from the rendering process, which finishes it when closed
+            self.renderer.close()
+            return
         self.visual.make_movie()
@@ -0,0 +1,199 @@
+"""
+Memory-mapped snapshots for biosim
+
+A snapshot is a directory holding the full animal state of one year: for
+each species the age, weight, fitness and cell of every animal as a
+separate ``.npy`` column, sorted by cell, and an offsets table telling
+where the animals of each cell start. :class:`Snapshot` opens the columns
+with ``numpy.memmap``, so opening is instant whatever the population
+size, only the pages actually read are loaded, and several processes
+reading the same snapshot share those pages.
+
+A snapshot can also seed a new simulation, see
+:meth:`biosim.simulation.BioSim.add_snapshot`. The reference engine then
+only creates the animal objects of a cell the first time the cell is
+used, the array engines use the columns copy-on-write.
+
+Example
+--------
+::
+
+    sim.save_snapshot('results/year_500')
+
+    snap = Snapshot('results/year_500')
+    weights = snap.column('Herbivore', 'weight')      # memmap, nothing read yet
+    cell = snap.cell('Herbivore', (10, 10))           # slices of the columns
+    density = snap.counts('Carnivore')                # (rows, columns) array
+
+"""
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.engines import ReferenceEngine
+from biosim.vectorized import _fitness
+
+import numpy as np
+import json
+import os
+
+SPECIES = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+COLUMNS = ('cell', 'age', 'weight', 'fitness')
+_META = 'snapshot.json'
+
+
+def write_snapshot(path, engine, year):
+    """
+    Writes the animals of an engine to a snapshot directory
+
+    :param path: directory to write, created if it does not exist
+    :param engine: engine holding the island, see :mod:`biosim.engines`
+    :param year: the year the state belongs to
+    """
+    os.makedirs(path, exist_ok=True)
+    columns = engine.export_columns()
+    lines = engine.string_map.splitlines()
+    shape = (len(lines), len(lines[0]))
+    num_cells = shape[0] * shape[1]
+    for species, species_class in SPECIES.items():
+        order = np.argsort(columns[species + '_cell'], kind='stable')
+        cell = columns[species + '_cell'][order]
+        age = columns[species + '_age'][order]
+        weight = columns[species + '_weight'][order]
+        data = {'cell': cell, 'age': age, 'weight': weight,
+                'fitness': _fitness(age, weight, species_class.params)}
+        for name in COLUMNS:
+            np.save(os.path.join(path, f'{species}_{name}.npy'), data[name])
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(cell, minlength=num_cells))))
+        np.save(os.path.join(path, f'{species}_offsets.npy'), offsets.astype(np.int64))
+
+    meta = {'island_map': engine.string_map, 'shape': shape, 'year': year}
+    with open(os.path.join(path, _META), 'w') as file:
+        json.dump(meta, file)
+
+
+class _PendingCell:
+    """
+    Animals of one cell of a snapshot, created when the cell is first used
+    """
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    def counts(self):
+        return tuple(int(self.snapshot._offsets[species][self.index + 1] -
+                         self.snapshot._offsets[species][self.index])
+                     for species in SPECIES)
+
+    def load(self):
+        animals = []
+        for species, species_class in SPECIES.items():
+            data = self.snapshot._slice(species, self.index)
+            animals.append([species_class(age, weight) for age, weight in
+                            zip(data['age'].tolist(), data['weight'].tolist())])
+        return animals
+
+
+class Snapshot:
+    """
+    Read access to a snapshot directory through memory-mapped columns
+
+    self.string_map: the island map as a multiline string
+
+    self.shape: number of rows and columns of the island
+
+    self.year: the year the snapshot was taken
+    """
+    def __init__(self, path):
+        """
+        Opens the columns of a snapshot, without reading them
+
+        :param path: snapshot directory written by :func:`write_snapshot`
+        """
+        self.path = path
+        with open(os.path.join(path, _META)) as file:
+            meta = json.load(file)
+        self.string_map = meta['island_map']
+        self.shape = tuple(meta['shape'])
+        self.year = meta['year']
+        # Copy-on-write, so engines seeded from the snapshot can change the columns
+        self._columns = {species: {name: np.load(os.path.join(path, f'{species}_{name}.npy'),
+                                                 mmap_mode='c')
+                                   for name in COLUMNS}
+                         for species in SPECIES}
+        self._offsets = {species: np.load(os.path.join(path, f'{species}_offsets.npy'),
+                                          mmap_mode='r')
+                         for species in SPECIES}
+
+    def _index(self, loc):
+        """
+        Returns the row-major cell index of a location counted from 1
+        """
+        row, col = loc[0] - 1, loc[1] - 1
+        if not (0 <= row < self.shape[0] and 0 <= col < self.shape[1]):
+            raise ValueError(f'{loc} is not on the island')
+        return row * self.shape[1] + col
+
+    def _slice(self, species, index):
+        start, stop = self._offsets[species][index], self._offsets[species][index + 1]
+        return {name: column[start:stop] for name, column in self._columns[species].items()}
+
+    def column(self, species, name):
+        """
+        One column for all animals of a species, sorted by cell
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :param name: 'cell', 'age', 'weight' or 'fitness'
+        :return: memory-mapped array
+        """
+        return self._columns[species][name]
+
+    def cell(self, species, loc):
+        """
+        The animals of one species in one cell
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :param loc: location tuple counted from 1, as in population lists
+        :return: dictionary of memory-mapped slices, one per column
+        """
+        return self._slice(species, self._index(loc))
+
+    def num_animals(self, species):
+        """
+        Number of animals of one species on the island
+        """
+        return int(self._offsets[species][-1])
+
+    def counts(self, species):
+        """
+        Number of animals of one species in each cell
+
+        :return: array (rows, columns)
+        """
+        return np.diff(self._offsets[species]).reshape(self.shape)
+
+    def seed_engine(self, engine):
+        """
+        Adds the animals of the snapshot to an engine without creating them all up front
+
+        :param engine: engine of an island with the same map
+        """
+        if engine.string_map != self.string_map:
+            raise ValueError('Snapshot was taken on a different island')
+
+        if isinstance(engine, ReferenceEngine):
+            for index, cell in enumerate(engine.map.map_dict.values()):
+                if any(self._offsets[species][index + 1] > self._offsets[species][index]
+                       for species in SPECIES):
+                    cell.cell_add_lazy_population(_PendingCell(self, index))
+                    cell.cell_sum_of_animals()
+            return
+
+        columns = engine.export_columns()
+        for species in SPECIES:
+            for name in ('cell', 'age', 'weight'):
+                key = f'{species}_{name}'
+                if len(columns[key]):
+                    columns[key] = np.concatenate((columns[key], self._columns[species][name]))
+                else:
+                    # Nothing to merge with, the memory-mapped column is used as it is
+                    columns[key] = self._columns[species][name]
+        engine.import_columns(columns)
@@ -0,0 +1,268 @@
+"""
+Summaries of animal attributes for biosim
+
+Instead of handing every animal's age, weight and fitness around as
+lists, an engine summarises each attribute of each species in one pass
+over its columns, see :meth:`biosim.engines.Engine.summaries`. A
+:class:`Summary` holds
+
+* a :class:`Histogram` with fixed bins, what the visualization draws,
+  also computed on its own by :func:`histograms`
+* :class:`Moments`, the count, mean and variance (Welford)
+* a :class:`QuantileSketch`, giving any percentile with a bounded
+  relative error (DDSketch)
+
+All three can be merged, so summaries of parts of the island, e.g. of
+single cells or regions, add up to the summary of the whole, and
+summaries of several runs can be pooled::
+
+    north = engine.summaries(hist_specs, region=north_cells)['Herbivore']['weight']
+    south = engine.summaries(hist_specs, region=south_cells)['Herbivore']['weight']
+    both = north.merge(south)
+    both.moments.mean, both.sketch.quantile(0.9), both.histogram.counts
+
+"""
+
+import numpy as np
+import math as m
+
+SPECIES = ('Herbivore', 'Carnivore')
+ATTRIBUTES = ('age', 'weight', 'fitness')
+
+DEFAULT_HIST_SPECS = {'weight': {'max': 20, 'delta': 2},
+                      'age': {'max': 40, 'delta': 2},
+                      'fitness': {'max': 1, 'delta': 0.05}}
+
+
+def hist_edges(spec):
+    """
+    Bin edges of a histogram specification, as used by the visualization
+
+    :param spec: dictionary with 'max' and 'delta'
+    """
+    return np.arange(0, spec['max'], spec['delta'])
+
+
+class Moments:
+    """
+    Count, mean and variance of a stream of values, updated with Welford's method
+    """
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values):
+        """
+        Adds a batch of values
+
+        :param values: array of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            batch_mean = values.mean()
+            self._combine(len(values), batch_mean, float(((values - batch_mean) ** 2).sum()))
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        """
+        Returns the moments of both streams together
+        """
+        merged = Moments(self.count, self.mean, self.m2)
+        merged._combine(other.count, other.mean, other.m2)
+        return merged
+
+    @property
+    def variance(self):
+        """
+        Sample variance, NaN for fewer than two values
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+
+class Histogram:
+    """
+    Counts of values in fixed bins
+    """
+    def __init__(self, edges):
+        """
+        :param edges: bin edges, values outside them are not counted
+        """
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(max(len(self.edges) - 1, 0), dtype=np.int64)
+
+    def update(self, values):
+        """
+        Adds a batch of values
+
+        :param values: array of values
+        """
+        if len(self.counts):
+            self.counts += np.histogram(values, bins=self.edges)[0]
+        return self
+
+    def merge(self, other):
+        """
+        Returns the histogram of both streams together, the bins must be the same
+        """
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError('Histograms with different bins cannot be merged')
+        merged = Histogram(self.edges)
+        merged.counts = self.counts + other.counts
+        return merged
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with bounded relative error (DDSketch)
+
+    Values are counted in buckets whose bounds grow geometrically, so a
+    quantile is known to within the relative accuracy whatever the
+    number of values. Values at or below min_value share one bucket.
+    """
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        """
+        :param relative_accuracy: largest relative error of a quantile
+        :param min_value: smallest value told apart from zero
+        """
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = m.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        """
+        Number of values added
+        """
+        return self.zero_count + sum(self.buckets.values())
+
+    def update(self, values):
+        """
+        Adds a batch of values
+
+        :param values: array of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        small = values <= self.min_value
+        self.zero_count += int(small.sum())
+        keys = np.ceil(np.log(values[~small]) / self._log_gamma).astype(np.int64)
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            self.buckets[int(key)] = self.buckets.get(int(key), 0) + int(count)
+        return self
+
+    def merge(self, other):
+        """
+        Returns the sketch of both streams together, the accuracy must be the same
+        """
+        if self.relative_accuracy != other.relative_accuracy:
+            raise ValueError('Sketches with different accuracy cannot be merged')
+        merged = QuantileSketch(self.relative_accuracy, self.min_value)
+        merged.zero_count = self.zero_count + other.zero_count
+        merged.buckets = dict(self.buckets)
+        for key, count in other.buckets.items():
+            merged.buckets[key] = merged.buckets.get(key, 0) + count
+        return merged
+
+    def quantile(self, q):
+        """
+        Estimate of the q-quantile, NaN if there are no values
+
+        :param q: number between 0 and 1
+        """
+        count = self.count
+        if count == 0:
+            return float('nan')
+        rank = q * (count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+class Summary:
+    """
+    Histogram, moments and quantile sketch of one attribute
+    """
+    def __init__(self, edges, relative_accuracy=0.01):
+        """
+        :param edges: bin edges of the histogram
+        :param relative_accuracy: relative accuracy of the quantile sketch
+        """
+        self.histogram = Histogram(edges)
+        self.moments = Moments()
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, values):
+        """
+        Adds a batch of values to all parts of the summary
+        """
+        self.histogram.update(values)
+        self.moments.update(values)
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """
+        Returns the summary of both streams together
+        """
+        merged = Summary(self.histogram.edges, self.sketch.relative_accuracy)
+        merged.histogram = self.histogram.merge(other.histogram)
+        merged.moments = self.moments.merge(other.moments)
+        merged.sketch = self.sketch.merge(other.sketch)
+        return merged
+
+
+def histograms(columns, hist_specs=None, mask=None):
+    """
+    Histograms of the attributes of one species, without moments and sketches
+
+    :param columns: dictionary with arrays 'age', 'weight' and 'fitness'
+    :param hist_specs: histogram specifications as taken by BioSim, missing ones use defaults
+    :param mask: boolean array selecting the animals to count, all if None
+    :return: dictionary mapping attribute to Histogram
+    """
+    specs = dict(DEFAULT_HIST_SPECS, **(hist_specs or {}))
+    result = {}
+    for attribute in ATTRIBUTES:
+        values = np.asarray(columns[attribute], dtype=np.float64)
+        if mask is not None:
+            values = values[mask]
+        result[attribute] = Histogram(hist_edges(specs[attribute])).update(values)
+    return result
+
+
+def summarize(columns, hist_specs=None, relative_accuracy=0.01, mask=None):
+    """
+    Summarises the attributes of one species
+
+    :param columns: dictionary with arrays 'age', 'weight' and 'fitness'
+    :param hist_specs: histogram specifications as taken by BioSim, missing ones use defaults
+    :param relative_accuracy: relative accuracy of the quantile sketches
+    :param mask: boolean array selecting the animals to summarise, all if None
+    :return: dictionary mapping attribute to Summary
+    """
+    specs = dict(DEFAULT_HIST_SPECS, **(hist_specs or {}))
+    summaries = {}
+    for attribute in ATTRIBUTES:
+        values = np.asarray(columns[attribute], dtype=np.float64)
+        if mask is not None:
+            values = values[mask]
+        summaries[attribute] = Summary(hist_edges(specs[attribute]),
+                                       relative_accuracy).update(values)
+    return summaries
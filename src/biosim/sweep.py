@@ -0,0 +1,227 @@
+"""
+Parameter sweep for biosim
+
+Runs one island under every combination of a parameter grid and a list
+of seeds, scheduled on a pool of worker processes. Each finished run is
+written at once to a results directory, so a sweep that is interrupted
+can be started again and only the missing runs are simulated.
+
+Parameters are named as ``'<species or landscape>.<parameter>'``, the
+same names used by :meth:`biosim.simulation.BioSim.set_animal_parameters`
+and :meth:`biosim.simulation.BioSim.set_landscape_parameters`.
+
+Example
+--------
+::
+
+    from biosim.sweep import Sweep, parameter_grid
+
+    grid = parameter_grid({'Herbivore.zeta': [3.0, 3.5],
+                           'Carnivore.DeltaPhiMax': [9.0, 10.0],
+                           'L.f_max': [700, 800]})
+    sweep = Sweep(geogr, ini_pop, grid, seeds=range(10), years=200,
+                  store='results/zeta_sweep', workers=8)
+    sweep.run()
+    params, counts = sweep.results()   # counts has shape (8, 10, 200, 2)
+
+"""
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.landscapes import Lowland, Highland
+from biosim.ensemble import _apply_parameters, _parse_map, _simulate_counts
+
+import multiprocessing as mp
+import numpy as np
+import itertools
+import hashlib
+import pickle
+import json
+import os
+
+_PARAM_CLASSES = {'Herbivore': Herbivore, 'Carnivore': Carnivore, 'L': Lowland, 'H': Highland}
+_MANIFEST = 'sweep.json'
+
+_worker = {}
+
+
+def _nested_params(params):
+    """
+    Turns dotted parameter names into the nested form,
+    e.g. {'L.f_max': 700} -> {'L': {'f_max': 700}}
+
+    :param params: dictionary with dotted names or already nested dictionaries
+    """
+    nested = {}
+    for name, value in params.items():
+        if isinstance(value, dict):
+            nested.setdefault(name, {}).update(value)
+        else:
+            owner, _, parameter = name.partition('.')
+            if not parameter:
+                raise KeyError(f'{name} is not of the form <species or landscape>.<parameter>')
+            nested.setdefault(owner, {})[parameter] = value
+    return nested
+
+
+def parameter_grid(grid):
+    """
+    Expands a grid of parameter values to a list of parameter dicts, one per combination
+
+    :param grid: dictionary mapping dotted parameter names to lists of values
+    :return: list of nested parameter dicts
+    """
+    names = list(grid)
+    return [_nested_params(dict(zip(names, values)))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_key(params, seed):
+    """
+    Returns the name a run is stored under in the results directory
+
+    :param params: nested parameter dict of the run
+    :param seed: seed of the run
+    """
+    text = json.dumps({'params': params, 'seed': seed}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _init_worker(engine_bytes, ini_pop, defaults, store):
+    """
+    Prepares a worker process, runs once per worker
+
+    :param engine_bytes: the pickled engine holding the parsed island map
+    :param ini_pop: list of dictionaries specifying initial population
+    :param defaults: parameters every run starts from
+    :param store: path to the results directory
+    """
+    _worker['engine'] = engine_bytes
+    _worker['ini_pop'] = ini_pop
+    _worker['defaults'] = defaults
+    _worker['store'] = store
+
+
+def _run_sweep_point(task):
+    """
+    Runs one parameter set and seed in a worker process and stores the counts
+
+    :param task: tuple of run key, nested parameter dict, seed and number of years
+    """
+    key, params, seed, num_years = task
+    for name, values in _worker['defaults'].items():
+        _PARAM_CLASSES[name].params.update(values)
+    _apply_parameters(params)
+
+    engine = pickle.loads(_worker['engine'])
+    engine.reseed(seed)
+    engine.add_population(_worker['ini_pop'])
+    counts = np.zeros((num_years, 2), dtype=np.int64)
+    _simulate_counts(engine, num_years, counts)
+
+    path = os.path.join(_worker['store'], key + '.npy')
+    with open(path + '.tmp', 'wb') as file:
+        np.save(file, counts)
+    os.replace(path + '.tmp', path)
+    return key
+
+
+class Sweep:
+    """
+    Simulates an island for every combination of parameter set and seed
+    """
+    def __init__(self, island_map, ini_pop, param_sets, seeds, years, store, workers=None,
+                 engine='reference'):
+        """
+        :param island_map: multi-line string specifying island geography
+        :param ini_pop: list of dictionaries specifying initial population
+        :param param_sets: list of parameter dicts, nested or with dotted names,
+                           e.g. the output of :func:`parameter_grid`
+        :param seeds: iterable of integer seeds, each parameter set is run once per seed
+        :param years: number of years to simulate for each run
+        :param store: path to the results directory, created if it does not exist
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param engine: name of the engine simulating the island, see :mod:`biosim.engines`
+
+        The animal and landscape parameters set when the sweep is created are
+        the defaults every run starts from. They are stored with the sweep, so
+        a store holding runs made under other defaults is not reused.
+        """
+        self.island_map = island_map
+        self.ini_pop = ini_pop
+        self.param_sets = [_nested_params(params) for params in param_sets]
+        self.seeds = list(seeds)
+        self.years = years
+        self.store = store
+        self.workers = workers
+        self.engine = engine
+        self.defaults = {name: dict(cls.params) for name, cls in _PARAM_CLASSES.items()}
+        for params in self.param_sets:
+            for name in params:
+                if name not in _PARAM_CLASSES:
+                    raise KeyError(f'cannot assign parameters to {name}')
+
+        os.makedirs(self.store, exist_ok=True)
+        self._check_manifest()
+
+    def _check_manifest(self):
+        """
+        Writes the sweep description to the store, or checks that it matches the one found there
+        """
+        manifest = {'island_map': self.island_map, 'ini_pop': self.ini_pop, 'engine': self.engine,
+                    'param_sets': self.param_sets, 'seeds': self.seeds, 'years': self.years,
+                    'defaults': self.defaults}
+        manifest = json.loads(json.dumps(manifest))
+        path = os.path.join(self.store, _MANIFEST)
+        if os.path.exists(path):
+            with open(path) as file:
+                found = json.load(file)
+            for key in ('island_map', 'ini_pop', 'engine', 'years', 'defaults'):
+                if found.get(key) != manifest[key]:
+                    raise ValueError(f'{self.store} holds a sweep with different {key}')
+        with open(path, 'w') as file:
+            json.dump(manifest, file)
+
+    def _path(self, params, seed):
+        return os.path.join(self.store, run_key(params, seed) + '.npy')
+
+    def pending(self):
+        """
+        Returns the runs that have no result in the store yet
+
+        :return: list of (parameter dict, seed) tuples
+        """
+        return [(params, seed) for params in self.param_sets for seed in self.seeds
+                if not os.path.exists(self._path(params, seed))]
+
+    def run(self):
+        """
+        Simulates all runs missing from the store
+
+        :return: number of runs simulated
+        """
+        tasks = [(run_key(params, seed), params, seed, self.years)
+                 for params, seed in self.pending()]
+        if not tasks:
+            return 0
+
+        engine_bytes = _parse_map(self.island_map, self.engine)
+        with mp.Pool(self.workers, initializer=_init_worker,
+                     initargs=(engine_bytes, self.ini_pop, self.defaults, self.store)) as pool:
+            for _ in pool.imap_unordered(_run_sweep_point, tasks):
+                pass
+        return len(tasks)
+
+    def results(self):
+        """
+        Loads the counts of all runs from the store
+
+        :return: list of parameter dicts and an array of shape (param_sets, seeds, years, 2),
+                 runs that have not finished are filled with -1
+        """
+        counts = np.full((len(self.param_sets), len(self.seeds), self.years, 2), -1, dtype=np.int64)
+        for i, params in enumerate(self.param_sets):
+            for j, seed in enumerate(self.seeds):
+                path = self._path(params, seed)
+                if os.path.exists(path):
+                    counts[i, j] = np.load(path)
+        return self.param_sets, counts
@@ -0,0 +1,437 @@
+"""
+Array based island for biosim
+
+:class:`ArrayIsland` simulates the same model as :class:`biosim.island_map.Map`,
+but stores the animals of each species as NumPy columns (replicate, cell,
+age, weight) instead of one object per animal. The columns carry a
+replicate index, so one call to :meth:`ArrayIsland.update_one_year`
+advances many independent replicates of the same island at once.
+
+The landscape, fodder and neighbour tables are shared by all
+replicates, while every replicate draws its random numbers from its
+own generator. A replicate therefore gives the same result whether it
+is simulated alone or together with others.
+
+The phases are NumPy operations over whole columns. When Numba is
+installed they run through the compiled loop kernels in
+:mod:`biosim.kernels` instead, and hunting always does.
+
+Animal and landscape parameters are read from the ``params`` dicts of
+:class:`biosim.animals.Herbivore`, :class:`biosim.animals.Carnivore`
+and the landscape classes, so
+:meth:`biosim.simulation.BioSim.set_animal_parameters` and
+:meth:`biosim.simulation.BioSim.set_landscape_parameters` apply here too.
+
+Example
+--------
+::
+
+    island = ArrayIsland(geogr, replicates=1000, seed=1)
+    island.add_population(ini_herbs)
+    for _ in range(300):
+        island.update_one_year()
+    herbivores = island.counts()[:, 0]   # one count per replicate
+
+"""
+
+from biosim.animals import Herbivore, Carnivore
+from biosim.landscapes import Lowland, Highland, Dessert, Water
+from biosim.island_map import Map
+from biosim import kernels
+
+import numpy as np
+
+_SPECIES = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
+_LANDSCAPES = {'W': Water, 'L': Lowland, 'H': Highland, 'D': Dessert}
+_COLUMNS = {'rep': np.int64, 'cell': np.int64, 'age': np.int64, 'weight': np.float64}
+
+
+def _empty_population():
+    """
+    Returns a population without animals
+    """
+    return {key: np.zeros(0, dtype=dtype) for key, dtype in _COLUMNS.items()}
+
+
+def _fitness(age, weight, params):
+    """
+    Calculates the fitness of many animals at once,
+    see :meth:`biosim.animals.Animal.calculate_fitness`
+
+    :param age: array of ages
+    :param weight: array of weights
+    :param params: parameter dict of the species
+    """
+    q_plus = 1 / (1 + np.exp(params['phi_age'] * (age - params['a_half'])))
+    q_minus = 1 / (1 + np.exp(-params['phi_weight'] * (weight - params['w_half'])))
+    return np.where(weight <= 0, 0.0, q_plus * q_minus)
+
+
+def _fitness_args(params):
+    """
+    Returns the fitness parameters of a species in the order the kernels take them
+    """
+    return (float(params['phi_age']), float(params['a_half']),
+            float(params['phi_weight']), float(params['w_half']))
+
+
+def _order_within_groups(groups, key):
+    """
+    Returns the order sorting animals by group and, within each group, by descending key
+
+    :param groups: integer group index of each animal
+    :param key: value between 0 and 1 for each animal, e.g. fitness
+    """
+    return np.argsort(groups - 0.5 * key)
+
+
+class ArrayIsland:
+    """Island storing the animals of many replicates in NumPy arrays"""
+    def __init__(self, island_map, replicates=1, seed=None, seeds=None, jit=None):
+        """
+        Creates the landscape tables and one random generator per replicate
+
+        :param island_map: a multiline string representing the map
+        :param replicates: number of independent replicates
+        :param seed: seed from which the generators of all replicates are spawned
+        :param seeds: list with one seed per replicate, replaces replicates and seed if given
+        :param jit: run the phases through the compiled kernels in :mod:`biosim.kernels`,
+                    by default whenever Numba is installed. Without Numba the NumPy
+                    implementation is used regardless.
+
+        self.fodder: array (replicates, cells) with the fodder left in each cell
+
+        self.population: dictionary mapping species to a dictionary of columns
+
+        self.migrants: array (replicates, 2) with the herbivores and carnivores that
+        moved in the last migration
+        """
+        Map.validate_map(island_map)
+        self.jit = kernels.HAVE_NUMBA and jit is not False
+        self.string_map = island_map
+        lines = island_map.splitlines()
+        self.shape = (len(lines), len(lines[0]))
+        self.num_cells = self.shape[0] * self.shape[1]
+        self._landscape = np.array([list(line) for line in lines]).ravel()
+        self._livable = self._landscape != 'W'
+
+        rows, cols = np.divmod(np.arange(self.num_cells), self.shape[1])
+        steps = [(0, 1), (0, -1), (-1, 0), (1, 0)]  # right, left, up, down
+        self._neighbours = np.empty((self.num_cells, 4), dtype=np.int64)
+        for direction, (d_row, d_col) in enumerate(steps):
+            new_rows, new_cols = rows + d_row, cols + d_col
+            inside = ((new_rows >= 0) & (new_rows < self.shape[0]) &
+                      (new_cols >= 0) & (new_cols < self.shape[1]))
+            self._neighbours[:, direction] = np.where(inside, new_rows * self.shape[1] + new_cols,
+                                                      np.arange(self.num_cells))
+
+        self.replicates = len(seeds) if seeds is not None else replicates
+        self.reseed(seed, seeds)
+        # The animals of each species are always kept sorted by replicate
+        self.fodder = np.zeros((self.replicates, self.num_cells))
+        self.population = {species: _empty_population() for species in _SPECIES}
+        self.migrants = np.zeros((self.replicates, len(_SPECIES)), dtype=np.int64)
+
+    def reseed(self, seed=None, seeds=None):
+        """
+        Restarts the random generators of all replicates
+
+        :param seed: seed from which the generators of all replicates are spawned
+        :param seeds: list with one seed per replicate, replaces seed if given
+        """
+        if seeds is None:
+            seeds = np.random.SeedSequence(seed).spawn(self.replicates)
+        if len(seeds) != self.replicates:
+            raise ValueError(f'Need one seed per replicate, got {len(seeds)} for {self.replicates}')
+        self._rngs = [np.random.default_rng(s) for s in seeds]
+
+    def get_rng_states(self):
+        """
+        Returns the state of the generator of each replicate
+        """
+        return [rng.bit_generator.state for rng in self._rngs]
+
+    def set_rng_states(self, states):
+        """
+        Restores generator states returned by get_rng_states
+
+        :param states: list with one state per replicate
+        """
+        for rng, state in zip(self._rngs, states):
+            rng.bit_generator.state = state
+
+    def _cell_index(self, loc):
+        """
+        Returns the flat cell index of a (row, column) location counted from 1
+
+        :param loc: location tuple as used in population lists
+        """
+        row, col = loc[0] - 1, loc[1] - 1
+        if not (0 <= row < self.shape[0] and 0 <= col < self.shape[1]):
+            raise ValueError(f'{loc} is not on the island')
+        return row * self.shape[1] + col
+
+    def _draw(self, rep, method, *args):
+        """
+        Draws one random number per animal from the generator of its replicate
+
+        :param rep: sorted replicate index of each animal
+        :param method: name of the generator method, e.g. 'random' or 'normal'
+        :param args: arguments passed on to the generator method
+        """
+        if len(rep) == 0:
+            return np.zeros(0)
+        sizes = np.bincount(rep, minlength=self.replicates)
+        return np.concatenate([getattr(rng, method)(*args, size=size)
+                               for rng, size in zip(self._rngs, sizes)])
+
+    def _groups(self, pop):
+        """
+        Returns the replicate and cell combined into one group index per animal
+        """
+        return pop['rep'] * self.num_cells + pop['cell']
+
+    @staticmethod
+    def _take(pop, index):
+        """
+        Keeps or reorders the animals of a population
+
+        :param pop: dictionary of columns
+        :param index: boolean mask or index array
+        """
+        for key in pop:
+            pop[key] = pop[key][index]
+
+    def add_population(self, population, replicate=None):
+        """
+        Adds population to the island
+
+        :param population: list of dictionaries containing location and list of animals
+        :param replicate: replicate to add the animals to, all replicates if None
+        """
+        replicates = range(self.replicates) if replicate is None else [replicate]
+        for d in population:
+            cell = self._cell_index(d['loc'])
+            if not self._livable[cell]:
+                raise TypeError('Cannot add animals to water cell')
+            for species in _SPECIES:
+                animals = [a for a in d['pop'] if a['species'] == species]
+                if not animals:
+                    continue
+                age = np.array([a['age'] for a in animals], dtype=np.int64)
+                weight = np.array([a['weight'] for a in animals], dtype=np.float64)
+                if (age < 0).any():
+                    raise ValueError('Age has to be a positive integr')
+                if (weight < 0).any():
+                    raise ValueError('Weight has to be positive interg or zero')
+                new = {'rep': np.repeat(np.array(replicates, dtype=np.int64), len(animals)),
+                       'cell': np.full(len(animals) * len(replicates), cell, dtype=np.int64),
+                       'age': np.tile(age, len(replicates)),
+                       'weight': np.tile(weight, len(replicates))}
+                self._append(species, new)
+
+    def _append(self, species, new):
+        """
+        Adds animals to a population, keeping the animals sorted by replicate
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :param new: dictionary of columns for the new animals
+        """
+        pop = self.population[species]
+        for key in pop:
+            pop[key] = np.concatenate((pop[key], new[key].astype(_COLUMNS[key])))
+        self._take(pop, np.argsort(pop['rep'], kind='stable'))
+
+    def feeding(self):
+        """
+        Herbivores eat fodder in descending order of fitness, then carnivores hunt
+        """
+        f_max = np.array([_LANDSCAPES[ch].params['f_max'] for ch in self._landscape], dtype=float)
+        self.fodder[:] = np.where(self._livable, f_max, 0)
+
+        herb = self.population['Herbivore']
+        params = Herbivore.params
+        if len(herb['rep']) > 0:
+            fitness = _fitness(herb['age'], herb['weight'], params)
+            groups = self._groups(herb)
+            order = _order_within_groups(groups, fitness)
+            fodder = self.fodder.ravel()
+            if self.jit:
+                kernels.feed_herbivores(order, groups, herb['weight'], fodder,
+                                        float(params['F']), float(params['beta']))
+            else:
+                sorted_groups = groups[order]
+                rank = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups)
+                eaten = np.clip(fodder[sorted_groups] - rank * params['F'], 0, params['F'])
+                herb['weight'][order] += params['beta'] * eaten
+                fodder -= np.bincount(sorted_groups, weights=eaten, minlength=fodder.size)
+
+        self._hunting()
+
+    def _hunting(self):
+        """
+        Carnivores hunt herbivores in the same cell, in random order
+        """
+        herb = self.population['Herbivore']
+        carn = self.population['Carnivore']
+        if len(herb['rep']) == 0 or len(carn['rep']) == 0:
+            return
+
+        herb_fitness = _fitness(herb['age'], herb['weight'], Herbivore.params)
+        herb_order = _order_within_groups(self._groups(herb), herb_fitness)
+        self._take(herb, herb_order)
+        herb_fitness = herb_fitness[herb_order]
+        carn_order = _order_within_groups(self._groups(carn), self._draw(carn['rep'], 'random'))
+        self._take(carn, carn_order)
+
+        herb_groups = self._groups(herb)
+        carn_groups = self._groups(carn)
+        groups = np.intersect1d(herb_groups, carn_groups)
+        herb_start = np.searchsorted(herb_groups, groups)
+        herb_count = np.searchsorted(herb_groups, groups, 'right') - herb_start
+        carn_start = np.searchsorted(carn_groups, groups)
+        carn_count = np.searchsorted(carn_groups, groups, 'right') - carn_start
+
+        num_rand = herb_count * carn_count
+        rand_start = np.concatenate(([0], np.cumsum(num_rand)[:-1])).astype(np.int64)
+        per_replicate = np.bincount(groups // self.num_cells, weights=num_rand,
+                                    minlength=self.replicates).astype(np.int64)
+        rand = np.concatenate([rng.random(size) for rng, size in zip(self._rngs, per_replicate)])
+
+        alive = kernels.hunt(herb_fitness, herb['weight'], herb_start, herb_count,
+                             carn['age'], carn['weight'], carn_start, carn_count,
+                             rand, rand_start, Carnivore.params)
+        self._take(herb, alive)
+
+    def procreation(self):
+        """
+        Each animal may give birth to one child, see :meth:`biosim.animals.Animal.birth`
+        """
+        for species, species_class in _SPECIES.items():
+            pop = self.population[species]
+            if len(pop['rep']) == 0:
+                continue
+            params = species_class.params
+            groups = self._groups(pop)
+            num_in_group = np.bincount(groups, minlength=self.replicates * self.num_cells)
+            w_child = self._draw(pop['rep'], 'normal', params['w_birth'], params['sigma_birth'])
+            p = self._draw(pop['rep'], 'random')
+
+            if self.jit:
+                born = np.empty(len(groups), dtype=np.bool_)
+                kernels.birth_mask(groups, num_in_group, pop['age'], pop['weight'], w_child, p,
+                                   born, *_fitness_args(params),
+                                   float(params['gamma']), float(params['zeta']),
+                                   float(params['xi']), float(params['w_birth']),
+                                   float(params['sigma_birth']))
+            else:
+                # As in OneGrid.cell_procreation, N counts down through the animals of a cell
+                order = np.argsort(groups, kind='stable')
+                sorted_groups = groups[order]
+                rank = np.empty(len(groups), dtype=np.int64)
+                rank[order] = np.arange(len(groups)) - np.searchsorted(sorted_groups, sorted_groups)
+                num_animals = num_in_group[groups] - rank
+
+                fitness = _fitness(pop['age'], pop['weight'], params)
+                lost_weight = w_child * params['xi']
+                zero_condition = params['zeta'] * (params['w_birth'] + params['sigma_birth'])
+                p_birth = np.minimum(1, params['gamma'] * fitness * (num_animals - 1))
+                born = ((pop['weight'] >= lost_weight) & (w_child > 0) &
+                        (pop['weight'] >= zero_condition) & (p < p_birth))
+                pop['weight'][born] -= lost_weight[born]
+            self._append(species, {'rep': pop['rep'][born], 'cell': pop['cell'][born],
+                                   'age': np.zeros(born.sum(), dtype=np.int64),
+                                   'weight': w_child[born]})
+
+    def migration(self):
+        """
+        Each animal moves at most once, to a random neighbouring cell that is not water
+        """
+        self.migrants[:] = 0
+        for index, (species, species_class) in enumerate(_SPECIES.items()):
+            pop = self.population[species]
+            if len(pop['rep']) == 0:
+                continue
+            params = species_class.params
+            before = pop['cell'].copy()
+            rand_move = self._draw(pop['rep'], 'random')
+            rand_direction = self._draw(pop['rep'], 'random')
+            if self.jit:
+                kernels.migrate(pop['cell'], pop['age'], pop['weight'], rand_move, rand_direction,
+                                self._neighbours, self._livable, float(params['mu']),
+                                *_fitness_args(params))
+            else:
+                fitness = _fitness(pop['age'], pop['weight'], params)
+                moves = rand_move < params['mu'] * fitness
+                direction = np.minimum((rand_direction * 4).astype(np.int64), 3)
+                target = self._neighbours[pop['cell'], direction]
+                moves &= self._livable[target]
+                pop['cell'][moves] = target[moves]
+            self.migrants[:, index] = np.bincount(pop['rep'][pop['cell'] != before],
+                                                  minlength=self.replicates)
+
+    def aging(self):
+        """
+        Ages all the animals on the island
+        """
+        for pop in self.population.values():
+            pop['age'] += 1
+
+    def weight_loss(self):
+        """
+        Annual weight loss of all animals
+        """
+        for species, species_class in _SPECIES.items():
+            pop = self.population[species]
+            pop['weight'] -= pop['weight'] * species_class.params['eta']
+            np.maximum(pop['weight'], 0, out=pop['weight'])
+
+    def death(self):
+        """
+        Kills animals by probability, see :meth:`biosim.animals.Animal.death`
+        """
+        for species, species_class in _SPECIES.items():
+            pop = self.population[species]
+            if len(pop['rep']) == 0:
+                continue
+            params = species_class.params
+            p = self._draw(pop['rep'], 'random')
+            if self.jit:
+                alive = np.empty(len(p), dtype=np.bool_)
+                kernels.survivors(pop['age'], pop['weight'], p, alive, float(params['omega']),
+                                  *_fitness_args(params))
+            else:
+                fitness = _fitness(pop['age'], pop['weight'], params)
+                alive = ~((pop['weight'] == 0) | (p < params['omega'] * (1 - fitness)))
+            self._take(pop, alive)
+
+    def update_one_year(self):
+        """
+        Updates all replicates one year, in the same order as :meth:`Map.island_update_one_year`
+        """
+        self.feeding()
+        self.procreation()
+        self.migration()
+        self.aging()
+        self.weight_loss()
+        self.death()
+
+    def counts(self):
+        """
+        Number of animals of each species in each replicate
+
+        :return: array (replicates, 2) with herbivore and carnivore counts
+        """
+        return np.stack([np.bincount(self.population[species]['rep'], minlength=self.replicates)
+                         for species in _SPECIES], axis=1)
+
+    def cell_counts(self, species):
+        """
+        Number of animals of one species in each cell of each replicate
+
+        :param species: 'Herbivore' or 'Carnivore'
+        :return: array (replicates, rows, columns)
+        """
+        groups = self._groups(self.population[species])
+        counts = np.bincount(groups, minlength=self.replicates * self.num_cells)
+        return counts.reshape((self.replicates,) + self.shape)
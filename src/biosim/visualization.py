@@ -10,6 +10,12 @@ Inspired by Hans Ekkehard Plesser Graphics ile from randvis prodject
 Link: https://gitlab.com/nmbu.no/emner/inf200/h2021/inf200-course-materials/-/blob/main/january_block/examples/randvis_project/src/randvis/graphics.py
 """
 
+from biosim.summaries import DEFAULT_HIST_SPECS, hist_edges
+from biosim.pyramid import CountPyramid
+from biosim.series import PopulationSeries
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 import numpy as np
 import subprocess
@@ -20,17 +26,54 @@ _DEFAULT_NAME = 'sim'
 _DEFAULT_FORMAT = 'png'
 _DEFAULT_MOVIE_FORMAT = 'mp4'
 
+_DEFAULT_MOVIE_FPS = 25
+
 _FFMPEG_BINARY = 'ffmpeg'
 _MAGICK_BINARY = 'magick'
 
 
+def frame_data(year, engine, hist_specs=None, totals=None):
+    """
+    Collects what is drawn for one year, so it can be drawn without the engine
+
+    The frame holds only small arrays: the count matrix of each species,
+    the histogram bins of age, weight and fitness and the animal totals.
+    It can be sent to another process, see :mod:`biosim.rendering`.
+
+    :param year: the year of the frame
+    :param engine: engine object holding the island
+    :param hist_specs: dictionary with maximum and bin width of each histogram
+    :param totals: list of (year, herbivores, carnivores) to plot, defaults to the totals
+                   of this year
+    :return: dictionary with 'year', 'counts', 'histograms' and 'totals'
+    """
+    if totals is None:
+        numbers = engine.num_animals_per_species()
+        totals = [(year, numbers['Herbivore'], numbers['Carnivore'])]
+    histograms = engine.histograms(hist_specs)
+    return {'year': year,
+            'counts': {species: engine.count_grid(species)
+                       for species in ('Herbivore', 'Carnivore')},
+            'histograms': {species: {attribute: (histogram.counts, histogram.edges)
+                                     for attribute, histogram in histograms[species].items()}
+                           for species in ('Herbivore', 'Carnivore')},
+            'totals': totals}
+
+
 class Visualization:
     """ Visualizes the results from biosim"""
-    def __init__(self, img_dir=None, img_name=None, img_fmt=None):
+    def __init__(self, img_dir=None, img_name=None, img_fmt=None, headless=False,
+                 movie_stream=False, blit=False):
         """
         :param img_dir: directory for image files to be stored
         :param img_name: start of image name
         :param img_fmt: format of image
+        :param headless: if True, the figure is drawn on an Agg canvas without pyplot,
+                         no window is shown and only saved images are drawn
+        :param movie_stream: if True, saved images are not written as files but piped as raw
+                             frames into ffmpeg, which writes the movie, see :meth:`make_movie`
+        :param blit: if True, the window keeps a copy of the unchanging parts of the figure and
+                     each update only draws the heat maps, lines, histograms and title over it
 
         self._img_ctr: updates picture nr
 
@@ -52,6 +95,8 @@ class Visualization:
 
         self_carn_line: The line in population graph represented by number of carnivores
 
+        self._population: The counts drawn by the population lines, see :mod:`biosim.series`
+
         self._fitness_ax: The subplot containing fitness
 
         self._weight_ax: The subplot containing weight
@@ -69,6 +114,13 @@ class Visualization:
 
         self._img_fmt = img_fmt if img_fmt is not None else _DEFAULT_FORMAT
         self._img_ctr = 0
+        self.headless = headless
+        self.movie_stream = movie_stream
+        self._movie = None
+        self.blit = blit and not headless
+        self._background = None
+        self._draw_handler = None
+        self._title = None
         self._fig = None
         self._map_ax = None
         self._herb_ax = None
@@ -78,9 +130,12 @@ class Visualization:
         self._pop_ax = None
         self._herb_line = None
         self._carn_line = None
+        self._population = PopulationSeries()
         self._fitness_ax = None
         self._weight_ax = None
         self._age_ax = None
+        self._hist_steps = None
+        self._hist_edges = None
 
     def _color_map(self, island_map):
         """
@@ -92,21 +147,26 @@ class Visualization:
                   'D': (1.0, 1.0, 0.5)}
 
         colour_map = [[colour[column] for column in row]
-                      for row in island_map.string_map.splitlines()]
-        self._img_ax = plt.imshow(colour_map)
+                      for row in island_map.splitlines()]
+        self._img_ax = self._map_ax.imshow(colour_map)
 
-    def setup(self, island_map, final_year, y_max=500):
+    def setup(self, island_map, final_year, y_max=500, hist_specs=None):
         """
         Prepares for plotting
         has to be called before :meth: 'update_plot'
 
-        :param island_map: map object containing all info about island
+        :param island_map: the island map as a multiline string
         :param final_year: the final year of the simulation
         :param y_max: is the maximum of animals given from file
+        :param hist_specs: dictionary with maximum and bin width of each histogram
         """
         # create new plot window
         if self._fig is None:
-            self._fig = plt.figure(figsize=(10, 8))
+            if self.headless:
+                self._fig = Figure(figsize=(10, 8))
+                FigureCanvasAgg(self._fig)
+            else:
+                self._fig = plt.figure(figsize=(10, 8))
 
         if self._map_ax is None:
             self._map_ax = self._fig.add_subplot(3, 2, 1)
@@ -129,6 +189,16 @@ class Visualization:
         if self._fitness_ax is None:
             self._fitness_ax = self._fig.add_subplot(3, 3, 9)
 
+        if self._hist_steps is None:
+            self._setup_histograms(hist_specs)
+
+        if self.blit and self._draw_handler is None:
+            if self._fig.canvas.supports_blit:
+                self._draw_handler = self._fig.canvas.mpl_connect('draw_event', self._on_draw)
+                plt.show(block=False)
+            else:
+                self.blit = False
+
         if self._pop_ax is None:
             self._pop_ax = self._fig.add_subplot(3, 2, 2)
             self._pop_ax.title.set_text('Population of island')
@@ -142,182 +212,287 @@ class Visualization:
         self._pop_ax.set_xlim(0, final_year+1)
 
         if self._herb_line is None:
-            pop_plot = self._pop_ax.plot(np.arange(0, final_year+1), np.full(final_year+1, np.nan))
-            self._herb_line = pop_plot[0]
-        else:
-            x_data, y_data = self._herb_line.get_data()
-            x_new = np.arange(x_data[-1] + 1, final_year + 1)
-            if len(x_new) > 0:
-                y_new = np.full(x_new.shape, np.nan)
-                self._herb_line.set_data(np.hstack((x_data, x_new)), np.hstack((y_data, y_new)))
-
-        if self._carn_line is None:
-            pop_plot = self._pop_ax.plot(np.arange(0, final_year + 1), np.full(final_year + 1, np.nan))
-            self._carn_line = pop_plot[0]
+            self._herb_line, self._carn_line = self._pop_ax.plot([], [], [], [])
             self._pop_ax.legend(['herb', 'carn'])
 
-        else:
-            x_data, y_data = self._carn_line.get_data()
-            x_new = np.arange(x_data[-1] + 1, final_year + 1)
-            if len(x_new) > 0:
-                y_new = np.full(x_new.shape, np.nan)
-                self._carn_line.set_data(np.hstack((x_data, x_new)), np.hstack((y_data, y_new)))
-
         self._fig.subplots_adjust(hspace=0.40)
 
-    def update(self, year, island_map, cmax, hist_specs, y_max=None):
+    def update(self, frame, cmax, y_max=None):
         """
-        Updates plot with current year
+        Updates plot with the data of one year
 
-        :param y_max: the range y-value is sett to in the graph
-        :param year: is the year the simulation currently is in
-        :param island_map: is the island map object to be plotted
+        :param frame: frame data of the year, see :func:`frame_data`
         :param cmax: is a dictionary containing colorbar maxes for herbivore and carnivore heat map
-        :param hist_specs: is a dictionary containing specifications for histograms of age weight and fitness
+        :param y_max: the range y-value is sett to in the graph
         """
         if cmax is None:
             cmax = {'Herbivore': 200,
                     'Carnivore': 50}
 
-        self._fig.suptitle(f'Simulation, Year: {year}', fontsize=16)
-        self._update_herb_map(island_map, cmax)
-        self._update_carn_map(island_map, cmax)
-        self._update_pop_graph(year, island_map, y_max)
-        self._update_age_weight_fitness(island_map, hist_specs)
-        self._fig.canvas.flush_events()
-        plt.pause(1e-6)
+        limits = self._limits() if self.blit else None
+        self._title = self._fig.suptitle(f'Simulation, Year: {frame["year"]}', fontsize=16)
+        self._update_herb_map(frame['counts']['Herbivore'], cmax)
+        self._update_carn_map(frame['counts']['Carnivore'], cmax)
+        self._update_pop_graph(frame['totals'], y_max)
+        self._update_age_weight_fitness(frame['histograms'])
+        if self.blit:
+            self._blit(limits != self._limits())
+        elif not self.headless:
+            self._fig.canvas.flush_events()
+            plt.pause(1e-6)
+
+    def _limits(self):
+        """
+        Axis limits of the graphs whose limits follow the data
+        """
+        return [(ax.get_xlim(), ax.get_ylim())
+                for ax in (self._pop_ax, self._age_ax, self._weight_ax, self._fitness_ax)]
 
-    def _update_herb_map(self, island_map, cmax):
+    def _fit_ylim(self, ax, top):
         """
-        Plots the population of herbivores on the map by color
+        Sets the upper y limit of a graph to top
 
-        :param island_map: is the island_map object containing info about the simulation
-        :param cmax: is a dictionary containing colorbar maxes for herbivore and carnivore heat map
+        When blitting, the limit is only changed if top is above it or below half
+        of it, and then with room to grow, so the whole figure is seldom redrawn.
         """
-        nested_list = list(map(list, island_map.string_map.splitlines()))
-        x = 1
-        for i in range(len(nested_list)):
-            y = 1
-            for j in range(len(nested_list[0])):
-                if island_map.map_dict[(x, y)].population_sum_herb is None:
-                    nested_list[i][j] = 0
-                else:
-                    nested_list[i][j] = island_map.map_dict[(x, y)].population_sum_herb
-                y += 1
-            x += 1
+        if not self.blit:
+            ax.set_ylim(0, top)
+            return
+        current = ax.get_ylim()[1]
+        if top > current or top < current / 2:
+            ax.set_ylim(0, top * 1.5)
+
+    def _animated_artists(self):
+        """
+        The artists that change from year to year
+        """
+        artists = [self._title, self._herb_plot, self._carn_plot, self._herb_line,
+                   self._carn_line]
+        for steps in self._hist_steps.values():
+            artists.extend(steps)
+        return [artist for artist in artists if artist is not None]
 
-        matrix = np.array(nested_list)
+    def _draw_animated(self):
+        for artist in self._animated_artists():
+            self._fig.draw_artist(artist)
 
+    def _on_draw(self, event):
+        """
+        Keeps a copy of the figure without the changing artists after every full draw
+        """
+        canvas = self._fig.canvas
+        if canvas.is_saving():
+            return
+        self._background = canvas.copy_from_bbox(self._fig.bbox)
+        self._draw_animated()
+
+    def _blit(self, redraw):
+        """
+        Shows the updated artists, drawing the whole figure only if redraw is True
+
+        :param redraw: True if something outside the changing artists, like axis limits, changed
+        """
+        canvas = self._fig.canvas
+        for artist in self._animated_artists():
+            artist.set_animated(True)
+        if redraw or self._background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self._background)
+            self._draw_animated()
+        canvas.blit(self._fig.bbox)
+        canvas.flush_events()
+
+    @staticmethod
+    def _shown_resolution(ax, matrix):
+        """
+        The counts at the resolution the axes can show
+
+        Maps with more cells than the axes have pixels are drawn as the block
+        means of the first level of a :class:`biosim.pyramid.CountPyramid` that fits.
+
+        :param ax: the axes of the heat map
+        :param matrix: number of animals in each cell
+        """
+        box = ax.get_window_extent()
+        height, width = max(int(box.height), 1), max(int(box.width), 1)
+        if matrix.shape[0] <= height and matrix.shape[1] <= width:
+            return matrix
+        pyramid = CountPyramid(matrix)
+        return pyramid.means(pyramid.level_for(height, width))
+
+    def _update_herb_map(self, matrix, cmax):
+        """
+        Plots the population of herbivores on the map by color
+
+        :param matrix: number of herbivores in each cell
+        :param cmax: is a dictionary containing colorbar maxes for herbivore and carnivore heat map
+        """
+        rows, cols = np.shape(matrix)
+        matrix = self._shown_resolution(self._herb_ax, matrix)
         if self._herb_plot is None:
-            self._herb_plot = self._herb_ax.imshow(matrix, interpolation='nearest', vmin=0, vmax=cmax['Herbivore'])
-            plt.colorbar(self._herb_plot, ax=self._herb_ax)
+            self._herb_plot = self._herb_ax.imshow(matrix, interpolation='nearest',
+                                                   vmin=0, vmax=cmax['Herbivore'],
+                                                   extent=(-0.5, cols - 0.5, rows - 0.5, -0.5))
+            self._fig.colorbar(self._herb_plot, ax=self._herb_ax)
             self._herb_ax.set_title('Herbivore heat map')
         else:
             self._herb_plot.set_data(matrix)
 
-    def _update_carn_map(self, island_map, cmax):
+    def _update_carn_map(self, matrix, cmax):
         """
         Plots the population of carnivores on the map by color
 
-        :param island_map: is the island_map object containing info about the simulation
+        :param matrix: number of carnivores in each cell
         :param cmax: dictionary containing default values for colorbar max
         """
-        nested_list = list(map(list, island_map.string_map.splitlines()))
-        x = 1
-        for i in range(len(nested_list)):
-            y = 1
-            for j in range(len(nested_list[0])):
-                if island_map.map_dict[(x, y)].population_sum_carn is None:
-                    nested_list[i][j] = 0
-                else:
-                    nested_list[i][j] = island_map.map_dict[(x, y)].population_sum_carn
-                y += 1
-            x += 1
-
-        matrix = np.array(nested_list)
+        rows, cols = np.shape(matrix)
+        matrix = self._shown_resolution(self._carn_ax, matrix)
         if self._carn_plot is None:
-            self._carn_plot = self._carn_ax.imshow(matrix, interpolation='nearest', vmin=0, vmax=cmax['Carnivore'])
-            plt.colorbar(self._carn_plot, ax=self._carn_ax)
+            self._carn_plot = self._carn_ax.imshow(matrix, interpolation='nearest',
+                                                   vmin=0, vmax=cmax['Carnivore'],
+                                                   extent=(-0.5, cols - 0.5, rows - 0.5, -0.5))
+            self._fig.colorbar(self._carn_plot, ax=self._carn_ax)
             self._carn_ax.set_title('Carnivore Heat map')
         else:
             self._carn_plot.set_data(matrix)
 
-    def _update_age_weight_fitness(self, island_map, hist_specs=None):
+    def _setup_histograms(self, hist_specs=None):
+        """
+        Makes the step artists of the age, weight and fitness histograms, with empty bins
+
+        :param hist_specs: dictionary with maximum and bin width of each histogram
+        """
+        specs = dict(DEFAULT_HIST_SPECS, **(hist_specs or {}))
+        self._hist_steps = {}
+        self._hist_edges = {}
+        for attribute, ax, title, legend in (
+                ('age', self._age_ax, 'Age', ['herb', 'carn']),
+                ('weight', self._weight_ax, 'Weight', ['Herb', 'Carn']),
+                ('fitness', self._fitness_ax, 'Fitness', ['Herb', 'Carn'])):
+            edges = hist_edges(specs[attribute])
+            self._hist_edges[attribute] = edges
+            self._hist_steps[attribute] = [ax.stairs(np.zeros(max(len(edges) - 1, 0)), edges)
+                                           for _ in ('Herbivore', 'Carnivore')]
+            ax.set_title(title)
+            ax.legend(legend)
+            if len(edges) > 1:
+                ax.set_xlim(edges[0], edges[-1])
+
+    def _update_age_weight_fitness(self, histograms):
         """
         Updates the histograms of age, weight and fitness,
 
-        :param island_map: island_map object containing all info about island
-        :param hist_specs:
-        """
-        if hist_specs is None:
-            hist_specs = {
-                'weight': {'max': 20, 'delta': 2},
-                'age': {'max': 40, 'delta': 2},
-                'fitness': {'max': 1, 'delta': 0.05}
-            }
-
-        herb, carn = island_map.island_age_weight_fitness()
-        self._age_ax.cla()
-        self._age_ax.set_title('Age')
-        self._age_ax.hist(herb['age'], histtype='step',
-                          bins=np.arange(0, hist_specs['age']['max'], hist_specs['age']['delta']))
-        self._age_ax.hist(carn['age'], histtype='step',
-                          bins=np.arange(0, hist_specs['age']['max'], hist_specs['age']['delta']))
-        self._age_ax.legend(['herb', 'carn'])
-
-        self._weight_ax.cla()
-        self._weight_ax.set_title('Weight')
-        self._weight_ax.hist(herb['weight'], histtype='step',
-                             bins=np.arange(0, hist_specs['weight']['max'], hist_specs['weight']['delta']))
-        self._weight_ax.hist(carn['weight'], histtype='step',
-                             bins=np.arange(0, hist_specs['weight']['max'], hist_specs['weight']['delta']))
-
-        self._weight_ax.legend(['Herb', 'Carn'])
-
-        self._fitness_ax.cla()
-        self._fitness_ax.set_title('Fitness')
-        self._fitness_ax.hist(herb['fitness'], histtype='step',
-                              bins=np.arange(0, hist_specs['fitness']['max'], hist_specs['fitness']['delta']))
-        self._fitness_ax.hist(carn['fitness'], histtype='step',
-                              bins=np.arange(0, hist_specs['fitness']['max'], hist_specs['fitness']['delta']))
-
-        self._fitness_ax.legend(['Herb', 'Carn'])
-
-    def _update_pop_graph(self, year, island_map, y_max):
+        Only the data of the step artists made in setup is changed, the y-axis
+        is fitted to the highest bin.
+
+        :param histograms: dictionary mapping species and attribute to bin counts and edges
+        """
+        for attribute, ax in (('age', self._age_ax), ('weight', self._weight_ax),
+                              ('fitness', self._fitness_ax)):
+            top = 0
+            for species, steps in zip(('Herbivore', 'Carnivore'), self._hist_steps[attribute]):
+                counts, edges = histograms[species][attribute]
+                counts = np.asarray(counts)
+                if np.array_equal(edges, self._hist_edges[attribute]):
+                    steps.set_data(counts)
+                else:
+                    steps.set_data(counts, edges)
+                top = max(top, counts.max(initial=0))
+            if not np.array_equal(edges, self._hist_edges[attribute]):
+                self._hist_edges[attribute] = edges
+                if len(edges) > 1:
+                    ax.set_xlim(edges[0], edges[-1])
+            self._fit_ylim(ax, max(top, 1) * 1.05)
+
+    def _update_pop_graph(self, totals, y_max):
         """
         Plotting the animals in the animal number graph by years
 
-        :param year: what year it is in used for x axis in this case
-        :param island_map: island_map object containing all info about island
+        :param totals: list of (year, herbivores, carnivores) not plotted yet
+        :param y_max: the range y-value is sett to in the graph
         """
-        y_data_herb = self._herb_line.get_ydata()
-        y_data_herb[year] = island_map.island_total_herbivores
-        self._herb_line.set_ydata(y_data_herb)
-
-        y_data_carn = self._carn_line.get_ydata()
-        y_data_carn[year] = island_map.island_total_carnivores
-        self._carn_line.set_ydata(y_data_carn)
-        plt.pause(1e-6)
+        for year, tot_herb, tot_carn in totals:
+            self._population.add(year, tot_herb, tot_carn)
+        years, counts = self._population.decimated()
+        self._herb_line.set_data(years, counts[:, 0])
+        self._carn_line.set_data(years, counts[:, 1])
+        if not self.headless and not self.blit:
+            plt.pause(1e-6)
 
         if y_max is None:
-            self._pop_ax.set_ylim(0, max(y_data_herb)+500)
+            self._fit_ylim(self._pop_ax, self._population.max + 500)
 
     def save_plots(self):
         """
-        Saves plot to file if filename given
+        Saves plot to file if filename given, or adds it to the movie stream
         """
         if self._img_base is None:
             return
 
-        self._fig.savefig('{base}_{num:05d}.{type}'.format(base=self._img_base, num=self._img_ctr, type=self._img_fmt))
+        # Artists drawn by blitting are left out of figure draws, also when saving
+        animated = self._animated_artists() if self.blit else []
+        for artist in animated:
+            artist.set_animated(False)
+        if self.movie_stream:
+            self._stream_frame()
+        else:
+            self._fig.savefig('{base}_{num:05d}.{type}'.format(base=self._img_base,
+                                                               num=self._img_ctr,
+                                                               type=self._img_fmt))
+        for artist in animated:
+            artist.set_animated(True)
         self._img_ctr += 1
 
+    def _stream_frame(self):
+        """
+        Renders the figure to raw RGBA pixels and writes them to the ffmpeg process
+
+        ffmpeg is started with the first frame and finished by :meth:`finish_movie`.
+        """
+        dpi = self._fig.dpi
+        if self._movie is None:
+            width, height = (self._fig.get_size_inches() * dpi).round().astype(int)
+            try:
+                # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
+                # section "Compatibility", the padding gives the even size yuv420p needs
+                self._movie = subprocess.Popen([_FFMPEG_BINARY,
+                                                '-f', 'rawvideo',
+                                                '-pix_fmt', 'rgba',
+                                                '-s', f'{width}x{height}',
+                                                '-r', str(_DEFAULT_MOVIE_FPS),
+                                                '-i', '-',
+                                                '-y',
+                                                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                                                '-profile:v', 'baseline',
+                                                '-level', '3.0',
+                                                '-pix_fmt', 'yuv420p',
+                                                '{}.{}'.format(self._img_base,
+                                                               _DEFAULT_MOVIE_FORMAT)],
+                                               stdin=subprocess.PIPE)
+            except OSError as err:
+                raise RuntimeError('ERROR: ffmpeg could not be started: {}'.format(err))
+        self._fig.savefig(self._movie.stdin, format='rgba', dpi=dpi)
+
+    def finish_movie(self):
+        """
+        Closes the movie stream and waits for ffmpeg to write the movie
+        """
+        if self._movie is None:
+            return
+        self._movie.stdin.close()
+        returncode = self._movie.wait()
+        self._movie = None
+        if returncode != 0:
+            raise RuntimeError('ERROR: ffmpeg failed with exit code {}'.format(returncode))
+
     def make_movie(self, movie_fmt=None):
         """
         Creates MP4 movie from visualization images saved.
 
         Requires ffmpeg for MP4 and magick for GIF
         The movie is stored as img_base + movie_fmt
+        With movie_stream the frames are already in ffmpeg, only finishing the MP4 is left
         """
         if self._img_base is None:
             raise RuntimeError("No filename defined.")
@@ -325,6 +500,12 @@ class Visualization:
         if movie_fmt is None:
             movie_fmt = _DEFAULT_MOVIE_FORMAT
 
+        if self.movie_stream:
+            if movie_fmt != _DEFAULT_MOVIE_FORMAT:
+                raise ValueError('Streamed movies can only be mp4')
+            self.finish_movie()
+            return
+
         if movie_fmt == 'mp4':
             try:
                 # Parameters chosen according to http://trac.ffmpeg.org/wiki/Encode/H.264,
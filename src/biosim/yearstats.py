@@ -0,0 +1,177 @@
+"""
+Columnar per-year statistics for biosim
+
+Besides the CSV log, a simulation can write one record per year with
+the number of animals, births, deaths, kills and migrants of each
+species and the mean and percentiles of their age, weight and fitness.
+The records are stored in a NumPy ``.npy`` file of a structured dtype,
+so the whole series is opened with one call, memory-mapped, and each
+statistic is a column::
+
+    sim = BioSim(geogr, ini_pop, seed=1, vis_years=0)
+    sim.record_statistics('results/run_001.npy')
+    sim.simulate(10000)
+
+    stats = read_statistics('results/run_001.npy')
+    births = stats['Herbivore_births']
+    median_weight = stats['Carnivore_weight_p50']
+
+Records are collected in memory and appended to the file in chunks of
+``chunk_years``. After each chunk the shape in the file header is
+updated, so the file can be read at any time and holds all complete
+chunks. The header has room for any number of years, so it is rewritten
+in place.
+"""
+
+import numpy as np
+import ast
+import os
+
+SPECIES = ('Herbivore', 'Carnivore')
+EVENTS = ('births', 'deaths', 'kills', 'migrants')
+ATTRIBUTES = ('age', 'weight', 'fitness')
+PERCENTILES = (5, 25, 50, 75, 95)
+
+_MAGIC = b'\x93NUMPY\x01\x00'
+_HEADER_SIZE = 4096
+
+
+def _fields():
+    fields = [('year', np.int64)]
+    for species in SPECIES:
+        fields.append((f'{species}_count', np.int64))
+        fields.extend((f'{species}_{event}', np.int64) for event in EVENTS)
+        for attribute in ATTRIBUTES:
+            fields.append((f'{species}_{attribute}_mean', np.float64))
+            fields.extend((f'{species}_{attribute}_p{q}', np.float64) for q in PERCENTILES)
+    return fields
+
+
+DTYPE = np.dtype(_fields())
+
+
+def year_record(year, engine):
+    """
+    Returns the statistics of the current state of an engine
+
+    Births, deaths, kills and migrants are taken from engine.events, which
+    the engine only fills when engine.record_events is True. Statistics of
+    a species without animals are NaN.
+
+    :param year: the year of the record
+    :param engine: engine holding the island, see :mod:`biosim.engines`
+    :return: array of one element with dtype DTYPE
+    """
+    record = np.zeros(1, dtype=DTYPE)
+    record['year'] = year
+    counts = engine.num_animals_per_species()
+    for species, data in zip(SPECIES, engine.age_weight_fitness()):
+        record[f'{species}_count'] = counts[species]
+        if engine.events is not None:
+            for event in EVENTS:
+                record[f'{species}_{event}'] = engine.events[species][event]
+        for attribute in ATTRIBUTES:
+            values = np.asarray(data[attribute], dtype=np.float64)
+            if len(values) == 0:
+                record[f'{species}_{attribute}_mean'] = np.nan
+                for q in PERCENTILES:
+                    record[f'{species}_{attribute}_p{q}'] = np.nan
+                continue
+            record[f'{species}_{attribute}_mean'] = values.mean()
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                record[f'{species}_{attribute}_p{q}'] = value
+    return record
+
+
+def _header(length):
+    """
+    Returns the .npy header for length records, always _HEADER_SIZE bytes long
+    """
+    description = {'descr': np.lib.format.dtype_to_descr(DTYPE), 'fortran_order': False,
+                   'shape': (length,)}
+    text = repr(description).encode('latin1')
+    free = _HEADER_SIZE - len(_MAGIC) - 2 - len(text) - 1
+    if free < 0:
+        raise ValueError('Statistics record too large for the header')
+    text += b' ' * free + b'\n'
+    return _MAGIC + len(text).to_bytes(2, 'little') + text
+
+
+def _stored_length(path):
+    """
+    Number of records in an existing statistics file
+    """
+    with open(path, 'rb') as file:
+        head = file.read(_HEADER_SIZE)
+    if not head.startswith(_MAGIC) or len(head) != _HEADER_SIZE:
+        raise ValueError(f'{path} is not a biosim statistics file')
+    description = ast.literal_eval(head[len(_MAGIC) + 2:].decode('latin1'))
+    if np.dtype(description['descr']) != DTYPE:
+        raise ValueError(f'{path} holds statistics of another format')
+    return description['shape'][0]
+
+
+class StatsWriter:
+    """
+    Appends per-year statistics records to a .npy file in chunks
+    """
+    def __init__(self, path, chunk_years=64, append=False):
+        """
+        Opens the statistics file
+
+        :param path: name of the .npy file
+        :param chunk_years: number of records collected before they are written
+        :param append: if True, records are added to an existing file, otherwise it is replaced
+        """
+        self.path = path
+        self.chunk_years = chunk_years
+        self._records = []
+        if append and os.path.exists(path):
+            self._length = _stored_length(path)
+            # Drop anything after the last complete chunk, e.g. from an interrupted write
+            with open(path, 'r+b') as file:
+                file.truncate(_HEADER_SIZE + self._length * DTYPE.itemsize)
+        else:
+            self._length = 0
+            with open(path, 'wb') as file:
+                file.write(_header(0))
+
+    def __len__(self):
+        return self._length + len(self._records)
+
+    def write(self, year, engine):
+        """
+        Adds the record of one year
+
+        :param year: the year of the record
+        :param engine: engine holding the island, see :mod:`biosim.engines`
+        """
+        self._records.append(year_record(year, engine))
+        if len(self._records) >= self.chunk_years:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the collected records to the file and updates its header
+        """
+        if not self._records:
+            return
+        chunk = np.concatenate(self._records)
+        with open(self.path, 'r+b') as file:
+            file.seek(_HEADER_SIZE + self._length * DTYPE.itemsize)
+            file.write(chunk.tobytes())
+            file.flush()
+            self._length += len(chunk)
+            file.seek(0)
+            file.write(_header(self._length))
+        self._records = []
+
+
+def read_statistics(path):
+    """
+    Opens a statistics file without reading it
+
+    :param path: name of the .npy file
+    :return: memory-mapped structured array, one element per year
+    """
+    return np.load(path, mmap_mode='r')
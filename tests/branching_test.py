@@ -0,0 +1,108 @@
+from biosim.simulation import BioSim
+from biosim.animals import Carnivore
+from biosim import branching
+import numpy as np
+import pytest
+import time
+
+
+class TestBranching:
+    """
+    Test continuing one simulation as several branches
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, island_map, herbivores, carnivores):
+        self.island_map = island_map
+        self.herbs = herbivores
+        self.carns = carnivores
+        self.sim = BioSim(self.island_map, self.herbs, seed=2, vis_years=0)
+        self.sim.simulate(5)
+        self.carn_params = dict(Carnivore.params)
+        yield
+        Carnivore.params.update(self.carn_params)
+
+    def expected(self, seed, years, carnivores=False):
+        """
+        Counts of a branch simulated directly in this process
+        """
+        sim = BioSim(self.island_map, self.herbs, seed=2, vis_years=0)
+        sim.simulate(5)
+        sim._engine.reseed(seed)
+        if carnivores:
+            sim.add_population(self.carns)
+        counts = []
+        for _ in range(years):
+            sim._engine.update_one_year()
+            counts.append(list(sim.num_animals_per_species.values()))
+        return counts
+
+    @pytest.mark.parametrize('fork', [True, False])
+    def test_branches_match_direct_runs(self, fork, mocker):
+        """
+        Test that each branch continues exactly as a run from the same state would
+        """
+        if not fork:
+            mocker.patch('biosim.branching.can_fork', return_value=False)
+        elif not branching.can_fork():
+            pytest.skip('fork not available')
+
+        def add_carnivores(branch, index):
+            if index == 1:
+                branch.add_population(self.carns)
+
+        counts = self.sim.branch(2, 4, seeds=[7, 8], modify=add_carnivores, workers=2)
+        assert counts.shape == (2, 4, 2)
+        np.testing.assert_array_equal(counts[0], self.expected(7, 4))
+        np.testing.assert_array_equal(counts[1], self.expected(8, 4, carnivores=True))
+
+    def test_more_branches_than_workers(self):
+        """
+        Test that all branches run when new ones start as others finish
+        """
+        if not branching.can_fork():
+            pytest.skip('fork not available')
+
+        def slow_first(branch, index):
+            if index == 0:
+                time.sleep(0.5)
+
+        counts = self.sim.branch(5, 3, seeds=range(10, 15), modify=slow_first, workers=2)
+        for index in range(5):
+            np.testing.assert_array_equal(counts[index], self.expected(10 + index, 3))
+
+    @pytest.mark.parametrize('fork', [True, False])
+    def test_parent_unchanged(self, fork, mocker):
+        """
+        Test that branching leaves the simulation and the parameters as they were
+        """
+        if not fork:
+            mocker.patch('biosim.branching.can_fork', return_value=False)
+        before = self.sim.num_animals_per_species
+
+        def change(branch, index):
+            branch.set_animal_parameters('Carnivore', {'F': 1.0})
+            branch.add_population(self.carns)
+
+        self.sim.branch(2, 2, modify=change)
+        assert self.sim.num_animals_per_species == before
+        assert Carnivore.params['F'] == self.carn_params['F']
+
+    def test_failing_branch(self):
+        """
+        Test that an error in a forked branch is reported
+        """
+        if not branching.can_fork():
+            pytest.skip('fork not available')
+
+        def fail(branch, index):
+            raise RuntimeError('broken branch')
+
+        with pytest.raises(RuntimeError):
+            self.sim.branch(1, 2, modify=fail)
+
+    def test_wrong_number_of_seeds(self):
+        """
+        Test that the number of seeds must match the number of branches
+        """
+        with pytest.raises(ValueError):
+            self.sim.branch(3, 2, seeds=[1, 2])
@@ -0,0 +1,124 @@
+from biosim.simulation import BioSim
+from biosim.cache import ResultCache
+from biosim import checkpoint, ensemble
+import numpy as np
+import pytest
+import os
+
+
+class TestResultCache:
+    """
+    Test storing, finding and evicting cached results
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_cache(self, tmp_path):
+        self.cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10**6)
+
+    def test_key_depends_on_inputs(self):
+        """
+        Test that keys are stable and change with any input
+        """
+        columns = {'a': np.arange(3)}
+        key = self.cache.key(columns, seed=1, params={'x': 1})
+        assert key == self.cache.key({'a': np.arange(3)}, params={'x': 1}, seed=1)
+        assert key != self.cache.key(columns, seed=2, params={'x': 1})
+        assert key != self.cache.key({'a': np.arange(4)}, seed=1, params={'x': 1})
+
+    def test_put_get(self):
+        """
+        Test that a stored result is found again
+        """
+        self.cache.put('abc', {'counts': np.ones((2, 2), dtype=np.int64)}, {'year': 3})
+        columns, meta = self.cache.get('abc')
+        assert meta['year'] == 3
+        assert columns['counts'].sum() == 4
+        assert self.cache.get('other') is None
+
+    def test_least_recently_used_evicted(self):
+        """
+        Test that the entries used longest ago are removed when the cache is full
+        """
+        data = {'data': np.zeros(50000)}
+        self.cache.put('first', data)
+        self.cache.put('second', data)
+        os.utime(os.path.join(self.cache.path, 'first.npz'), ns=(1, 1))
+        os.utime(os.path.join(self.cache.path, 'second.npz'), ns=(2, 2))
+        self.cache.get('first')
+        self.cache.put('third', data)
+        assert self.cache.get('second') is None
+        assert self.cache.get('first') is not None
+        assert self.cache.size() <= self.cache.max_bytes
+
+
+class TestCachedSimulation:
+    """
+    Test that BioSim and the ensemble runner use the cache
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'cache')
+        self.tmp_path = tmp_path
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_hit_restores_run(self, engine, mocker):
+        """
+        Test that a cached run gives the same state and log without simulating
+        """
+        logs = []
+        sims = []
+        for index in range(2):
+            log_file = str(self.tmp_path / f'log_{index}.csv')
+            sim = BioSim(self.island_map, self.pop, seed=3, vis_years=0, log_file=log_file,
+                         engine=engine, cache=self.path)
+            if index == 1:
+                update = mocker.spy(sim._engine, 'update_one_year')
+            sim.simulate(4)
+            sim.simulate(3)
+            sims.append(sim)
+            with open(log_file) as file:
+                logs.append(file.read())
+        assert update.call_count == 0
+        assert logs[0] == logs[1]
+        assert sims[1].year == 7
+        assert sims[0]._engine.export_population() == sims[1]._engine.export_population()
+
+    def test_continues_like_uncached(self):
+        """
+        Test that a simulation restored from the cache goes on like one that was simulated
+        """
+        plain = BioSim(self.island_map, self.pop, seed=3, vis_years=0)
+        plain.simulate(3)
+        plain.simulate(3)
+        BioSim(self.island_map, self.pop, seed=3, vis_years=0, cache=self.path).simulate(3)
+        cached = BioSim(self.island_map, self.pop, seed=3, vis_years=0, cache=self.path)
+        cached.simulate(3)
+        cached.simulate(3)
+        assert cached.num_animals_per_species == plain.num_animals_per_species
+
+    def test_parameters_change_key(self):
+        """
+        Test that a run with other parameters is not taken from the cache
+        """
+        BioSim(self.island_map, self.pop, seed=3, vis_years=0, cache=self.path).simulate(3)
+        sim = BioSim(self.island_map, self.pop, seed=3, vis_years=0, cache=self.path)
+        params = checkpoint.get_parameters()
+        sim.set_animal_parameters('Herbivore', {'zeta': 3.2})
+        try:
+            sim.simulate(3)
+        finally:
+            checkpoint.set_parameters(params)
+        assert len(os.listdir(self.path)) == 2
+
+    def test_ensemble_cache(self):
+        """
+        Test that the ensemble only simulates seeds that are not cached
+        """
+        first = ensemble.run(self.island_map, self.pop, None, [1, 2], 4, workers=1,
+                             cache=self.path)
+        second = ensemble.run(self.island_map, self.pop, None, [2, 1, 5], 4, workers=1,
+                              cache=self.path)
+        np.testing.assert_array_equal(second[0], first[1])
+        np.testing.assert_array_equal(second[1], first[0])
+        assert len(os.listdir(self.path)) == 3
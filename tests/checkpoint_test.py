@@ -0,0 +1,66 @@
+from biosim.simulation import BioSim
+from biosim.animals import Herbivore
+from biosim import checkpoint
+import numpy as np
+import pytest
+
+
+class TestCheckpoint:
+    """
+    Test that a simulation restored from a checkpoint continues exactly like the original
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'sim.npz')
+        self.params = checkpoint.get_parameters()
+        yield
+        checkpoint.set_parameters(self.params)
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_bit_identical(self, engine):
+        """
+        Test that the restored run gives exactly the same animals as the original
+        """
+        original = BioSim(self.island_map, self.pop, seed=2, vis_years=0, engine=engine)
+        original.simulate(5)
+        original.save_checkpoint(self.path)
+        original.simulate(5)
+
+        restored = BioSim.load_checkpoint(self.path)
+        assert restored.year == 5
+        restored.simulate(5)
+        assert restored.year == original.year
+        assert restored._engine.export_population() == original._engine.export_population()
+
+    def test_parameters_restored(self):
+        """
+        Test that parameters in effect when saving are set again when loading
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0)
+        sim.set_animal_parameters('Herbivore', {'zeta': 3.2})
+        sim.save_checkpoint(self.path)
+        sim.set_animal_parameters('Herbivore', {'zeta': 3.5})
+        BioSim.load_checkpoint(self.path)
+        assert Herbivore.params['zeta'] == 3.2
+
+    def test_binary_columns(self):
+        """
+        Test that the animals are stored as plain arrays, not pickled objects
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0)
+        sim.simulate(2)
+        sim.save_checkpoint(self.path)
+        with np.load(self.path, allow_pickle=False) as data:
+            assert data['Herbivore_weight'].dtype == np.float64
+            assert len(data['Carnivore_age']) == sim.num_animals_per_species['Carnivore']
+
+    def test_not_a_checkpoint(self):
+        """
+        Test that files of another format are rejected
+        """
+        with open(self.path, 'wb') as file:
+            np.savez(file, meta=np.array('{}'))
+        with pytest.raises(ValueError):
+            checkpoint.read(self.path)
@@ -0,0 +1,46 @@
+"""
+Island and animals shared by the test modules
+"""
+
+import pytest
+import textwrap3
+
+
+def _animals(species, number):
+    return [{'species': species, 'age': 5, 'weight': 20} for _ in range(number)]
+
+
+@pytest.fixture
+def island_map():
+    """
+    Small island with lowland, highland and desert
+    """
+    return textwrap3.dedent("""\
+                            WWWWW
+                            WLLHW
+                            WDLHW
+                            WWWWW""")
+
+
+@pytest.fixture
+def herbivores():
+    """
+    30 herbivores in cell (2, 2)
+    """
+    return [{'loc': (2, 2), 'pop': _animals('Herbivore', 30)}]
+
+
+@pytest.fixture
+def carnivores():
+    """
+    8 carnivores in cell (2, 2)
+    """
+    return [{'loc': (2, 2), 'pop': _animals('Carnivore', 8)}]
+
+
+@pytest.fixture
+def population():
+    """
+    30 herbivores and 8 carnivores in cell (2, 2)
+    """
+    return [{'loc': (2, 2), 'pop': _animals('Herbivore', 30) + _animals('Carnivore', 8)}]
@@ -0,0 +1,96 @@
+from biosim.simulation import BioSim
+from biosim.deltas import DeltaReader, DeltaWriter, _sorted_columns
+from biosim.engines import create_engine
+import numpy as np
+import pytest
+import os
+
+
+class TestDeltas:
+    """
+    Test that a delta stream gives back the state of every year
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'stream')
+
+    def expected_states(self, engine_name, years, path, **kwargs):
+        engine = create_engine(engine_name, self.island_map, seed=4)
+        engine.add_population(self.pop)
+        writer = DeltaWriter(path, self.island_map, **kwargs)
+        states = []
+        for year in range(years):
+            engine.update_one_year()
+            writer.write(year, engine.export_columns())
+            states.append(_sorted_columns(engine.export_columns(), 20))
+        return states
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    @pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+    def test_every_year_exact(self, engine, compression):
+        """
+        Test that every year is rebuilt bit for bit, in order and out of order
+        """
+        states = self.expected_states(engine, 12, self.path, base_every=5,
+                                      compression=compression)
+        reader = DeltaReader(self.path)
+        assert reader.years == list(range(12))
+        assert reader.base_years == [0, 5, 10]
+        for year in list(range(12)) + [7, 3, 11, 0]:
+            columns = reader.read(year)
+            for key, value in columns.items():
+                np.testing.assert_array_equal(value, states[year][key])
+
+    def test_resume_engine(self):
+        """
+        Test that a rebuilt year can be loaded into an engine
+        """
+        states = self.expected_states('reference', 6, self.path)
+        engine = create_engine('reference', self.island_map, seed=4)
+        engine.import_columns(DeltaReader(self.path).read(5))
+        assert engine.num_animals_per_species() == {
+            'Herbivore': len(states[5]['Herbivore_age']),
+            'Carnivore': len(states[5]['Carnivore_age'])}
+
+    def test_smaller_than_columns(self):
+        """
+        Test that the stream takes less space than the raw columns of every year
+        """
+        states = self.expected_states('reference', 8, self.path, base_every=4)
+        raw = sum(value.nbytes for state in states for value in state.values())
+        stored = sum(os.path.getsize(os.path.join(self.path, name))
+                     for name in os.listdir(self.path))
+        assert stored < raw
+
+    def test_years_in_order(self):
+        """
+        Test that years can only be appended
+        """
+        writer = DeltaWriter(self.path, self.island_map)
+        columns = create_engine('array', self.island_map, seed=1).export_columns()
+        writer.write(3, columns)
+        with pytest.raises(ValueError):
+            writer.write(3, columns)
+
+    def test_other_island(self):
+        """
+        Test that a stream of another island cannot be continued
+        """
+        DeltaWriter(self.path, self.island_map)
+        with pytest.raises(ValueError):
+            DeltaWriter(self.path, 'WWW\nWLW\nWWW')
+
+    def test_biosim_history(self):
+        """
+        Test that BioSim writes one record per simulated year, across simulate calls
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0)
+        sim.record_history(self.path, base_every=3)
+        sim.simulate(4)
+        sim.simulate(3)
+        reader = DeltaReader(self.path)
+        assert reader.years == list(range(7))
+        columns = reader.read(6)
+        assert len(columns['Herbivore_age']) == sim.num_animals_per_species['Herbivore']
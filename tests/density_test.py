@@ -0,0 +1,76 @@
+from biosim.simulation import BioSim
+from biosim.engines import create_engine
+from biosim.density import DensityRecorder, density_grids, read_density
+import numpy as np
+import pytest
+import os
+
+
+class TestDensity:
+    """
+    Test recording per-cell density grids
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'density')
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_grids(self, engine):
+        """
+        Test that the grids hold counts, mean weights and fodder of each cell
+        """
+        island = create_engine(engine, self.island_map, seed=1)
+        island.add_population(self.pop)
+        counts, weights, fodder = density_grids(island)
+        assert counts.shape == (4, 5, 2)
+        assert counts[1, 1, 0] == 30 and counts[1, 1, 1] == 8
+        assert counts.sum() == 38
+        assert weights[1, 1, 1] == 20
+        assert np.isnan(weights[0, 0, 0])
+        assert fodder.shape == (4, 5)
+
+    def test_stride_and_chunks(self):
+        """
+        Test that every stride-th year is recorded and chunks are joined on reading
+        """
+        sim = BioSim(self.island_map, self.pop, seed=1, vis_years=0)
+        sim.record_density(self.path, stride=2, weight=True, fodder=True, chunk_years=2)
+        sim.simulate(9)
+        data = read_density(self.path)
+        assert list(data['years']) == [0, 2, 4, 6, 8]
+        assert data['density'].shape == (5, 4, 5, 2)
+        assert data['weight'].shape == (5, 4, 5, 2)
+        assert data['fodder'].shape == (5, 4, 5)
+        assert data['density'][-1].sum(axis=(0, 1)).tolist() == list(
+            sim.num_animals_per_species.values())
+        assert len([name for name in os.listdir(self.path) if name.endswith('.npz')]) == 3
+
+    def test_optional_grids(self):
+        """
+        Test that weights and fodder are only stored when asked for
+        """
+        engine = create_engine('array', self.island_map, seed=1)
+        recorder = DensityRecorder(self.path, self.island_map)
+        recorder.record(0, engine)
+        recorder.flush()
+        assert set(read_density(self.path)) == {'years', 'density'}
+
+    def test_no_chunks(self):
+        """
+        Test that a recording without chunks reads as empty arrays of the recorded grids
+        """
+        DensityRecorder(self.path, self.island_map, weight=True)
+        data = read_density(self.path)
+        assert set(data) == {'years', 'density', 'weight'}
+        assert data['years'].shape == (0,)
+        assert data['density'].shape == (0, 4, 5, 2)
+        assert data['weight'].shape == (0, 4, 5, 2)
+
+    def test_invalid_stride(self):
+        """
+        Test that the stride must be positive
+        """
+        with pytest.raises(ValueError):
+            DensityRecorder(self.path, self.island_map, stride=0)
@@ -0,0 +1,80 @@
+from biosim.simulation import BioSim
+from biosim.engines import create_engine
+from biosim.digest import state_digest, first_divergence, read_digests, digest_file_name
+import numpy as np
+import pytest
+
+
+class TestDigest:
+    """
+    Test the per-year state digests
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.tmp_path = tmp_path
+
+    def test_order_independent(self):
+        """
+        Test that the digest does not depend on the order of the animals
+        """
+        engine = create_engine('reference', self.island_map, seed=1)
+        engine.add_population(self.pop)
+        engine.update_one_year()
+        columns = engine.export_columns()
+        order = np.random.default_rng(1).permutation(len(columns['Herbivore_cell']))
+        shuffled = dict(columns)
+        for key in ('Herbivore_cell', 'Herbivore_age', 'Herbivore_weight'):
+            shuffled[key] = columns[key][order]
+        assert state_digest(shuffled) == state_digest(columns)
+
+    def test_state_changes_digest(self):
+        """
+        Test that changing one weight beyond the rounding changes the digest
+        """
+        engine = create_engine('array', self.island_map, seed=1)
+        engine.add_population(self.pop)
+        columns = engine.export_columns()
+        changed = dict(columns, Herbivore_weight=columns['Herbivore_weight'].copy())
+        changed['Herbivore_weight'][0] += 1e-9
+        assert state_digest(changed) == state_digest(columns)
+        changed['Herbivore_weight'][0] += 1e-3
+        assert state_digest(changed) != state_digest(columns)
+
+    def test_first_divergence(self):
+        """
+        Test finding the first year two series differ
+        """
+        assert first_divergence(['a', 'b', 'c'], ['a', 'b', 'c']) is None
+        assert first_divergence(['a', 'b', 'c'], ['a', 'x', 'c']) == 1
+        assert first_divergence(['a', 'b'], ['a', 'b', 'c']) == 2
+
+    def test_biosim_series_and_file(self):
+        """
+        Test that BioSim records one digest per year and writes them next to the log
+        """
+        log_file = str(self.tmp_path / 'run.csv')
+        runs = []
+        for seed in (4, 4, 5):
+            sim = BioSim(self.island_map, self.pop, seed=seed, vis_years=0, log_file=log_file,
+                         digests=True)
+            sim.simulate(6)
+            assert read_digests(digest_file_name(log_file)) == sim.digests
+            runs.append(sim.digests)
+        assert len(runs[0]) == 6
+        assert first_divergence(runs[0], runs[1]) is None
+        assert first_divergence(runs[0], runs[2]) == 0
+
+    def test_digests_from_cache(self):
+        """
+        Test that a cached run gives the same digests as a simulated one
+        """
+        cache = str(self.tmp_path / 'cache')
+        series = []
+        for _ in range(2):
+            sim = BioSim(self.island_map, self.pop, seed=4, vis_years=0, cache=cache,
+                         digests=True)
+            sim.simulate(4)
+            series.append(sim.digests)
+        assert series[0] == series[1]
@@ -0,0 +1,143 @@
+from biosim.engines import (Engine, ReferenceEngine, create_engine, engine_names,
+                            register_engine)
+from biosim.simulation import BioSim
+from biosim import engines
+from biosim.island_map import Map
+import numpy as np
+import random as rd
+import pytest
+
+
+class TestEngines:
+    """
+    Test the engine registry and that all engines give the same interface
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_island(self, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+
+    def test_builtin_engines(self):
+        """
+        Test that the shipped engines are registered
+        """
+        assert {'reference', 'array', 'jit'} <= set(engine_names())
+
+    def test_unknown_engine(self):
+        """
+        Test that an unknown engine name raises an error
+        """
+        with pytest.raises(ValueError):
+            BioSim(self.island_map, self.pop, seed=1, vis_years=0, engine='quantum')
+
+    @pytest.mark.parametrize('name', ['reference', 'array', 'jit'])
+    def test_interface(self, name):
+        """
+        Test that every engine can be simulated and queried the same way
+        """
+        engine = create_engine(name, self.island_map, seed=1)
+        engine.add_population(self.pop)
+        assert engine.num_animals_per_species() == {'Herbivore': 30, 'Carnivore': 8}
+        assert engine.cell_counts('Carnivore')[(2, 2)] == 8
+        for _ in range(5):
+            engine.update_one_year()
+        counts = engine.num_animals_per_species()
+        assert sum(engine.cell_counts('Herbivore').values()) == counts['Herbivore']
+        grid = engine.count_grid('Herbivore')
+        assert grid.shape == (4, 5)
+        assert grid.sum() == counts['Herbivore']
+        for (row, col), count in engine.cell_counts('Herbivore').items():
+            assert grid[row - 1, col - 1] == count
+        herb, carn = engine.age_weight_fitness()
+        assert len(herb['fitness']) == counts['Herbivore']
+        assert len(carn['age']) == counts['Carnivore']
+
+    @pytest.mark.parametrize('name', ['reference', 'array'])
+    def test_export_population(self, name):
+        """
+        Test that exported animals can be added to a new engine
+        """
+        engine = create_engine(name, self.island_map, seed=1)
+        engine.add_population(self.pop)
+        for _ in range(3):
+            engine.update_one_year()
+        copy = create_engine(name, self.island_map, seed=1)
+        copy.add_population(engine.export_population())
+        assert copy.num_animals_per_species() == engine.num_animals_per_species()
+        assert copy.cell_counts('Herbivore') == engine.cell_counts('Herbivore')
+
+    def test_reference_same_as_map(self):
+        """
+        Test that BioSim with the reference engine follows Map exactly
+        """
+        sim = BioSim(self.island_map, self.pop, seed=5, vis_years=0)
+        sim.simulate(10)
+
+        rd.seed(5)
+        island = Map(self.island_map)
+        island.creating_map()
+        island.island_add_population(self.pop)
+        for _ in range(10):
+            island.island_update_one_year()
+        assert sim.num_animals_per_species == {'Herbivore': island.island_total_herbivores,
+                                               'Carnivore': island.island_total_carnivores}
+
+    @pytest.mark.parametrize('name', ['array', 'jit'])
+    def test_biosim_engine(self, name):
+        """
+        Test that BioSim runs with the array engines and is reproducible
+        """
+        results = []
+        for _ in range(2):
+            sim = BioSim(self.island_map, self.pop, seed=3, vis_years=0, engine=name)
+            sim.simulate(5)
+            results.append(sim.num_animals_per_species)
+        assert results[0] == results[1]
+
+    def test_register_engine(self, mocker):
+        """
+        Test that a new engine can be added without changing BioSim
+        """
+        mocker.patch.dict(engines._engines)
+        class CountingEngine(ReferenceEngine):
+            years = 0
+
+            def update_one_year(self):
+                CountingEngine.years += 1
+                super().update_one_year()
+
+        register_engine('counting', CountingEngine)
+        sim = BioSim(self.island_map, self.pop, seed=1, vis_years=0, engine='counting')
+        sim.simulate(3)
+        assert CountingEngine.years == 3
+        assert 'counting' in engine_names()
+
+    def test_interface_not_implemented(self):
+        """
+        Test that the base class does not pretend to simulate
+        """
+        with pytest.raises(NotImplementedError):
+            Engine(self.island_map).update_one_year()
+
+    @pytest.mark.parametrize('name', ['reference', 'array'])
+    def test_population_columns(self, name):
+        """
+        Test that every engine exports the same columns for the same animals
+        """
+        engine = create_engine(name, self.island_map, seed=1)
+        engine.add_population(self.pop)
+        columns = engine.population_columns('Carnivore')
+        assert len(columns['age']) == 8
+        assert list(columns['row']) == [2] * 8 and list(columns['col']) == [2] * 8
+        assert columns['fitness'] == pytest.approx([0.998] * 8, abs=1e-3)
+
+    def test_array_columns_are_views(self):
+        """
+        Test that the array engine exports its columns without copying
+        """
+        engine = create_engine('array', self.island_map, seed=1)
+        engine.add_population(self.pop)
+        columns = engine.population_columns('Herbivore')
+        assert np.shares_memory(columns['weight'], engine.island.population['Herbivore']['weight'])
+        with pytest.raises(ValueError):
+            columns['weight'][0] = 1
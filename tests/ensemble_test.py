@@ -0,0 +1,81 @@
+from biosim import ensemble
+from biosim.simulation import BioSim
+from biosim.animals import Herbivore
+import numpy as np
+import pytest
+import textwrap3
+
+
+class TestEnsemble:
+    """
+    Test that the ensemble runner gives the same results as single simulations
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_scenario(self):
+        island_map = """\
+           WWWW
+           WLHW
+           WWWW"""
+        self.island_map = textwrap3.dedent(island_map)
+        self.pop = [{'loc': (2, 2),
+                     'pop': [{'species': 'Herbivore',
+                              'age': 5,
+                              'weight': 20}
+                             for _ in range(20)] +
+                            [{'species': 'Carnivore',
+                              'age': 5,
+                              'weight': 20}
+                             for _ in range(5)]}]
+        self.seeds = [1, 2, 3]
+        self.years = 5
+
+    def serial_counts(self, seed, tmp_path):
+        """
+        Runs a single simulation and reads the counts from its log file
+        """
+        log_file = tmp_path / f'log_{seed}.csv'
+        sim = BioSim(self.island_map, self.pop, seed, vis_years=0, log_file=str(log_file))
+        sim.simulate(self.years)
+        rows = log_file.read_text().splitlines()[1:]
+        return np.array([[int(v) for v in row.split(',')[1:]] for row in rows])
+
+    def test_shape(self):
+        """
+        Test that the result has one row per seed and year
+        """
+        counts = ensemble.run(self.island_map, self.pop, None, self.seeds, self.years, workers=2)
+        assert counts.shape == (len(self.seeds), self.years, 2)
+
+    def test_same_as_biosim(self, tmp_path):
+        """
+        Test that each seed gives the same counts as a single BioSim run
+        """
+        counts = ensemble.run(self.island_map, self.pop, None, self.seeds, self.years, workers=2)
+        for index, seed in enumerate(self.seeds):
+            assert np.array_equal(counts[index], self.serial_counts(seed, tmp_path))
+
+    def test_warm_pool_reused(self):
+        """
+        Test that an ensemble can be run several times and gives reproducible results
+        """
+        with ensemble.Ensemble(self.island_map, self.pop, workers=2) as ens:
+            first = ens.run(self.seeds, self.years)
+            second = ens.run(self.seeds, self.years)
+        assert np.array_equal(first, second)
+
+    def test_params_only_in_workers(self):
+        """
+        Test that parameters are applied to the runs but not to the calling process
+        """
+        default = ensemble.run(self.island_map, self.pop, None, [1], self.years, workers=1)
+        changed = ensemble.run(self.island_map, self.pop, {'Herbivore': {'omega': 0}},
+                               [1], self.years, workers=1)
+        assert not np.array_equal(default, changed)
+        assert Herbivore.params['omega'] == 0.4
+
+    def test_invalid_map(self):
+        """
+        Test that the map is validated before any worker is started
+        """
+        with pytest.raises(ValueError):
+            ensemble.run('WWW\nWLL\nWWW', self.pop, None, self.seeds, self.years)
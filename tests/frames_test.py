@@ -0,0 +1,109 @@
+from biosim.frames import read_frames, rebin, render, _rebin_frames
+from biosim.simulation import BioSim
+from biosim.visualization import Visualization
+import matplotlib.pyplot as plt
+import numpy as np
+import io
+import os
+import pytest
+import textwrap3
+
+
+class TestFrames:
+    """
+    Test recording frame data and rendering it afterwards
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_recording(self, tmp_path):
+        island_map = textwrap3.dedent("""\
+                                      WWWW
+                                      WLHW
+                                      WWWW""")
+        ini_pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                            'weight': 20} for _ in range(20)]}]
+        self.tmp_path = tmp_path
+        self.path = str(tmp_path / 'frames')
+        plt.close('all')
+        self.sim = BioSim(island_map, ini_pop, seed=1, vis_years=1, img_years=2,
+                          hist_specs={'weight': {'max': 40, 'delta': 1}})
+        self.sim.record_frames(self.path, chunk_frames=3)
+        self.sim.simulate(10)
+
+    def images(self, directory):
+        return sorted(name for name in os.listdir(directory) if name.endswith('.png'))
+
+    def test_recorded(self):
+        """
+        Test that every image year is recorded with the totals of all years, without a figure
+        """
+        island_map, frames = read_frames(self.path)
+        assert island_map == self.sim.island_map
+        assert [frame['year'] for frame in frames] == [0, 2, 4, 6, 8]
+        assert [total[0] for frame in frames for total in frame['totals']] == list(range(9))
+        assert frames[-1]['counts']['Herbivore'].shape == (3, 4)
+        assert len(frames[0]['histograms']['Herbivore']['weight'][0]) == 39
+        assert plt.get_fignums() == []
+
+    def test_final_year(self, mocker):
+        """
+        Test that the population graph of rendered frames ends at the final year of the run
+        """
+        self.sim.simulate(5)
+        setup = mocker.spy(Visualization, 'setup')
+        render(self.path, str(self.tmp_path), 'sim', workers=1)
+        assert setup.call_args[0][2] == 15
+
+    def test_parallel_same_images(self):
+        """
+        Test that rendering on several processes gives the same images as on one
+        """
+        one, two = self.tmp_path / 'one', self.tmp_path / 'two'
+        one.mkdir()
+        two.mkdir()
+        assert render(self.path, str(one), 'sim', workers=1) == 5
+        assert render(self.path, str(two), 'sim', workers=2) == 5
+        assert self.images(one) == self.images(two) == [f'sim_{num:05d}.png' for num in range(5)]
+        for name in self.images(one):
+            assert (one / name).read_bytes() == (two / name).read_bytes()
+
+    def test_rebin(self):
+        """
+        Test that coarser bins add up the recorded ones and others are refused
+        """
+        counts = np.arange(10)
+        edges = np.arange(11)
+        np.testing.assert_array_equal(rebin(counts, edges, [0, 2, 4, 10]), [1, 5, 39])
+        with pytest.raises(ValueError):
+            rebin(counts, edges, [0, 2.5, 5])
+
+    def test_rebin_some_attributes(self):
+        """
+        Test that only the attributes given in hist_specs are rebinned
+        """
+        _, frames = read_frames(self.path)
+        rebinned = _rebin_frames(frames, {'age': {'max': 40, 'delta': 4}})
+        for frame, new_frame in zip(frames, rebinned):
+            age_counts, age_edges = new_frame['histograms']['Herbivore']['age']
+            np.testing.assert_array_equal(age_edges, np.arange(0, 40, 4))
+            np.testing.assert_array_equal(
+                age_counts, rebin(*frame['histograms']['Herbivore']['age'], age_edges))
+            for attribute in ('weight', 'fitness'):
+                counts, edges = new_frame['histograms']['Herbivore'][attribute]
+                recorded_counts, recorded_edges = frame['histograms']['Herbivore'][attribute]
+                np.testing.assert_array_equal(edges, recorded_edges)
+                np.testing.assert_array_equal(counts, recorded_counts)
+
+    def test_render_movie(self, mocker):
+        """
+        Test that one movie segment is streamed per run and the segments are joined
+        """
+        popen = mocker.patch('biosim.visualization.subprocess.Popen')
+        popen.return_value.stdin = io.BytesIO()
+        popen.return_value.wait.return_value = 0
+        join = mocker.patch('biosim.frames.subprocess.check_call')
+        render(self.path, str(self.tmp_path), 'sim', workers=1, movie=True,
+               hist_specs={'weight': {'max': 40, 'delta': 4}})
+        assert popen.call_count == 1
+        assert popen.call_args[0][0][-1] == os.path.join(str(self.tmp_path), 'sim_part000.mp4')
+        assert join.call_args[0][0][-1] == os.path.join(str(self.tmp_path), 'sim.mp4')
+        assert not os.path.exists(os.path.join(str(self.tmp_path), 'sim_parts.txt'))
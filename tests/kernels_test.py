@@ -0,0 +1,99 @@
+from biosim import kernels
+from biosim.vectorized import ArrayIsland, _fitness
+from biosim.animals import Herbivore, Carnivore
+import numpy as np
+import pytest
+import textwrap3
+
+
+class TestKernels:
+    """
+    Test that the loop kernels give the same results as the NumPy implementation
+    """
+    @pytest.fixture(autouse=True)
+    def create_animals(self):
+        rng = np.random.default_rng(12)
+        self.num = 200
+        self.age = rng.integers(0, 60, self.num)
+        self.weight = rng.uniform(0, 50, self.num)
+        self.rand = rng.random(self.num)
+        self.params = Herbivore.params
+        self.fitness_args = (self.params['phi_age'], self.params['a_half'],
+                             self.params['phi_weight'], self.params['w_half'])
+
+    def test_fitness(self):
+        """
+        Test that the scalar fitness matches the array fitness
+        """
+        expected = _fitness(self.age, self.weight, self.params)
+        result = [kernels.fitness(a, w, *self.fitness_args) for a, w in zip(self.age, self.weight)]
+        assert result == pytest.approx(expected)
+        assert kernels.fitness(5, 0.0, *self.fitness_args) == 0
+
+    def test_survivors(self):
+        """
+        Test that the death kernel kills the same animals as the death formula
+        """
+        alive = np.empty(self.num, dtype=np.bool_)
+        kernels.survivors(self.age, self.weight, self.rand, alive, self.params['omega'],
+                          *self.fitness_args)
+        fitness = _fitness(self.age, self.weight, self.params)
+        assert np.array_equal(alive, ~(self.rand < self.params['omega'] * (1 - fitness)))
+
+    def test_feed_herbivores(self):
+        """
+        Test that herbivores stop eating when the fodder is gone
+        """
+        weight = np.full(50, 10.0)
+        fodder = np.array([105.0])
+        kernels.feed_herbivores(np.arange(50), np.zeros(50, dtype=np.int64), weight, fodder,
+                                10.0, 0.9)
+        assert fodder[0] == 0
+        assert weight[:10] == pytest.approx(19.0)
+        assert weight[10] == pytest.approx(14.5)
+        assert weight[11:] == pytest.approx(10.0)
+
+    def test_hunt_eats_at_most_appetite(self):
+        """
+        Test that a carnivore certain to kill stops when its appetite is met
+        """
+        herb_fitness = np.zeros(10)
+        herb_weight = np.full(10, 20.0)
+        carn_weight = np.array([30.0])
+        params = dict(Carnivore.params, DeltaPhiMax=1e-9)
+        alive = kernels.hunt(herb_fitness, herb_weight, np.array([0]), np.array([10]),
+                             np.array([5]), carn_weight, np.array([0]), np.array([1]),
+                             np.zeros(10), np.array([0]), params)
+        assert alive.sum() == 7
+        assert carn_weight[0] == pytest.approx(30 + params['beta'] * params['F'])
+
+    def test_hunt_equal_fitness(self):
+        """
+        Test that a carnivore as fit as its prey kills it, as in Carnivore.carnivore_kill_prob
+        """
+        params = Carnivore.params
+        herb_fitness = np.array([kernels.fitness(5, 30.0, params['phi_age'], params['a_half'],
+                                                 params['phi_weight'], params['w_half'])])
+        alive = kernels.hunt(herb_fitness, np.array([20.0]), np.array([0]), np.array([1]),
+                             np.array([5]), np.array([30.0]), np.array([0]), np.array([1]),
+                             np.array([0.999]), np.array([0]), params)
+        assert not alive[0]
+
+    @pytest.mark.skipif(not kernels.HAVE_NUMBA, reason='Numba is not installed')
+    def test_island_same_with_and_without_jit(self):
+        """
+        Test that the compiled kernels and NumPy give the same simulation
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWWW
+                                      WLHW
+                                      WWWW""")
+        pop = [{'loc': (2, 2),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20} for _ in range(40)] +
+                       [{'species': 'Carnivore', 'age': 5, 'weight': 20} for _ in range(10)]}]
+        islands = [ArrayIsland(island_map, replicates=3, seed=4, jit=jit) for jit in (True, False)]
+        for island in islands:
+            island.add_population(pop)
+            for _ in range(10):
+                island.update_one_year()
+        assert np.array_equal(islands[0].counts(), islands[1].counts())
@@ -0,0 +1,132 @@
+from biosim.logwriter import LogWriter
+from biosim.simulation import BioSim
+import os
+import pytest
+import textwrap3
+
+
+class TestLogWriter:
+    """
+    Test the buffered log writer
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_path(self, tmp_path):
+        self.path = str(tmp_path / 'log.csv')
+
+    def read(self):
+        with open(self.path) as file:
+            return file.read().splitlines()
+
+    def test_buffered_until_flush(self):
+        """
+        Test that lines stay in memory until the buffer is flushed
+        """
+        log = LogWriter(self.path, 'a,b', flush_bytes=10**6, flush_seconds=10**6)
+        log.write('1,2')
+        assert self.read() == []
+        log.flush()
+        assert self.read() == ['a,b', '1,2']
+        log.close()
+
+    def test_flush_on_size(self):
+        """
+        Test that a full buffer is written without being asked
+        """
+        log = LogWriter(self.path, flush_bytes=8, flush_seconds=10**6)
+        log.write('1234')
+        assert self.read() == []
+        log.write('5678')
+        assert self.read() == ['1234', '5678']
+        log.close()
+
+    def test_flush_on_time(self, mocker):
+        """
+        Test that lines older than flush_seconds are written when the next line comes
+        """
+        clock = mocker.patch('biosim.logwriter.time.monotonic', return_value=0.0)
+        log = LogWriter(self.path, flush_bytes=10**6, flush_seconds=1.0)
+        log.write('first')
+        assert self.read() == []
+        clock.return_value = 2.0
+        log.write('second')
+        assert self.read() == ['first', 'second']
+        log.close()
+
+    def test_append_keeps_header_once(self):
+        """
+        Test that appending to an existing log does not repeat the header
+        """
+        LogWriter(self.path, 'head').close()
+        log = LogWriter(self.path, 'head', append=True)
+        log.write('line')
+        log.close()
+        assert self.read() == ['head', 'line']
+
+    def test_background_thread(self):
+        """
+        Test that the background thread writes all lines in order
+        """
+        log = LogWriter(self.path, 'head', background=True)
+        for number in range(100):
+            log.write(str(number))
+        log.flush()
+        assert self.read() == ['head'] + [str(number) for number in range(100)]
+        log.close()
+        assert log.closed
+        with pytest.raises(ValueError):
+            log.write('late')
+
+    @pytest.mark.parametrize('log_thread', [False, True])
+    def test_biosim_appends_across_simulate(self, log_thread):
+        """
+        Test that successive simulate calls continue the same log file
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWW
+                                      WLW
+                                      WWW""")
+        pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                       for _ in range(10)]}]
+        sim = BioSim(island_map, pop, seed=1, vis_years=0, log_file=self.path,
+                     log_thread=log_thread)
+        sim.simulate(3)
+        sim.simulate(2)
+        lines = self.read()
+        assert lines[0] == 'Year,Total_Herbivores,Total_Carnivores'
+        assert [line.split(',')[0] for line in lines[1:]] == ['0', '1', '2', '3', '4']
+        sim.close_log()
+
+    @pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc/self/fd')
+    def test_many_simulations_release_files(self, tmp_path):
+        """
+        Test that log files of simulations no longer used are closed
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWW
+                                      WLW
+                                      WWW""")
+        pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                       for _ in range(10)]}]
+        before = len(os.listdir('/proc/self/fd'))
+        for number in range(300):
+            log_file = str(tmp_path / f'log_{number}.csv')
+            BioSim(island_map, pop, seed=1, vis_years=0, log_file=log_file,
+                   digests=True).simulate(2)
+        assert len(os.listdir('/proc/self/fd')) < before + 10
+        with open(tmp_path / 'log_299.csv') as file:
+            assert file.read().splitlines()[-1].startswith('1,')
+
+    def test_biosim_context_manager(self):
+        """
+        Test that leaving a with block closes the log file
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWW
+                                      WLW
+                                      WWW""")
+        with BioSim(island_map, [], seed=1, vis_years=0, log_file=self.path) as sim:
+            sim.simulate(2)
+            log = sim._log
+            assert not log.closed
+        assert log.closed
+        assert len(self.read()) == 3
@@ -0,0 +1,68 @@
+from biosim.pyramid import CountPyramid
+from biosim.visualization import Visualization
+from matplotlib.figure import Figure
+import numpy as np
+import pytest
+
+
+class TestCountPyramid:
+    """
+    Test the multi-resolution count grids
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_grid(self):
+        rng = np.random.default_rng(3)
+        self.grid = rng.integers(0, 50, size=(37, 53))
+        self.pyramid = CountPyramid(self.grid)
+
+    def test_levels(self):
+        """
+        Test that every level keeps the total and halves the shape, down to one block
+        """
+        shapes = [level.shape for level in self.pyramid.levels]
+        assert shapes[:3] == [(37, 53), (19, 27), (10, 14)]
+        assert shapes[-1] == (1, 1)
+        assert all(level.sum() == self.grid.sum() for level in self.pyramid.levels)
+
+    def test_means(self):
+        """
+        Test that block means divide by the map cells a block covers, also at the edges
+        """
+        means = self.pyramid.means(1)
+        assert means[0, 0] == pytest.approx(self.grid[:2, :2].mean())
+        assert means[-1, -1] == self.grid[-1, -1]
+        assert means[-1, 0] == pytest.approx(self.grid[-1, :2].mean())
+
+    def test_level_for(self):
+        """
+        Test that the finest level fitting the pixels is chosen
+        """
+        assert self.pyramid.level_for(100, 100) == 0
+        assert self.pyramid.level_for(20, 27) == 1
+        assert self.pyramid.level_for(20, 26) == 2
+        assert self.pyramid.level_for(0, 0) == len(self.pyramid.levels) - 1
+
+    def test_count(self):
+        """
+        Test that regional counts equal the sums over the rectangles
+        """
+        rng = np.random.default_rng(4)
+        for _ in range(200):
+            top, bottom = sorted(rng.integers(1, 38, size=2))
+            left, right = sorted(rng.integers(1, 54, size=2))
+            expected = self.grid[top - 1:bottom, left - 1:right].sum()
+            assert self.pyramid.count((top, left), (bottom, right)) == expected
+        assert self.pyramid.count((1, 1), (37, 53)) == self.grid.sum()
+
+    def test_heat_map_resolution(self):
+        """
+        Test that heat maps with more cells than pixels are drawn at a coarser level
+        """
+        ax = Figure(figsize=(2, 2), dpi=100).add_subplot()
+        grid = np.ones((1000, 600))
+        shown = Visualization._shown_resolution(ax, grid)
+        box = ax.get_window_extent()
+        assert shown.shape[0] <= box.height and shown.shape[1] <= box.width
+        np.testing.assert_allclose(shown, 1)
+        small = np.ones((5, 5))
+        assert Visualization._shown_resolution(ax, small) is small
@@ -0,0 +1,106 @@
+from biosim.rendering import AsyncRenderer
+from biosim.simulation import BioSim
+import multiprocessing as mp
+import gc
+import os
+import pytest
+import textwrap3
+
+
+class TestAsyncRenderer:
+    """
+    Test rendering of saved images in a separate process
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path):
+        self.island_map = textwrap3.dedent("""\
+                                           WWWW
+                                           WLHW
+                                           WWWW""")
+        self.ini_pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                 'weight': 20} for _ in range(20)]}]
+        self.img_dir = str(tmp_path)
+
+    def images(self):
+        return sorted(name for name in os.listdir(self.img_dir) if name.endswith('.png'))
+
+    def simulation(self, renderer):
+        return BioSim(self.island_map, self.ini_pop, seed=1, vis_years=1, img_years=2,
+                      img_dir=self.img_dir, img_base='sim', renderer=renderer)
+
+    def test_block_saves_every_image(self):
+        """
+        Test that the blocking policy saves the same images as drawing in the simulation
+        """
+        sim = self.simulation('block')
+        sim.simulate(6)
+        sim.simulate(4)
+        assert self.images() == [f'sim_{num:05d}.png' for num in range(5)]
+        assert sim.visual._img_ctr == 5
+        sim.renderer.close()
+
+    def test_drop_numbers_without_gaps(self):
+        """
+        Test that dropped frames leave no gaps in the numbering and the last year is saved
+        """
+        renderer = AsyncRenderer('drop', max_frames=1)
+        sim = self.simulation(renderer)
+        sim.simulate(40)
+        saved = renderer.img_ctr
+        assert saved + renderer.dropped == 20
+        assert self.images() == [f'sim_{num:05d}.png' for num in range(saved)]
+        renderer.close()
+
+    def test_same_result_as_inline(self):
+        """
+        Test that rendering in another process does not change the simulation
+        """
+        inline = BioSim(self.island_map, self.ini_pop, seed=1, vis_years=0)
+        inline.simulate(10)
+        sim = self.simulation('drop')
+        sim.simulate(10)
+        assert sim.num_animals_per_species == inline.num_animals_per_species
+        sim.renderer.close()
+
+    def test_unknown_policy(self):
+        """
+        Test that an unknown back-pressure policy is refused
+        """
+        with pytest.raises(ValueError):
+            AsyncRenderer('wait')
+
+    def test_dead_process(self):
+        """
+        Test that the simulation is stopped if the rendering process has died
+        """
+        sim = self.simulation('block')
+        sim.simulate(2)
+        sim.renderer._process.kill()
+        sim.renderer._process.join()
+        with pytest.raises(RuntimeError):
+            sim.simulate(2)
+
+    def test_close_stops_process(self):
+        """
+        Test that leaving a with block stops the rendering process after saving all images
+        """
+        with self.simulation('block') as sim:
+            sim.simulate(4)
+            process = sim.renderer._process
+            assert process.is_alive()
+        assert not process.is_alive()
+        assert process.exitcode == 0
+        assert self.images() == [f'sim_{num:05d}.png' for num in range(2)]
+
+    def test_unused_renderer_stops_process(self):
+        """
+        Test that the rendering process stops when the simulation is garbage collected
+        """
+        sim = self.simulation('drop')
+        sim.simulate(2)
+        process = sim.renderer._process
+        del sim
+        gc.collect()
+        process.join(5)
+        assert not process.is_alive()
+        assert process not in mp.active_children()
@@ -0,0 +1,58 @@
+from biosim.series import PopulationSeries
+import numpy as np
+import pytest
+
+
+class TestPopulationSeries:
+    """
+    Test the bounded population series
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_counts(self):
+        rng = np.random.default_rng(5)
+        self.counts = rng.integers(0, 1000, size=(10000, 2))
+
+    def fill(self, series, years=None):
+        for year in range(len(self.counts)) if years is None else years:
+            series.add(year, *self.counts[year])
+        return series
+
+    def test_full_resolution(self):
+        """
+        Test that short series are kept year by year
+        """
+        series = self.fill(PopulationSeries(max_points=16), range(10))
+        years, counts = series.decimated()
+        assert years.tolist() == list(range(10))
+        np.testing.assert_array_equal(counts, self.counts[:10])
+
+    @pytest.mark.parametrize('max_points', [64, 101])
+    def test_bounded_envelope(self, max_points):
+        """
+        Test that long series stay within max_points buckets holding the true minima and maxima
+        """
+        series = self.fill(PopulationSeries(max_points=max_points))
+        assert len(series) <= max_points
+        width = series.bucket_years
+        years, counts = series.decimated()
+        assert len(years) == 2 * len(series)
+        for bucket in range(len(series)):
+            block = self.counts[bucket * width:(bucket + 1) * width]
+            np.testing.assert_array_equal(counts[2 * bucket], block.min(axis=0))
+            np.testing.assert_array_equal(counts[2 * bucket + 1], block.max(axis=0))
+        assert series.max == self.counts.max()
+
+    def test_sparse_years(self):
+        """
+        Test that years without counts are left out of the drawn points
+        """
+        series = self.fill(PopulationSeries(start_year=0), range(0, 50, 10))
+        years, _ = series.decimated()
+        assert years.tolist() == [0, 10, 20, 30, 40]
+
+    def test_year_before_start(self):
+        """
+        Test that years before the start of the series are refused
+        """
+        with pytest.raises(ValueError):
+            PopulationSeries(start_year=10).add(5, 1, 1)
@@ -1,7 +1,10 @@
 from biosim.simulation import BioSim
 from biosim.landscapes import Lowland, Highland
 from biosim.animals import Herbivore, Carnivore
+import biosim.visualization
+import numpy as np
 import pytest
+import os
 import textwrap3
 
 
@@ -99,3 +102,48 @@ class TestSimulation:
         highland = {'f_max': 300}
         self.biosim.set_landscape_parameters('L', lowland)
         self.biosim.set_landscape_parameters('H', highland)
+
+    def test_population_frame_arrays(self):
+        """
+        Test that the population can be exported as NumPy arrays
+        """
+        self.biosim.add_population(self.pop)
+        columns = self.biosim.population_frame('Herbivore', as_arrays=True)
+        assert set(columns) == {'age', 'weight', 'fitness', 'row', 'col'}
+        assert len(columns['age']) == 20
+        assert all(columns['row'] == 2) and all(columns['col'] == 2)
+        assert columns['fitness'].dtype == float
+
+    def test_population_frame_pandas(self, mocker):
+        """
+        Test that a DataFrame is built when pandas is installed
+        """
+        pandas = mocker.patch('biosim.simulation.pandas')
+        self.biosim.add_population(self.pop)
+        self.biosim.population_frame('Herbivore')
+        assert pandas.DataFrame.call_count == 1
+
+    def test_population_frame_species(self):
+        """
+        Test that only animal species can be exported
+        """
+        with pytest.raises(TypeError):
+            self.biosim.population_frame('Dragon')
+
+    def test_headless(self, mocker, tmp_path):
+        """
+        Test that headless mode uses no pyplot and only draws the image years
+        """
+        pause = mocker.patch('biosim.visualization.plt.pause')
+        figure = mocker.patch('biosim.visualization.plt.figure')
+        frames = mocker.spy(biosim.visualization, 'frame_data')
+        sim = BioSim(self.biosim.island_map, self.pop, self.seed, vis_years=1, img_years=3,
+                     img_dir=str(tmp_path), img_base='sim', headless=True)
+        sim.simulate(7)
+        pause.assert_not_called()
+        figure.assert_not_called()
+        assert frames.call_count == 3
+        assert sorted(os.listdir(tmp_path)) == [f'sim_{num:05d}.png' for num in range(3)]
+        years, counts = sim.visual._population.decimated()
+        assert years.tolist() == list(range(7))
+        assert not np.isnan(counts).any()
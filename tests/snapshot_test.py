@@ -0,0 +1,84 @@
+from biosim.simulation import BioSim
+from biosim.snapshot import Snapshot
+import numpy as np
+import pytest
+
+
+class TestSnapshot:
+    """
+    Test writing, reading and seeding from memory-mapped snapshots
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'snap')
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_columns(self, engine):
+        """
+        Test that the snapshot holds the animals of each cell
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0, engine=engine)
+        sim.simulate(4)
+        sim.save_snapshot(self.path)
+        snap = Snapshot(self.path)
+        assert snap.year == 4
+        assert isinstance(snap.column('Herbivore', 'weight'), np.memmap)
+        for species in ('Herbivore', 'Carnivore'):
+            assert snap.num_animals(species) == sim.num_animals_per_species[species]
+            counts = sim._engine.cell_counts(species)
+            for loc, count in counts.items():
+                assert snap.counts(species)[loc[0] - 1, loc[1] - 1] == count
+                assert len(snap.cell(species, loc)['age']) == count
+
+    def test_cell_outside_island(self):
+        """
+        Test that asking for a cell outside the map raises an error
+        """
+        BioSim(self.island_map, self.pop, seed=2, vis_years=0).save_snapshot(self.path)
+        with pytest.raises(ValueError):
+            Snapshot(self.path).cell('Herbivore', (5, 1))
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_seed_simulation(self, engine):
+        """
+        Test that a simulation seeded from a snapshot has the same animals
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0, engine=engine)
+        sim.simulate(4)
+        sim.save_snapshot(self.path)
+        seeded = BioSim(self.island_map, [], seed=2, vis_years=0, engine=engine)
+        seeded.add_snapshot(self.path)
+        assert seeded.num_animals_per_species == sim.num_animals_per_species
+        original = sorted((d['loc'], a['species'], a['age'], a['weight'])
+                          for d in sim._engine.export_population() for a in d['pop'])
+        copy = sorted((d['loc'], a['species'], a['age'], a['weight'])
+                      for d in seeded._engine.export_population() for a in d['pop'])
+        assert copy == original
+        seeded.simulate(3)
+        assert seeded.year == 3
+
+    def test_lazy_cells(self):
+        """
+        Test that the reference engine counts animals without creating them
+        """
+        sim = BioSim(self.island_map, self.pop, seed=2, vis_years=0)
+        sim.add_population(self.pop)
+        sim.save_snapshot(self.path)
+        seeded = BioSim(self.island_map, [], seed=2, vis_years=0)
+        seeded.add_snapshot(self.path)
+        cell = seeded._engine.map.map_dict[(2, 2)]
+        assert cell._pending is not None
+        assert cell.population_sum_herb == 30
+        assert len(cell.population_herb) == 30
+        assert cell._pending is None
+
+    def test_different_island(self):
+        """
+        Test that a snapshot cannot seed an island with another map
+        """
+        BioSim(self.island_map, self.pop, seed=2, vis_years=0).save_snapshot(self.path)
+        other = BioSim('WWW\nWLW\nWWW', [], seed=2, vis_years=0)
+        with pytest.raises(ValueError):
+            other.add_snapshot(self.path)
@@ -0,0 +1,114 @@
+from biosim.summaries import Histogram, Moments, QuantileSketch, Summary, summarize
+from biosim.engines import create_engine
+from biosim.visualization import frame_data
+import numpy as np
+import pytest
+import textwrap3
+
+
+class TestSummaries:
+    """
+    Test the mergeable summaries against direct NumPy computations
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_values(self):
+        rng = np.random.default_rng(7)
+        self.values = rng.gamma(4, 5, size=2000)
+        self.first, self.second = self.values[:700], self.values[700:]
+
+    def test_moments(self):
+        """
+        Test that mean and variance match, also after merging
+        """
+        moments = Moments().update(self.first).merge(Moments().update(self.second))
+        assert moments.count == 2000
+        assert moments.mean == pytest.approx(self.values.mean())
+        assert moments.variance == pytest.approx(self.values.var(ddof=1))
+
+    def test_histogram(self):
+        """
+        Test that histogram counts match np.histogram, also after merging
+        """
+        edges = np.arange(0, 60, 2)
+        merged = Histogram(edges).update(self.first).merge(Histogram(edges).update(self.second))
+        np.testing.assert_array_equal(merged.counts, np.histogram(self.values, edges)[0])
+        with pytest.raises(ValueError):
+            merged.merge(Histogram(np.arange(0, 60, 3)))
+
+    @pytest.mark.parametrize('q', [0.05, 0.25, 0.5, 0.75, 0.95])
+    def test_quantile_accuracy(self, q):
+        """
+        Test that quantiles are within the relative accuracy, also after merging
+        """
+        sketch = QuantileSketch(0.01).update(self.first)
+        sketch = sketch.merge(QuantileSketch(0.01).update(self.second))
+        exact = np.quantile(self.values, q, method='lower')
+        assert abs(sketch.quantile(q) - exact) <= 0.0101 * exact
+
+    def test_quantile_zero_and_empty(self):
+        """
+        Test that zeros are counted and an empty sketch gives NaN
+        """
+        assert np.isnan(QuantileSketch().quantile(0.5))
+        assert QuantileSketch().update([0, 0, 0, 5]).quantile(0.5) == 0
+
+    def test_summary_merge(self):
+        """
+        Test that a summary merges all its parts
+        """
+        merged = Summary([0, 10, 100]).update(self.first)
+        merged = merged.merge(Summary([0, 10, 100]).update(self.second))
+        assert merged.moments.count == merged.histogram.counts.sum() == merged.sketch.count
+
+    def test_engine_regions(self):
+        """
+        Test that summaries of two regions add up to the summary of the island
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWWW
+                                      WLHW
+                                      WWWW""")
+        engine = create_engine('array', island_map, seed=1)
+        engine.add_population([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                        'weight': 20}] * 10},
+                               {'loc': (2, 3), 'pop': [{'species': 'Herbivore', 'age': 9,
+                                                        'weight': 12}] * 5}])
+        whole = engine.summaries()['Herbivore']['age']
+        left = engine.summaries(region=[(2, 2)])['Herbivore']['age']
+        right = engine.summaries(region=[(2, 3)])['Herbivore']['age']
+        assert left.moments.count == 10 and right.moments.count == 5
+        merged = left.merge(right)
+        np.testing.assert_array_equal(merged.histogram.counts, whole.histogram.counts)
+        assert merged.moments.mean == pytest.approx(whole.moments.mean)
+
+    def test_summarize_defaults(self):
+        """
+        Test that missing histogram specifications fall back to the defaults
+        """
+        columns = {'age': [1, 2], 'weight': [3.0, 4.0], 'fitness': [0.1, 0.2]}
+        summaries = summarize(columns, {'age': {'max': 10, 'delta': 1}})
+        assert len(summaries['age'].histogram.edges) == 10
+        assert summaries['weight'].histogram.counts.sum() == 2
+
+    def test_engine_histograms(self, mocker):
+        """
+        Test that the histograms alone match those of the summaries and build no sketches
+        """
+        island_map = textwrap3.dedent("""\
+                                      WWWW
+                                      WLHW
+                                      WWWW""")
+        engine = create_engine('array', island_map, seed=1)
+        engine.add_population([{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                        'weight': 20}] * 10}])
+        summaries = engine.summaries()
+        sketch = mocker.spy(QuantileSketch, 'update')
+        histograms = engine.histograms()
+        frame = frame_data(0, engine, None)
+        assert sketch.call_count == 0
+        for species in ('Herbivore', 'Carnivore'):
+            for attribute, summary in summaries[species].items():
+                np.testing.assert_array_equal(histograms[species][attribute].counts,
+                                              summary.histogram.counts)
+                np.testing.assert_array_equal(frame['histograms'][species][attribute][0],
+                                              summary.histogram.counts)
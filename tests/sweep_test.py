@@ -0,0 +1,121 @@
+from biosim.sweep import Sweep, parameter_grid
+from biosim import ensemble
+from biosim.animals import Herbivore
+import numpy as np
+import pytest
+import textwrap3
+import os
+
+
+class TestSweep:
+    """
+    Test that parameter sweeps run every combination and can be resumed
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_sweep(self, tmp_path):
+        island_map = """\
+           WWW
+           WLW
+           WWW"""
+        self.island_map = textwrap3.dedent(island_map)
+        self.pop = [{'loc': (2, 2),
+                     'pop': [{'species': 'Herbivore',
+                              'age': 5,
+                              'weight': 20}
+                             for _ in range(20)]}]
+        self.grid = parameter_grid({'Herbivore.omega': [0.0, 0.4],
+                                    'L.f_max': [100, 800]})
+        self.store = str(tmp_path / 'sweep')
+        self.sweep = Sweep(self.island_map, self.pop, self.grid, seeds=[1, 2], years=4,
+                           store=self.store, workers=2)
+
+    def test_parameter_grid(self):
+        """
+        Test that the grid gives one nested dict per combination
+        """
+        assert len(self.grid) == 4
+        assert {'Herbivore': {'omega': 0.0}, 'L': {'f_max': 100}} in self.grid
+
+    def test_invalid_name(self):
+        """
+        Test that unknown species or landscapes are rejected
+        """
+        with pytest.raises(KeyError):
+            Sweep(self.island_map, self.pop, [{'W.f_max': 10}], [1], 4, self.store)
+
+    def test_results_shape(self):
+        """
+        Test that all runs are done and loaded into one array
+        """
+        assert self.sweep.run() == 8
+        params, counts = self.sweep.results()
+        assert params == self.grid
+        assert counts.shape == (4, 2, 4, 2)
+        assert (counts >= 0).all()
+
+    def test_same_as_ensemble(self):
+        """
+        Test that a sweep point gives the same counts as an ensemble with those parameters
+        """
+        self.sweep.run()
+        params, counts = self.sweep.results()
+        expected = ensemble.run(self.island_map, self.pop, params[0], [1, 2], 4, workers=1)
+        assert np.array_equal(counts[0], expected)
+
+    def test_resume(self):
+        """
+        Test that a sweep started again only runs what is missing
+        """
+        self.sweep.run()
+        _, first = self.sweep.results()
+        files = [f for f in os.listdir(self.store) if f.endswith('.npy')]
+        os.remove(os.path.join(self.store, files[0]))
+        assert len(self.sweep.pending()) == 1
+        assert self.sweep.run() == 1
+        assert self.sweep.run() == 0
+        _, second = self.sweep.results()
+        assert np.array_equal(first, second)
+
+    def test_parameters_restored(self):
+        """
+        Test that the calling process keeps its parameters
+        """
+        self.sweep.run()
+        assert Herbivore.params['omega'] == 0.4
+
+    def test_other_sweep_in_store(self):
+        """
+        Test that a store holding a different scenario is not reused
+        """
+        with pytest.raises(ValueError):
+            Sweep(self.island_map, self.pop, self.grid, [1], years=5, store=self.store)
+
+    def test_other_defaults_in_store(self):
+        """
+        Test that a store is not resumed after the default parameters have changed
+        """
+        self.sweep.run()
+        beta = Herbivore.params['beta']
+        Herbivore.params['beta'] = beta / 4
+        try:
+            with pytest.raises(ValueError):
+                Sweep(self.island_map, self.pop, self.grid, seeds=[1, 2], years=4,
+                      store=self.store)
+        finally:
+            Herbivore.params['beta'] = beta
+
+    def test_defaults_fixed_at_creation(self):
+        """
+        Test that runs use the defaults of when the sweep was created
+        """
+        beta = Herbivore.params['beta']
+        Herbivore.params['beta'] = beta / 4
+        try:
+            self.sweep.run()
+        finally:
+            Herbivore.params['beta'] = beta
+        _, counts = self.sweep.results()
+        expected = Sweep(self.island_map, self.pop, self.grid, seeds=[1, 2], years=4,
+                         store=self.store + '_fresh', workers=2)
+        expected.run()
+        assert np.array_equal(counts, expected.results()[1])
@@ -0,0 +1,124 @@
+from biosim.vectorized import ArrayIsland
+from biosim.animals import Herbivore
+import numpy as np
+import pytest
+import textwrap3
+
+
+class TestArrayIsland:
+    """
+    Test that the array based island follows the model and keeps replicates apart
+    """
+    @pytest.fixture(autouse=True)
+    def create_island(self):
+        island_map = """\
+        WWWWW
+        WLLHW
+        WLHHW
+        WDDDW
+        WWWWW"""
+        self.island_map = textwrap3.dedent(island_map)
+        self.herbs = [{'loc': (2, 2),
+                       'pop': [{'species': 'Herbivore',
+                                'age': 5,
+                                'weight': 20}
+                               for _ in range(30)]}]
+        self.carns = [{'loc': (2, 2),
+                       'pop': [{'species': 'Carnivore',
+                                'age': 5,
+                                'weight': 20}
+                               for _ in range(10)]}]
+
+    def test_add_population_all_replicates(self):
+        """
+        Test that animals are added to every replicate
+        """
+        island = ArrayIsland(self.island_map, replicates=4, seed=1)
+        island.add_population(self.herbs + self.carns)
+        assert np.array_equal(island.counts(), [[30, 10]] * 4)
+        assert island.cell_counts('Herbivore')[:, 1, 1].tolist() == [30] * 4
+
+    def test_add_population_one_replicate(self):
+        """
+        Test that animals can be added to a single replicate
+        """
+        island = ArrayIsland(self.island_map, replicates=3, seed=1)
+        island.add_population(self.carns, replicate=1)
+        assert island.counts()[:, 1].tolist() == [0, 10, 0]
+
+    def test_add_to_water(self):
+        """
+        Test that animals cannot be placed in water
+        """
+        island = ArrayIsland(self.island_map, seed=1)
+        with pytest.raises(TypeError):
+            island.add_population([{'loc': (1, 1), 'pop': self.herbs[0]['pop']}])
+
+    def test_invalid_map(self):
+        """
+        Test that the map is validated like in Map
+        """
+        with pytest.raises(ValueError):
+            ArrayIsland('WWW\nWLL\nWWW')
+
+    def test_feeding_limited_by_fodder(self):
+        """
+        Test that herbivores eat no more than the fodder in the cell
+        """
+        island = ArrayIsland('WWW\nWLW\nWWW', seed=1)
+        island.add_population([{'loc': (2, 2),
+                                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                                        for _ in range(100)]}])
+        island.feeding()
+        gained = island.population['Herbivore']['weight'] - 20
+        assert gained.sum() == pytest.approx(800 * Herbivore.params['beta'])
+        assert gained.max() == pytest.approx(Herbivore.params['F'] * Herbivore.params['beta'])
+        assert island.fodder[0, 4] == 0
+
+    def test_hunting_removes_herbivores(self):
+        """
+        Test that carnivores kill and gain weight when prey is weak
+        """
+        island = ArrayIsland('WWW\nWLW\nWWW', seed=1)
+        island.add_population([{'loc': (2, 2),
+                                'pop': [{'species': 'Herbivore', 'age': 100, 'weight': 1}
+                                        for _ in range(20)] +
+                                       [{'species': 'Carnivore', 'age': 5, 'weight': 30}]}])
+        island.feeding()
+        assert island.counts()[0, 0] < 20
+        assert island.population['Carnivore']['weight'][0] > 30
+
+    def test_migration_stays_on_land(self):
+        """
+        Test that animals never move into water
+        """
+        island = ArrayIsland(self.island_map, replicates=5, seed=2)
+        island.add_population(self.herbs + self.carns)
+        for _ in range(5):
+            island.migration()
+            island.aging()
+        land = np.array([ch != 'W' for ch in self.island_map.replace('\n', '')])
+        for pop in island.population.values():
+            assert land[pop['cell']].all()
+
+    def test_replicates_independent(self):
+        """
+        Test that a replicate gives the same result alone and in a batch
+        """
+        batch = ArrayIsland(self.island_map, seeds=[1, 2, 3])
+        single = ArrayIsland(self.island_map, seeds=[2])
+        for island in (batch, single):
+            island.add_population(self.herbs + self.carns)
+            for _ in range(10):
+                island.update_one_year()
+        assert np.array_equal(batch.counts()[1], single.counts()[0])
+
+    def test_replicates_differ(self):
+        """
+        Test that replicates use different random streams
+        """
+        island = ArrayIsland(self.island_map, replicates=10, seed=1)
+        island.add_population(self.herbs)
+        for _ in range(10):
+            island.update_one_year()
+        assert len(set(island.counts()[:, 0])) > 1
@@ -0,0 +1,144 @@
+from biosim.simulation import BioSim
+from matplotlib.image import imread
+import numpy as np
+import io
+import os
+import pytest
+import textwrap3
+
+
+class _Pipe(io.BytesIO):
+    """
+    Stand-in for the stdin pipe of ffmpeg that keeps what was written after closing
+    """
+    def close(self):
+        self.closed_data = self.getvalue()
+        super().close()
+
+
+class TestMovieStream:
+    """
+    Test streaming of raw frames into ffmpeg, which is replaced by a mock
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, mocker):
+        island_map = textwrap3.dedent("""\
+                                      WWWW
+                                      WLHW
+                                      WWWW""")
+        ini_pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                            'weight': 20} for _ in range(20)]}]
+        self.img_dir = str(tmp_path)
+        self.popen = mocker.patch('biosim.visualization.subprocess.Popen')
+        self.pipe = _Pipe()
+        self.popen.return_value.stdin = self.pipe
+        self.popen.return_value.wait.return_value = 0
+        self.sim = BioSim(island_map, ini_pop, seed=1, vis_years=1, img_years=2,
+                          img_dir=self.img_dir, img_base='sim', headless=True, movie_stream=True)
+
+    def test_frames_piped(self):
+        """
+        Test that every image is piped as raw RGBA pixels and no image files are written
+        """
+        self.sim.simulate(6)
+        self.sim.make_movie()
+        args = self.popen.call_args[0][0]
+        width, height = map(int, args[args.index('-s') + 1].split('x'))
+        assert args[args.index('-f') + 1] == 'rawvideo'
+        assert args[-1] == os.path.join(self.img_dir, 'sim.mp4')
+        assert len(self.pipe.closed_data) == 3 * width * height * 4
+        assert os.listdir(self.img_dir) == []
+
+    def test_one_process_across_simulate(self):
+        """
+        Test that ffmpeg is started once and the movie continued by later simulate calls
+        """
+        self.sim.simulate(4)
+        self.sim.simulate(4)
+        self.sim.make_movie()
+        assert self.popen.call_count == 1
+        assert self.sim.visual._img_ctr == 4
+
+    def test_ffmpeg_failure(self):
+        """
+        Test that a failing ffmpeg is reported when the movie is finished
+        """
+        self.popen.return_value.wait.return_value = 1
+        self.sim.simulate(2)
+        with pytest.raises(RuntimeError):
+            self.sim.make_movie()
+
+    def test_only_mp4(self):
+        """
+        Test that streamed movies can not be made as gif
+        """
+        with pytest.raises(ValueError):
+            self.sim.visual.make_movie('gif')
+
+
+class TestHistograms:
+    """
+    Test that the histogram panels keep their artists between frames
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_visualization(self):
+        self.island_map = 'WWW\nWLW\nWWW'
+        self.ini_pop = [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                 'weight': 20} for _ in range(20)]}]
+
+    def test_artists_kept(self, mocker):
+        """
+        Test that updates only change the data of the step artists made in setup
+        """
+        sim = BioSim(self.island_map, self.ini_pop, seed=1, vis_years=1, headless=True,
+                     hist_specs={'age': {'max': 20, 'delta': 1}})
+        sim.simulate(1)
+        steps = sim.visual._hist_steps['age']
+        cla = mocker.spy(type(sim.visual._age_ax), 'cla')
+        sim.simulate(3)
+        assert sim.visual._hist_steps['age'] is steps
+        assert len(sim.visual._age_ax.patches) == 2
+        cla.assert_not_called()
+        values, edges, _ = steps[0].get_data()
+        assert len(edges) == 20 and values.sum() == sim.num_animals_per_species['Herbivore']
+
+
+class TestBlit:
+    """
+    Test the blitting live window, on the Agg canvas used by the tests
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path):
+        self.img_dir = str(tmp_path)
+        self.sim = BioSim('WWWW\nWLHW\nWWWW',
+                          [{'loc': (2, 2), 'pop': [{'species': 'Herbivore', 'age': 5,
+                                                    'weight': 20} for _ in range(20)]}],
+                          seed=1, vis_years=1, img_years=5, img_dir=self.img_dir, img_base='sim',
+                          blit=True, ymax_animals=1000)
+
+    def test_few_full_draws(self, mocker):
+        """
+        Test that most years are shown without drawing the whole figure
+        """
+        self.sim.img_years = 100
+        self.sim.simulate(1)
+        draw = mocker.spy(type(self.sim.visual._fig.canvas), 'draw')
+        blit = mocker.spy(type(self.sim.visual._fig.canvas), 'blit')
+        self.sim.simulate(30)
+        assert blit.call_count == 30
+        assert draw.call_count < 10
+
+    def test_saved_images_complete(self):
+        """
+        Test that saved images hold the changing artists and these stay blitted afterwards
+        """
+        self.sim.simulate(6)
+        assert sorted(os.listdir(self.img_dir)) == ['sim_00000.png', 'sim_00001.png']
+        visual = self.sim.visual
+        assert all(artist.get_animated() for artist in visual._animated_artists())
+        visual.save_plots()
+        blitted = imread(os.path.join(self.img_dir, 'sim_00002.png'))
+        for artist in visual._animated_artists():
+            artist.set_animated(False)
+        visual._fig.savefig(os.path.join(self.img_dir, 'full.png'))
+        np.testing.assert_array_equal(blitted, imread(os.path.join(self.img_dir, 'full.png')))
@@ -0,0 +1,83 @@
+from biosim.simulation import BioSim
+from biosim.engines import create_engine
+from biosim.yearstats import StatsWriter, read_statistics, year_record
+import numpy as np
+import pytest
+
+
+class TestYearStats:
+    """
+    Test the columnar per-year statistics
+    """
+    @pytest.fixture(autouse=True)
+    def sett_up_simulation(self, tmp_path, island_map, population):
+        self.island_map = island_map
+        self.pop = population
+        self.path = str(tmp_path / 'stats.npy')
+
+    @pytest.mark.parametrize('engine', ['reference', 'array'])
+    def test_events_balance(self, engine):
+        """
+        Test that births, deaths and kills explain the change in numbers
+        """
+        sim = BioSim(self.island_map, self.pop, seed=1, vis_years=0, engine=engine)
+        sim.record_statistics(self.path)
+        sim.simulate(10)
+        stats = read_statistics(self.path)
+        assert len(stats) == 10
+        assert isinstance(stats, np.memmap)
+        for species in ('Herbivore', 'Carnivore'):
+            count = np.concatenate(([30 if species == 'Herbivore' else 8],
+                                    stats[f'{species}_count']))
+            change = (stats[f'{species}_births'] - stats[f'{species}_deaths'] -
+                      stats[f'{species}_kills'])
+            np.testing.assert_array_equal(np.diff(count), change)
+        assert stats['Herbivore_migrants'].sum() > 0
+        assert stats['Herbivore_kills'].sum() > 0
+        assert np.all(stats['Carnivore_kills'] == 0)
+        assert stats['Herbivore_count'][-1] == sim.num_animals_per_species['Herbivore']
+
+    def test_record_values(self):
+        """
+        Test that means and percentiles are taken over the animals
+        """
+        engine = create_engine('array', self.island_map, seed=1)
+        engine.add_population(self.pop)
+        record = year_record(3, engine)
+        assert record['year'][0] == 3
+        assert record['Herbivore_age_mean'][0] == 5
+        assert record['Carnivore_weight_p50'][0] == 20
+        empty = create_engine('array', self.island_map, seed=1)
+        assert np.isnan(year_record(0, empty)['Herbivore_weight_mean'][0])
+
+    def test_chunks(self):
+        """
+        Test that the file holds every complete chunk and the rest after flush
+        """
+        engine = create_engine('array', self.island_map, seed=1)
+        engine.add_population(self.pop)
+        writer = StatsWriter(self.path, chunk_years=4)
+        for year in range(6):
+            writer.write(year, engine)
+        assert len(read_statistics(self.path)) == 4
+        writer.flush()
+        assert list(read_statistics(self.path)['year']) == list(range(6))
+
+    def test_append(self):
+        """
+        Test that a file can be continued
+        """
+        sim = BioSim(self.island_map, self.pop, seed=1, vis_years=0)
+        sim.record_statistics(self.path)
+        sim.simulate(3)
+        sim.record_statistics(self.path, append=True)
+        sim.simulate(2)
+        assert list(read_statistics(self.path)['year']) == list(range(5))
+
+    def test_not_a_statistics_file(self):
+        """
+        Test that other files are not appended to
+        """
+        np.save(self.path, np.arange(3))
+        with pytest.raises(ValueError):
+            StatsWriter(self.path, append=True)